@@ -0,0 +1,247 @@
+# asc_generator.py
+#
+# Generate synthetic trial files to test and benchmark the pipeline without the real dataset
+# asc: EyeLink asc file (header, samples, fixation/saccade/blink events, SCR_RECORDER frames, actions, episodes,
+#      rewards, scores, validation messages and other lines that the parser ignores)
+# csv: the cleaned csv format of data_cleaning (frameid,episode_id,score,duration,unclipped_reward,action,pos)
+# -----------------------
+import sys
+import numpy as np
+import utils
+
+
+# the UTID of the frame ids (a real one has an underscore, the frame number is the third field of a frame id:
+# RZ_2394668_5, see data_visualizer.frameid_sort_key)
+DEFAULT_UTID = 'RZ_2394668'
+# the eye tracker screen (the gaze positions are in this range, see data_cleaning.GAZE_SCALE)
+SCREEN_WIDTH = 1280
+SCREEN_HEIGHT = 840
+# gaze model: fixations on a random target with a small noise, separated by saccades
+FIXATION_NOISE = 0.7
+# mean duration of a fixation (in samples)
+MEAN_FIXATION_DURATION = 250
+# the other lines of an asc file that the parser ignores
+NOISE_LINES = ('SFIX R   %d', 'SSACC R  %d', 'SBLINK R %d', 'INPUT\t%d\t0', 'MSG\t%d !V TRIAL_VAR block 1',
+               'MSG\t%d -8 DISPLAY ON', 'BUTTON\t%d\t1\t1')
+VALIDATION_LINE = ('MSG\t%d !CAL VALIDATION HV9 R RIGHT GOOD ERROR %.2f avg. %.2f max  OFFSET 0.26 deg. 6.3,-5.8 pix.'
+                   '\n')
+
+
+class SyntheticTrial:
+    """ The data of a synthetic trial
+
+        frame_starts: int64 array, the timestamp of the start of each frame (ms)
+        frame_durations: int64 array, the duration of each frame (ms)
+        episodes: int64 array, the episode that starts at each frame (-1 if no episode starts)
+        rewards, scores, actions: int64 arrays, the values of each frame
+        sample_offsets: int64 array of length n_frame+1, the samples of frame i are [sample_offsets[i], sample_offsets[i+1])
+        timestamps, x, y, pupil: the samples (x is nan for the missing samples), the positions have 1 decimal
+            like in the asc file
+        sample_rate: the sampling rate of the eye tracker (Hz) """
+
+    def __init__(self, frame_starts, frame_durations, episodes, rewards, scores, actions, sample_offsets, timestamps,
+                 x, y, pupil, sample_rate=1000):
+        self.frame_starts = frame_starts
+        self.frame_durations = frame_durations
+        self.episodes = episodes
+        self.rewards = rewards
+        self.scores = scores
+        self.actions = actions
+        self.sample_offsets = sample_offsets
+        self.timestamps = timestamps
+        self.x = x
+        self.y = y
+        self.pupil = pupil
+        self.sample_rate = sample_rate
+
+    def __len__(self):
+        return len(self.frame_durations)
+
+
+def make_gaze_path(n_sample, rng):
+    """ Fixations (exponential durations) on random targets with a small noise, the samples of a saccade move
+        from a target to the next one """
+    n_target = max(1, int(n_sample / MEAN_FIXATION_DURATION * 1.5) + 1)
+    fixation_lengths = rng.exponential(MEAN_FIXATION_DURATION, n_target).astype(np.int64) + 20
+    target_x = rng.uniform(0, SCREEN_WIDTH, n_target)
+    target_y = rng.uniform(0, SCREEN_HEIGHT, n_target)
+    target_index = np.repeat(np.arange(n_target), fixation_lengths)[:n_sample]
+    if len(target_index) < n_sample:
+        target_index = np.concatenate((target_index, np.full(n_sample - len(target_index), n_target - 1)))
+    x = target_x[target_index] + rng.normal(0, FIXATION_NOISE, n_sample)
+    y = target_y[target_index] + rng.normal(0, FIXATION_NOISE, n_sample)
+    # the first samples after a target change are in the saccade
+    starts = np.flatnonzero(np.diff(target_index)) + 1
+    for i in range(1, 20):
+        indices = starts[starts + i < n_sample] + i
+        ratio = i / 20.0
+        x[indices - i] = target_x[target_index[indices] - 1] * (1 - ratio) + target_x[target_index[indices]] * ratio
+        y[indices - i] = target_y[target_index[indices] - 1] * (1 - ratio) + target_y[target_index[indices]] * ratio
+    return x, y
+
+
+def make_synthetic_trial(n_frame=10000, sample_rate=1000, frame_duration=50, n_episode=3, reward_ratio=0.1,
+                         missing_ratio=0.02, seed=0):
+    """ Generate the data of a trial: n_frame frames of about frame_duration ms (with a random jitter), gaze samples
+        at sample_rate Hz, n_episode episodes of the same length, a reward on reward_ratio of the frames and
+        missing_ratio of the samples lost (blinks) """
+    rng = np.random.RandomState(seed)
+    frame_durations = frame_duration + rng.randint(-frame_duration // 5, frame_duration // 5 + 1, n_frame)
+    frame_durations = np.maximum(frame_durations, 1).astype(np.int64)
+
+    episodes = np.full(n_frame, -1, dtype=np.int64)
+    episode_starts = np.arange(n_episode) * n_frame // max(n_episode, 1)
+    episodes[episode_starts] = np.arange(n_episode)
+    rewards = np.where(rng.uniform(size=n_frame) < reward_ratio, rng.choice([1, 10, 50, 100], n_frame), 0)
+    # the score is the cumulative reward of the episode
+    cumulative_rewards = np.cumsum(rewards)
+    episode_ids = np.maximum(np.cumsum(episodes >= 0) - 1, 0)
+    episode_bases = np.concatenate(([0], cumulative_rewards))[episode_starts]
+    scores = cumulative_rewards - episode_bases[episode_ids] if n_episode > 0 else cumulative_rewards
+    actions = rng.randint(0, 18, n_frame).astype(np.int64)
+
+    # samples at sample_rate in each frame, from its start
+    sample_interval = 1000.0 / sample_rate
+    n_samples = (frame_durations / sample_interval).astype(np.int64)
+    sample_offsets = np.zeros(n_frame + 1, dtype=np.int64)
+    np.cumsum(n_samples, out=sample_offsets[1:])
+    n_sample = int(sample_offsets[-1])
+    frame_starts = np.concatenate(([0], np.cumsum(frame_durations)[:-1])) + 1000000
+    sample_frames = np.repeat(np.arange(n_frame), n_samples)
+    sample_ranks = np.arange(n_sample) - sample_offsets[sample_frames]
+    timestamps = frame_starts[sample_frames] + (sample_ranks * sample_interval).astype(np.int64)
+    x, y = make_gaze_path(n_sample, rng)
+    x, y = np.round(x, 1), np.round(y, 1)
+    pupil = np.round(rng.normal(1000, 50, n_sample), 1)
+    is_missing = rng.uniform(size=n_sample) < missing_ratio
+    x[is_missing] = np.nan
+    y[is_missing] = np.nan
+    pupil[is_missing] = 0.0
+    return SyntheticTrial(frame_starts, frame_durations, episodes, rewards.astype(np.int64), scores.astype(np.int64),
+                          actions, sample_offsets, timestamps, x, y, pupil, sample_rate)
+
+
+def format_sample_lines(timestamps, x, y, pupil):
+    lines = []
+    for timestamp, x_value, y_value, pupil_value in zip(timestamps.tolist(), x.tolist(), y.tolist(), pupil.tolist()):
+        if x_value != x_value:
+            lines.append('%d\t   .\t   .\t    0.0\t...\n' % timestamp)
+        else:
+            lines.append('%d\t%7.1f\t%7.1f\t%7.1f\t...\n' % (timestamp, x_value, y_value, pupil_value))
+    return lines
+
+
+def write_asc_file(trial, fname, utid=DEFAULT_UTID, n_validation=2, noise_ratio=0.01, seed=0):
+    """ Write a SyntheticTrial to an EyeLink asc file. n_validation validation messages are spread over the trial,
+        the last one after the last frame (the parser keeps it), noise_ratio is the ratio of lines that the parser
+        ignores (added among the samples) """
+    rng = np.random.RandomState(seed + 1)
+    n_frame = len(trial)
+    validation_frames = set(np.linspace(0, n_frame, max(n_validation - 1, 0), endpoint=False).astype(np.int64).tolist())
+    start_time = int(trial.frame_starts[0]) if n_frame > 0 else 1000000
+    with open(fname, 'w', 1 << 20) as f:
+        f.write('** CONVERTED FROM synthetic.edf using edfapi 3.1\n** DATE: Mon Jun  1 10:00:00 2020\n'
+                '** TYPE: EDF_FILE BINARY EVENT SAMPLE TAGGED\n** VERSION: EYELINK II 1\n**\n\n')
+        f.write('MSG\t%d DISPLAY_COORDS 0 0 %d %d\n' % (start_time - 1000, SCREEN_WIDTH - 1, SCREEN_HEIGHT - 1))
+        f.write('MSG\t%d !MODE RECORD CD %d 2 1 R\n' % (start_time - 1000, trial.sample_rate))
+        f.write('START\t%d \tRIGHT\tSAMPLES\tEVENTS\nPRESCALER\t1\nVPRESCALER\t1\nPUPIL\tAREA\n'
+                'EVENTS\tGAZE\tRIGHT\tRATE\t%.2f\tTRACKING\tCR\tFILTER\t2\n'
+                'SAMPLES\tGAZE\tRIGHT\tRATE\t%.2f\tTRACKING\tCR\tFILTER\t2\n' % (start_time - 1, trial.sample_rate,
+                                                                              trial.sample_rate))
+        # samples before the first frame
+        for timestamp in range(start_time - 5, start_time):
+            f.write('%d\t  640.0\t  420.0\t 1000.0\t...\n' % timestamp)
+
+        offsets = trial.sample_offsets.tolist()
+        frame_starts = trial.frame_starts.tolist()
+        noise_counts = rng.poisson(noise_ratio * np.diff(trial.sample_offsets))
+        for i in range(n_frame):
+            frame_start = frame_starts[i]
+            lines = []
+            if i in validation_frames:
+                lines.append(VALIDATION_LINE % (frame_start, rng.uniform(0.2, 0.8), rng.uniform(0.8, 1.5)))
+            lines.append('MSG\t%d SCR_RECORDER FRAMEID %d UTID %s\n' % (frame_start, i + 1, utid))
+            if trial.episodes[i] >= 0:
+                lines.append('MSG\t%d episode %d\n' % (frame_start, trial.episodes[i]))
+            lines.append('MSG\t%d key_pressed atari_action %d\n' % (frame_start, trial.actions[i]))
+            lines.append('MSG\t%d reward %d\n' % (frame_start, trial.rewards[i]))
+            lines.append('MSG\t%d score %d\n' % (frame_start, trial.scores[i]))
+            lines.extend(format_sample_lines(trial.timestamps[offsets[i]:offsets[i + 1]],
+                                             trial.x[offsets[i]:offsets[i + 1]], trial.y[offsets[i]:offsets[i + 1]],
+                                             trial.pupil[offsets[i]:offsets[i + 1]]))
+            for _ in range(noise_counts[i]):
+                lines.insert(rng.randint(1, len(lines) + 1), NOISE_LINES[rng.randint(len(NOISE_LINES))] % frame_start
+                             + '\n')
+            f.write(''.join(lines))
+
+        # the eye tracker keeps recording after the game has ended
+        end_time = int(trial.frame_starts[-1] + trial.frame_durations[-1]) if n_frame > 0 else start_time
+        if n_validation > 0:
+            f.write(VALIDATION_LINE % (end_time, rng.uniform(0.2, 0.8), rng.uniform(0.8, 1.5)))
+        for timestamp in range(end_time, end_time + 100):
+            f.write('%d\t  640.0\t  420.0\t 1000.0\t...\n' % timestamp)
+        f.write('END\t%d \tSAMPLES\tEVENTS\tRES\t  38.00\t  37.00\n' % (end_time + 100))
+
+
+def write_csv_file(trial, fname, utid=DEFAULT_UTID, is_include_title=True):
+    """ Write a SyntheticTrial to a csv file, the same as data_cleaning converting the asc file of the trial:
+        the gazes are scaled to the game frame, the missing samples are not included, and the gazes and the
+        duration of the last frame are null (the game has ended) """
+    gaze_scale = (8.0, 4.0)
+    offsets = trial.sample_offsets.tolist()
+    x = (trial.x / gaze_scale[0]).tolist()
+    y = (trial.y / gaze_scale[1]).tolist()
+    with open(fname, 'w', 1 << 20) as f:
+        if is_include_title:
+            f.write('frame_id,episode_id,score,duration(ms),unclipped_reward,action,gaze_positions\n')
+        lines = []
+        n_frame = len(trial)
+        for i in range(n_frame):
+            is_last_frame = i == n_frame - 1
+            gazes = [] if is_last_frame else \
+                [format(x[j], '.2f') + ',' + format(y[j], '.2f') for j in range(offsets[i], offsets[i + 1]) if x[j] == x[j]]
+            episode = str(trial.episodes[i]) if trial.episodes[i] >= 0 else 'null'
+            duration = 'null' if is_last_frame else str(trial.frame_durations[i])
+            lines.append('%s_%d,%s,%d,%s,%d,%d,%s\n' % (utid, i + 1, episode, trial.scores[i], duration,
+                                                      trial.rewards[i], trial.actions[i],
+                                                      ','.join(gazes) if len(gazes) > 0 else 'null'))
+            if len(lines) >= 4096:
+                f.write(''.join(lines))
+                lines = []
+        f.write(''.join(lines))
+
+
+def generate_asc_file(fname, n_frame=10000, sample_rate=1000, frame_duration=50, n_episode=3, reward_ratio=0.1,
+                      n_validation=2, noise_ratio=0.01, missing_ratio=0.02, seed=0):
+    """ Generate a synthetic asc file (see make_synthetic_trial and write_asc_file) """
+    trial = make_synthetic_trial(n_frame, sample_rate, frame_duration, n_episode, reward_ratio, missing_ratio, seed)
+    write_asc_file(trial, fname, n_validation=n_validation, noise_ratio=noise_ratio, seed=seed)
+
+
+def generate_csv_file(fname, n_frame=10000, sample_rate=1000, frame_duration=50, n_episode=3, reward_ratio=0.1,
+                      missing_ratio=0.02, seed=0):
+    """ Generate a synthetic csv file (see make_synthetic_trial and write_csv_file) """
+    trial = make_synthetic_trial(n_frame, sample_rate, frame_duration, n_episode, reward_ratio, missing_ratio, seed)
+    write_csv_file(trial, fname)
+
+
+if __name__ == '__main__':
+    n_frame = utils.pop_int_option(sys.argv, '--frames', 10000)
+    sample_rate = utils.pop_int_option(sys.argv, '--sample-rate', 1000)
+    frame_duration = utils.pop_int_option(sys.argv, '--frame-duration', 50)
+    n_episode = utils.pop_int_option(sys.argv, '--episodes', 3)
+    reward_ratio = utils.pop_float_option(sys.argv, '--reward-ratio', 0.1)
+    n_validation = utils.pop_int_option(sys.argv, '--validations', 2)
+    noise_ratio = utils.pop_float_option(sys.argv, '--noise-ratio', 0.01)
+    seed = utils.pop_int_option(sys.argv, '--seed', 0)
+    if len(sys.argv) < 2 or not (sys.argv[1].endswith('.asc') or sys.argv[1].endswith('.txt')
+                                 or sys.argv[1].endswith('.csv')):
+        print('Usage: python asc_generator.py output_fname(.asc|.txt|.csv) [--frames N] [--sample-rate HZ] '
+              '[--frame-duration MS] [--episodes N] [--reward-ratio R] [--validations N] [--noise-ratio R] [--seed N]')
+        exit(1)
+
+    if sys.argv[1].endswith('.asc'):
+        generate_asc_file(sys.argv[1], n_frame, sample_rate, frame_duration, n_episode, reward_ratio, n_validation,
+                          noise_ratio, seed=seed)
+    else:
+        generate_csv_file(sys.argv[1], n_frame, sample_rate, frame_duration, n_episode, reward_ratio, seed=seed)
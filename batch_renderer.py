@@ -0,0 +1,195 @@
+# batch_renderer.py
+#
+# Render the frames of the trials with their gaze overlay without a display (same drawing as data_visualizer)
+# Each trial is saved as a sequence of png files or as a raw RGB video stream
+# The trials (and chunks of frames of each trial) are rendered in a process pool
+# -----------------------
+import os
+import sys
+import json
+# no window is opened, use the dummy video driver if pygame needs one
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+import pygame
+import data_reader
+import data_visualizer
+import frame_archive
+import utils
+
+
+OUTPUT_FORMATS = ('png', 'raw')
+# number of frames rendered by a task
+DEFAULT_CHUNK_FRAMES = 500
+ARCHIVE_EXTENSIONS = ('.tar.bz2', '.tar.gz', '.tar.xz', '.tar')
+# the data file of a trial, in the order of preference
+DATA_EXTENSIONS = ('.npz', '.txt', '.csv')
+
+
+def get_trial_name(archive_fname):
+    for extension in ARCHIVE_EXTENSIONS:
+        if archive_fname.endswith(extension):
+            return os.path.basename(archive_fname)[:-len(extension)]
+    return None
+
+
+def find_trials(tar_dir, csv_dir):
+    """ Return (trial_name, archive_fpath, data_fpath) of the archives in tar_dir that have a data file in csv_dir,
+        in the order of the trial names """
+    trials = []
+    for fname in sorted(os.listdir(tar_dir)):
+        trial_name = get_trial_name(fname)
+        if trial_name is None:
+            continue
+        data_fpaths = [os.path.join(csv_dir, trial_name + extension) for extension in DATA_EXTENSIONS]
+        data_fpaths = [data_fpath for data_fpath in data_fpaths if os.path.exists(data_fpath)]
+        if len(data_fpaths) == 0:
+            print('Warning: no txt/csv/npz file for the frames in %s, skipping it.' % fname)
+            continue
+        trials.append((trial_name, os.path.join(tar_dir, fname), data_fpaths[0]))
+    return trials
+
+
+def get_sorted_frameids(trial):
+    return sorted(trial.frameid_list, key=data_visualizer.frameid_sort_key)
+
+
+def get_raw_part_fname(output_dir, trial_name, start):
+    return os.path.join(output_dir, '%s.rgb.part%d' % (trial_name, start))
+
+
+def surface_to_bytes(surface):
+    # pygame.image.tobytes is not available before pygame 2.1.3
+    to_bytes = getattr(pygame.image, 'tobytes', None) or pygame.image.tostring
+    return to_bytes(surface, 'RGB')
+
+
+def get_chunk_data_range(trial, chunk_frameids, line_offsets):
+    """ The part of the data file that has the frames of a chunk: the range of their indices in the file for an npz
+        file, the byte range of their lines (line_offsets: see data_reader.read_frame_index) for a csv file """
+    indices = [trial.frame_index(frameid) for frameid in chunk_frameids]
+    file_start, file_stop = min(indices), max(indices) + 1
+    if line_offsets is None:
+        return file_start, file_stop
+    return int(line_offsets[file_start]), int(line_offsets[file_stop])
+
+
+def read_chunk_trial(data_fpath, data_range):
+    """ Read only the frames of a chunk (see get_chunk_data_range) """
+    if data_fpath.endswith('.npz'):
+        return data_reader.read_frames(data_fpath, data_range[0], data_range[1])
+    return data_reader.read_frames_at(data_fpath, data_range[0], data_range[1])
+
+
+def render_chunk(task):
+    """ Render the frames start..start+len(frameids)-1 of a trial (in the order of the frame ids, run in a worker
+        process when n_workers > 1). Only the part of the data file with these frames is read (see
+        get_chunk_data_range). Returns the number of frames without a png file (drawn in black) """
+    trial_name, archive_fpath, data_fpath, data_range, start, frameids, output_dir, output_format = task
+    print('Rendering frames %d-%d of trial %s' % (start, start + len(frameids) - 1, trial_name))
+    trial = read_chunk_trial(data_fpath, data_range)
+    archive = frame_archive.open_frame_archive(archive_fpath, is_seekable_cache=True, cache_dir=output_dir)
+    based_dir = archive.get_names()[0].split('/')[0]
+
+    dw = data_visualizer.DrawgcWrapper()
+    screen = pygame.Surface(data_visualizer.SCREEN_SIZE)
+    raw_file = None
+    if output_format == 'raw':
+        raw_file = open(get_raw_part_fname(output_dir, trial_name, start), 'wb')
+
+    n_missing = 0
+    try:
+        for index, frameid in enumerate(frameids, start):
+            frame, _ = data_visualizer.load_scaled_frame(archive, based_dir + '/' + frameid + '.png',
+                                                         data_visualizer.SCREEN_SIZE)
+            if frame is None:
+                screen.fill((0, 0, 0))
+                n_missing += 1
+            else:
+                screen.blit(frame, (0, 0))
+                data_visualizer.draw_frame_gazes(screen, trial.get_gaze(trial.frame_index(frameid)), dw)
+
+            if raw_file is not None:
+                raw_file.write(surface_to_bytes(screen))
+            else:
+                pygame.image.save(screen, os.path.join(output_dir, trial_name, '%06d_%s.png' % (index, frameid)))
+    finally:
+        if raw_file is not None:
+            raw_file.close()
+        archive.close()
+    return n_missing
+
+
+def save_raw_video_info(output_dir, trial_name, trial, frameid_list):
+    """ Save the format of the raw video and the duration of each frame (to convert it, e.g. with ffmpeg) """
+    info = {'width': data_visualizer.SCREEN_SIZE[0], 'height': data_visualizer.SCREEN_SIZE[1],
+            'pixel_format': 'rgb24', 'n_frame': len(frameid_list), 'frame_ids': frameid_list,
+            'durations_ms': [trial.get_value('duration', trial.frame_index(frameid)) for frameid in frameid_list]}
+    with open(os.path.join(output_dir, trial_name + '.json'), 'w') as f:
+        json.dump(info, f, indent=1)
+
+
+def merge_raw_parts(output_dir, trial_name, chunk_starts):
+    """ Concatenate the raw video parts of the chunks in the order of the frames """
+    with open(os.path.join(output_dir, trial_name + '.rgb'), 'wb') as raw_file:
+        for start in chunk_starts:
+            part_fname = get_raw_part_fname(output_dir, trial_name, start)
+            with open(part_fname, 'rb') as part_file:
+                block = part_file.read(1 << 24)
+                while block:
+                    raw_file.write(block)
+                    block = part_file.read(1 << 24)
+            os.remove(part_fname)
+
+
+def render_trials(tar_dir, csv_dir, output_dir, output_format='png', n_workers=1, chunk_frames=DEFAULT_CHUNK_FRAMES):
+    """ Render all the trials in tar_dir (frames) and csv_dir (gazes) to output_dir.
+        png: output_dir/trial_name/index_frameid.png for each frame
+        raw: output_dir/trial_name.rgb (the frames in rgb24, one after another) and output_dir/trial_name.json
+        A compressed archive is converted once to its seekable copy in output_dir (see
+        frame_archive.open_frame_archive), so that the chunks of a trial can be read independently.
+        Each trial is read once here to order its frames, and each chunk reads only its frames (with the frame index of
+        a csv file, see data_reader.read_frame_index, or from the memory mapped npz file) """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('Unknown output format %s (use one of %s)' % (output_format, ', '.join(OUTPUT_FORMATS)))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    tasks = []
+    trial_chunks = []
+    for trial_name, archive_fpath, data_fpath in find_trials(tar_dir, csv_dir):
+        frame_archive.open_frame_archive(archive_fpath, is_seekable_cache=True, cache_dir=output_dir).close()
+        trial = data_reader.read_gaze_trial_file(data_fpath)
+        frameid_list = get_sorted_frameids(trial)
+        # the index is read (or built if the file has no index) once for all the chunks
+        line_offsets = None if data_fpath.endswith('.npz') else data_reader.read_frame_index(data_fpath)['line_offsets']
+        if output_format == 'png':
+            if not os.path.exists(os.path.join(output_dir, trial_name)):
+                os.makedirs(os.path.join(output_dir, trial_name))
+        else:
+            save_raw_video_info(output_dir, trial_name, trial, frameid_list)
+
+        chunk_starts = list(range(0, len(frameid_list), chunk_frames))
+        trial_chunks.append((trial_name, chunk_starts))
+        for start in chunk_starts:
+            chunk_frameids = frameid_list[start:start + chunk_frames]
+            tasks.append((trial_name, archive_fpath, data_fpath,
+                          get_chunk_data_range(trial, chunk_frameids, line_offsets), start, chunk_frameids,
+                          output_dir, output_format))
+
+    n_missing = sum(utils.map_in_processes(render_chunk, tasks, n_workers))
+
+    if output_format == 'raw':
+        for trial_name, chunk_starts in trial_chunks:
+            merge_raw_parts(output_dir, trial_name, chunk_starts)
+    print('Rendered %d trials (%d frames without png file).' % (len(trial_chunks), n_missing))
+
+
+if __name__ == '__main__':
+    n_workers = utils.pop_int_option(sys.argv, '--workers', 1)
+    chunk_frames = utils.pop_int_option(sys.argv, '--chunk-frames', DEFAULT_CHUNK_FRAMES)
+    output_format = utils.pop_option(sys.argv, '--format', 'png', str, 'png or raw')
+    if len(sys.argv) < 4 or output_format not in OUTPUT_FORMATS or chunk_frames < 1:
+        print('Usage: python batch_renderer.py tar_dir csv_dir output_dir [--format png|raw] [--workers N] '
+              '[--chunk-frames N]')
+        exit(1)
+
+    render_trials(sys.argv[1], sys.argv[2], sys.argv[3], output_format, n_workers, chunk_frames)
@@ -0,0 +1,282 @@
+# benchmark.py
+#
+# Measure the throughput (lines/sec) of the data processing pipeline
+# -----------------------
+import os
+import re
+import sys
+import time
+import filecmp
+import tempfile
+import numpy as np
+import asc_generator
+import data_reader
+import data_cleaning
+import gaze_trial
+
+
+def read_gaze_data_asc_file_regex_chain(fname):
+    """ The previous version of data_reader.read_gaze_data_asc_file, kept as the baseline:
+        it loads the whole file with readlines() and tries the regexes one after another on each line """
+    with open(fname, 'r') as f:
+        lines = f.readlines()
+    frameid = 'BEFORE-FIRST-FRAME'
+    frameid2pos = {frameid: []}
+    frameid2action = {frameid: None}
+    frameid2duration = {frameid: None}
+    frameid2unclipped_reward = {frameid: None}
+    frameid2episode = {frameid: None}
+    frameid2score = {frameid: None}
+    file_meta_data = {'avg_error': None, 'max_error': None, 'low_sample_rate': None, 'total_frame': None}
+    frameid_list = []
+    start_timestamp = 0
+    freg = r"[-+]?[0-9]*\.?[0-9]+"
+    scr_msg = re.compile(r"MSG\s+(\d+)\s+SCR_RECORDER FRAMEID (\d+) UTID (\w+)")
+    gaze_msg = re.compile(r"(\d+)\s+(%s)\s+(%s)" % (freg, freg))
+    act_msg = re.compile(r"MSG\s+(\d+)\s+key_pressed atari_action (\d+)")
+    reward_msg = re.compile(r"MSG\s+(\d+)\s+reward (\d+)")
+    episode_msg = re.compile(r"MSG\s+(\d+)\s+episode (\d+)")
+    score_msg = re.compile(r"MSG\s+(\d+)\s+score (\d+)")
+    validation_msg = re.compile(r"MSG\s+(\d+)\s+!CAL\sVALIDATION.+ERROR\s+(%s)\s+avg\.\s+(%s)\s+max\s+OFFSET.+" % (freg, freg))
+
+    for line in lines:
+        match_sample = gaze_msg.match(line)
+        if match_sample:
+            frameid2pos[frameid].append((float(match_sample.group(2)), float(match_sample.group(3))))
+            continue
+        match_scr_msg = scr_msg.match(line)
+        if match_scr_msg:
+            old_frameid = frameid
+            timestamp, frameid, UTID = match_scr_msg.group(1), match_scr_msg.group(2), match_scr_msg.group(3)
+            frameid2duration[old_frameid] = int(timestamp) - start_timestamp
+            start_timestamp = int(timestamp)
+            frameid = data_reader.make_unique_frame_id(UTID, frameid)
+            frameid_list.append(frameid)
+            frameid2pos[frameid] = []
+            frameid2action[frameid] = None
+            continue
+        match_action = act_msg.match(line)
+        if match_action:
+            if frameid2action[frameid] is None:
+                frameid2action[frameid] = int(match_action.group(2))
+            continue
+        match_reward = reward_msg.match(line)
+        if match_reward:
+            if frameid not in frameid2unclipped_reward:
+                frameid2unclipped_reward[frameid] = int(match_reward.group(2))
+            continue
+        match_episode = episode_msg.match(line)
+        if match_episode:
+            frameid2episode[frameid] = int(match_episode.group(2))
+            continue
+        match_score = score_msg.match(line)
+        if match_score:
+            frameid2score[frameid] = int(match_score.group(2))
+            continue
+        match_validation = validation_msg.match(line)
+        if match_validation:
+            file_meta_data['avg_error'] = float(match_validation.group(2))
+            file_meta_data['max_error'] = float(match_validation.group(3))
+            continue
+
+    frameid2pos[frameid] = []
+    n_frame = len(frameid_list)
+    few_cnt = 0
+    for v in frameid2pos.values():
+        if len(v) < 10:
+            few_cnt += 1
+    file_meta_data['low_sample_rate'] = "{:.1f}".format(100.0*float(few_cnt)/float(n_frame)) + "%"
+    file_meta_data['total_frame'] = n_frame
+
+    return frameid2pos, frameid2action, frameid2duration, frameid2unclipped_reward, frameid2episode, frameid2score, frameid_list, file_meta_data
+
+
+def add_to_data_line(frameid, frameid2data, data_line='', separator=','):
+    if frameid in frameid2data and frameid2data[frameid] is not None:
+        data_line = data_line + str(frameid2data[frameid]) + separator
+    else:
+        data_line = data_line + 'null' + separator
+    return data_line
+
+
+def write_gaze_data_to_csv_concat(gaze_data, csv_fpath):
+    """ The previous csv writer of data_cleaning.save_gaze_data_asc_file_to_csv, kept as the baseline:
+        it builds each line by string concatenation and writes one line at a time """
+    frameid2pos, frameid2action, frameid2duration, frameid2unclipped_reward, frameid2episode, frameid2score, frameid_list = gaze_data[:7]
+    separator = ','
+    pos_separator = ','
+    csv_file = open(csv_fpath, 'w')
+    csv_file.write(data_cleaning.CSV_TITLES)
+    for frameid in frameid_list:
+        data_line = str(frameid[0]) + '_' + str(frameid[1]) + separator
+        data_line = add_to_data_line(frameid, frameid2episode, data_line, separator)
+        data_line = add_to_data_line(frameid, frameid2score, data_line, separator)
+        data_line = add_to_data_line(frameid, frameid2duration, data_line, separator)
+        data_line = add_to_data_line(frameid, frameid2unclipped_reward, data_line, separator)
+        data_line = add_to_data_line(frameid, frameid2action, data_line, separator)
+        if frameid in frameid2pos:
+            pos_list = frameid2pos[frameid]
+            n_pos = len(pos_list)
+            if n_pos == 0:
+                data_line += 'null'
+            else:
+                for i in range(0, n_pos):
+                    data_line = data_line + format(pos_list[i][0]/8.0, '.2f') + pos_separator + format(pos_list[i][1]/4.0, '.2f')
+                    if i < n_pos-1:
+                        data_line += pos_separator
+        else:
+            data_line += 'null'
+        csv_file.write(data_line + '\n')
+    csv_file.close()
+
+
+def write_gaze_data_to_csv_buffered(gaze_data, csv_fpath):
+    """ The csv writer used by data_cleaning.save_gaze_data_asc_file_to_csv """
+    csv_file = open(csv_fpath, 'w', data_cleaning.CSV_BUFFER_SIZE)
+    csv_file.write(data_cleaning.CSV_TITLES)
+    data_cleaning.write_gaze_trial_to_csv(gaze_trial.make_gaze_trial(gaze_data, np.float64), csv_file)
+    csv_file.close()
+
+
+def read_gaze_data_csv_file_per_line(fname, separator=',', pos_separator=','):
+    """ The previous version of data_reader.read_gaze_data_csv_file, kept as the baseline:
+        it converts the values of each line (and each gaze coordinate) one at a time """
+    with open(fname, 'r') as f:
+        lines = f.readlines()
+    frameid = 'BEFORE-FIRST-FRAME'
+    frameid2pos = {frameid: []}
+    frameid2action = {frameid: None}
+    frameid2duration = {frameid: None}
+    frameid2unclipped_reward = {frameid: None}
+    frameid2episode = {frameid: None}
+    frameid2score = {frameid: None}
+    frameid_list = []
+
+    def to_int(value):
+        return None if value == 'null' else int(value)
+
+    for (i, line) in enumerate(lines):
+        if i == 0 and 'frame' in line:
+            continue
+        data_line = line.split(separator)
+        frameid = data_line[0]
+        frameid_list.append(frameid)
+        frameid2episode[frameid] = to_int(data_line[1])
+        frameid2score[frameid] = to_int(data_line[2])
+        frameid2duration[frameid] = to_int(data_line[3])
+        frameid2unclipped_reward[frameid] = to_int(data_line[4])
+        frameid2action[frameid] = to_int(data_line[5])
+        pos_data = data_line[6]
+        if pos_data == 'null':
+            frameid2pos[frameid] = None
+        else:
+            if separator == pos_separator:
+                pos_data_list = data_line[6:]
+            else:
+                pos_data_list = pos_data.split(pos_separator)
+            pos_list = []
+            for j in range(0, len(pos_data_list) // 2):
+                pos_list.append((float(pos_data_list[2*j]), float(pos_data_list[2*j+1])))
+            frameid2pos[frameid] = pos_list
+
+    return frameid2pos, frameid2action, frameid2duration, frameid2unclipped_reward, frameid2episode, frameid2score, frameid_list
+
+
+def count_lines(fname):
+    """ The number of lines of a file, counted on blocks of 1 MB """
+    n_line = 0
+    with open(fname, 'rb') as f:
+        block = f.read(1 << 20)
+        while block:
+            n_line += block.count(b'\n')
+            block = f.read(1 << 20)
+    return n_line
+
+
+def time_func(func, args, n_repeat=3):
+    """ Return the best wall time (in sec) of n_repeat runs and the result of the last run """
+    best_time = float('inf')
+    result = None
+    for _ in range(n_repeat):
+        start_time = time.time()
+        result = func(*args)
+        best_time = min(best_time, time.time() - start_time)
+    return best_time, result
+
+
+def make_synthetic_trial_files(saved_dir, n_frame):
+    """ Write a synthetic trial of n_frame frames (see asc_generator) to an asc file and to the txt file that
+        data_cleaning would produce from it. Returns the paths of the asc and the txt files """
+    trial_name = '%d_SYN_%d_synthetic' % (n_frame, n_frame)
+    asc_fpath = os.path.join(saved_dir, trial_name + '.asc')
+    csv_fpath = os.path.join(saved_dir, trial_name + '.txt')
+    trial = asc_generator.make_synthetic_trial(n_frame)
+    asc_generator.write_asc_file(trial, asc_fpath)
+    asc_generator.write_csv_file(trial, csv_fpath)
+    return asc_fpath, csv_fpath
+
+
+def benchmark_asc_parser(asc_fname, n_repeat=3):
+    n_line = count_lines(asc_fname)
+    print('Benchmarking asc parser on %s (%d lines)' % (asc_fname, n_line))
+
+    baseline_time, baseline_data = time_func(read_gaze_data_asc_file_regex_chain, (asc_fname,), n_repeat)
+    streaming_time, streaming_data = time_func(data_reader.read_gaze_data_asc_file, (asc_fname,), n_repeat)
+    if baseline_data != streaming_data:
+        print('Warning: the streaming parser and the baseline parser return different data.')
+
+    print('Regex chain (baseline): %.3f sec, %.0f lines/sec' % (baseline_time, n_line / baseline_time))
+    print('Streaming parser: %.3f sec, %.0f lines/sec' % (streaming_time, n_line / streaming_time))
+    print('Speedup: %.2fx' % (baseline_time / streaming_time))
+
+
+def benchmark_csv_writer(asc_fname, n_repeat=3):
+    gaze_data = data_reader.read_gaze_data_asc_file(asc_fname, is_interactive=False)
+    n_frame = len(gaze_data[6])
+    print('Benchmarking csv writer on %s (%d frames)' % (asc_fname, n_frame))
+
+    temp_dir = tempfile.mkdtemp()
+    baseline_fpath = os.path.join(temp_dir, 'concat.txt')
+    buffered_fpath = os.path.join(temp_dir, 'buffered.txt')
+    baseline_time, _ = time_func(write_gaze_data_to_csv_concat, (gaze_data, baseline_fpath), n_repeat)
+    buffered_time, _ = time_func(write_gaze_data_to_csv_buffered, (gaze_data, buffered_fpath), n_repeat)
+    if not filecmp.cmp(baseline_fpath, buffered_fpath, shallow=False):
+        print('Warning: the buffered writer and the baseline writer produce different files.')
+    os.remove(baseline_fpath)
+    os.remove(buffered_fpath)
+    os.rmdir(temp_dir)
+
+    print('String concatenation (baseline): %.3f sec, %.0f frames/sec' % (baseline_time, n_frame / baseline_time))
+    print('Buffered writer: %.3f sec, %.0f frames/sec' % (buffered_time, n_frame / buffered_time))
+    print('Speedup: %.2fx' % (baseline_time / buffered_time))
+
+
+def benchmark_csv_reader(asc_fname, n_repeat=3):
+    temp_dir = tempfile.mkdtemp()
+    data_cleaning.save_gaze_data_asc_file_to_csv(asc_fname, temp_dir, is_interactive=False)
+    csv_fpath = os.path.join(temp_dir, data_cleaning.get_csv_fname(asc_fname))
+    n_line = count_lines(csv_fpath)
+    print('Benchmarking csv reader on %s (%d lines)' % (csv_fpath, n_line))
+
+    baseline_time, baseline_data = time_func(read_gaze_data_csv_file_per_line, (csv_fpath,), n_repeat)
+    dict_time, dict_data = time_func(data_reader.read_gaze_data_csv_file, (csv_fpath,), n_repeat)
+    trial_time, _ = time_func(data_reader.read_gaze_trial_csv_file, (csv_fpath,), n_repeat)
+    if baseline_data != dict_data:
+        print('Warning: the vectorized reader and the baseline reader return different data.')
+    os.remove(csv_fpath)
+    os.rmdir(temp_dir)
+
+    print('Per-line conversion (baseline): %.3f sec, %.0f lines/sec' % (baseline_time, n_line / baseline_time))
+    print('Vectorized reader (dictionaries): %.3f sec, %.0f lines/sec' % (dict_time, n_line / dict_time))
+    print('Vectorized reader (GazeTrial): %.3f sec, %.0f lines/sec' % (trial_time, n_line / trial_time))
+    print('Speedup (GazeTrial): %.2fx' % (baseline_time / trial_time))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python benchmark.py asc_fname')
+        exit(1)
+
+    benchmark_asc_parser(sys.argv[1])
+    benchmark_csv_writer(sys.argv[1])
+    benchmark_csv_reader(sys.argv[1])
@@ -0,0 +1,257 @@
+# benchmark_suite.py
+#
+# Time each stage of the pipeline on synthetic trials of several sizes (see asc_generator.py)
+# For each stage and size: lines/sec, MB/sec and peak RSS, saved to a JSON file to compare the versions
+# Each stage runs in a new process, so its peak RSS is not mixed with the other stages
+# Also times the import of each command module, and checks that it doesn't load heavy dependencies it doesn't need
+# -----------------------
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import benchmark
+import data_cleaning
+import data_reader
+import data_stat
+import stage_profiler
+import utils
+
+
+DEFAULT_SIZES = (1000, 10000, 50000)
+STAGES = ('parse_asc', 'convert_asc', 'stream_asc', 'read_csv', 'trial_stat')
+# a stage is reported as slower than the previous results when its lines/sec drops by more than this ratio
+REGRESSION_TOLERANCE = 0.1
+# the heavy dependencies that must only be loaded by the code paths that use them
+HEAVY_MODULES = ('IPython', 'scipy', 'pygame', 'xlsxwriter', 'xlrd')
+# the modules whose import is timed, with the heavy dependencies they are allowed to load
+IMPORTED_MODULES = (('data_reader', ()), ('data_cleaning', ()), ('data_stat', ()), ('do_cleaning_and_stat', ()),
+                    ('trial_catalog', ()), ('data_visualizer', ('pygame',)))
+# run by a new python process: import the module and save the import time and the loaded modules to a JSON file
+IMPORT_SCRIPT = ('import sys, json, time\n'
+                 'start_time = time.time()\n'
+                 '__import__(sys.argv[1])\n'
+                 'seconds = time.time() - start_time\n'
+                 'with open(sys.argv[2], "w") as f:\n'
+                 '    json.dump({"seconds": seconds, "modules": sorted(sys.modules.keys())}, f)\n')
+
+
+def run_parse_asc(input_fpath, temp_dir):
+    data_reader.read_gaze_data_asc_file(input_fpath, is_interactive=False)
+
+
+def run_convert_asc(input_fpath, temp_dir):
+    data_cleaning.save_gaze_data_asc_file_to_csv(input_fpath, temp_dir, is_interactive=False)
+
+
+def run_stream_asc(input_fpath, temp_dir):
+    data_cleaning.stream_gaze_asc_file_to_csv(input_fpath, temp_dir, is_interactive=False)
+
+
+def run_read_csv(input_fpath, temp_dir):
+    data_reader.read_gaze_data_csv_file(input_fpath)
+
+
+def run_trial_stat(input_fpath, temp_dir):
+    data_stat.do_per_trial_stat(os.path.dirname(input_fpath))
+
+
+STAGE_FUNCS = {'parse_asc': run_parse_asc, 'convert_asc': run_convert_asc, 'stream_asc': run_stream_asc,
+               'read_csv': run_read_csv, 'trial_stat': run_trial_stat}
+
+
+def run_stage(stage, input_fpath, result_fpath, n_repeat):
+    """ Run the stage n_repeat times in this process and save the best time and the peak RSS to result_fpath """
+    temp_dir = tempfile.mkdtemp()
+    # the memory used by the modules, before running the stage
+    rss_before = stage_profiler.get_max_rss_mb()
+    try:
+        best_time, _ = benchmark.time_func(STAGE_FUNCS[stage], (input_fpath, temp_dir), n_repeat)
+    finally:
+        shutil.rmtree(temp_dir)
+    with open(result_fpath, 'w') as f:
+        json.dump({'seconds': best_time, 'peak_rss_mb': stage_profiler.get_max_rss_mb(),
+                   'rss_before_mb': rss_before}, f)
+
+
+def run_stage_in_process(stage, input_fpath, n_repeat):
+    """ Run the stage in a new python process (the output of the stage is discarded) """
+    fd, result_fpath = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), '--run-stage', stage, input_fpath,
+                                   result_fpath, '--repeat', str(n_repeat)], stdout=devnull)
+        with open(result_fpath, 'r') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_fpath)
+
+
+def run_import_in_process(module_name, n_repeat):
+    """ Import the module in a new python process (n_repeat times, the best time is kept).
+        Returns the import time and the heavy modules (see HEAVY_MODULES) that the import loaded """
+    fd, result_fpath = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    best_time = float('inf')
+    try:
+        for _ in range(n_repeat):
+            with open(os.devnull, 'w') as devnull:
+                subprocess.check_call([sys.executable, '-c', IMPORT_SCRIPT, module_name, result_fpath], stdout=devnull,
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+            with open(result_fpath, 'r') as f:
+                result = json.load(f)
+            best_time = min(best_time, result['seconds'])
+    finally:
+        os.remove(result_fpath)
+    loaded_modules = set([name.split('.')[0] for name in result['modules']])
+    return best_time, [name for name in HEAVY_MODULES if name in loaded_modules]
+
+
+def benchmark_imports(n_repeat, imported_modules=IMPORTED_MODULES):
+    """ Time the import of each module, each in a new process. Returns the results of the modules: the import time,
+        the heavy modules it loaded and those it is not allowed to load (unneeded) """
+    results = []
+    for module_name, allowed_modules in imported_modules:
+        seconds, heavy_modules = run_import_in_process(module_name, n_repeat)
+        results.append({'module': module_name, 'seconds': seconds, 'heavy_modules': heavy_modules,
+                        'unneeded_modules': [name for name in heavy_modules if name not in allowed_modules]})
+        print_import_result(results[-1])
+    return results
+
+
+def print_import_result(result):
+    unneeded = '  UNNEEDED: %s' % ', '.join(result['unneeded_modules']) if result['unneeded_modules'] else ''
+    print('import %-20s %7.3f sec, heavy modules: %s%s' % (
+        result['module'], result['seconds'], ', '.join(result['heavy_modules']) or 'none', unneeded))
+
+
+def get_git_commit():
+    try:
+        with open(os.devnull, 'w') as devnull:
+            commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=devnull,
+                                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return commit.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_size(n_frame, work_dir, n_repeat, stages=STAGES):
+    """ Generate a trial of n_frame frames and run the stages on it. Returns the results of the stages """
+    trial_dir = os.path.join(work_dir, 'frames_%d' % n_frame)
+    os.makedirs(trial_dir)
+    asc_fpath, csv_fpath = benchmark.make_synthetic_trial_files(trial_dir, n_frame)
+
+    results = []
+    for stage in stages:
+        input_fpath = asc_fpath if stage in ('parse_asc', 'convert_asc', 'stream_asc') else csv_fpath
+        n_line = benchmark.count_lines(input_fpath)
+        n_bytes = os.path.getsize(input_fpath)
+        result = run_stage_in_process(stage, input_fpath, n_repeat)
+        seconds = max(result['seconds'], 1e-9)
+        results.append({'stage': stage, 'n_frame': n_frame, 'n_line': n_line, 'n_bytes': n_bytes,
+                        'seconds': seconds, 'lines_per_sec': n_line / seconds,
+                        'mb_per_sec': n_bytes / float(1 << 20) / seconds,
+                        'peak_rss_mb': result['peak_rss_mb'], 'rss_before_mb': result['rss_before_mb']})
+        print_result(results[-1])
+    return results
+
+
+def print_result(result):
+    peak_rss = '%.0f MB' % result['peak_rss_mb'] if result['peak_rss_mb'] is not None else 'n/a'
+    print('%-12s %8d frames %10d lines: %7.3f sec, %10.0f lines/sec, %7.1f MB/sec, peak RSS %s' % (
+        result['stage'], result['n_frame'], result['n_line'], result['seconds'], result['lines_per_sec'],
+        result['mb_per_sec'], peak_rss))
+
+
+def compare_results(results, previous_results):
+    """ Print the speed of each stage relative to the previous results (same stage and size).
+        Returns the number of stages that are slower than REGRESSION_TOLERANCE allows """
+    previous = dict(((result['stage'], result['n_frame']), result) for result in previous_results['results'])
+    print('Compared with %s (commit %s):' % (previous_results.get('date'), previous_results.get('git_commit')))
+    n_slower = 0
+    for result in results:
+        key = (result['stage'], result['n_frame'])
+        if key not in previous:
+            continue
+        ratio = result['lines_per_sec'] / previous[key]['lines_per_sec']
+        is_slower = ratio < 1.0 - REGRESSION_TOLERANCE
+        n_slower += is_slower
+        print('%-12s %8d frames: %.2fx%s' % (result['stage'], result['n_frame'], ratio,
+                                             '  SLOWER' if is_slower else ''))
+    return n_slower
+
+
+def compare_import_results(import_results, previous_results):
+    """ Print the import time of each module relative to the previous results.
+        Returns the number of modules that are slower than REGRESSION_TOLERANCE allows """
+    previous = dict((result['module'], result) for result in previous_results.get('imports', []))
+    n_slower = 0
+    for result in import_results:
+        if result['module'] not in previous:
+            continue
+        ratio = previous[result['module']]['seconds'] / max(result['seconds'], 1e-9)
+        is_slower = ratio < 1.0 - REGRESSION_TOLERANCE
+        n_slower += is_slower
+        print('import %-20s %.2fx%s' % (result['module'], ratio, '  SLOWER' if is_slower else ''))
+    return n_slower
+
+
+def run_benchmark_suite(output_fpath, sizes=DEFAULT_SIZES, n_repeat=3, previous_fpath=None):
+    """ Time the imports and run all the stages at each size, save the results to output_fpath (JSON), and compare
+        them with the results in previous_fpath if it is given """
+    import_results = benchmark_imports(n_repeat)
+    work_dir = tempfile.mkdtemp()
+    results = []
+    try:
+        for n_frame in sizes:
+            results.extend(benchmark_size(n_frame, work_dir, n_repeat))
+    finally:
+        shutil.rmtree(work_dir)
+
+    suite_results = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'git_commit': get_git_commit(),
+                     'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                     'n_repeat': n_repeat, 'imports': import_results, 'results': results}
+    with open(output_fpath, 'w') as f:
+        json.dump(suite_results, f, indent=1)
+    print('Saved the results to %s' % output_fpath)
+
+    if previous_fpath is not None:
+        with open(previous_fpath, 'r') as f:
+            previous_results = json.load(f)
+        compare_import_results(import_results, previous_results)
+        compare_results(results, previous_results)
+    return suite_results
+
+
+if __name__ == '__main__':
+    n_repeat = utils.pop_int_option(sys.argv, '--repeat', 3)
+    if '--run-stage' in sys.argv:
+        # internal: run one stage in this process (see run_stage_in_process)
+        sys.argv.remove('--run-stage')
+        run_stage(sys.argv[1], sys.argv[2], sys.argv[3], n_repeat)
+        exit(0)
+
+    if utils.pop_flag(sys.argv, '--imports'):
+        # only time the imports, and fail if a module loads a heavy dependency it doesn't need
+        import_results = benchmark_imports(n_repeat)
+        exit(1 if any([result['unneeded_modules'] for result in import_results]) else 0)
+
+    sizes = utils.pop_option(sys.argv, '--sizes', ','.join([str(size) for size in DEFAULT_SIZES]), str,
+                             'a list of frame counts, e.g. 1000,10000')
+    previous_fpath = utils.pop_option(sys.argv, '--compare', None, str, 'a results file')
+    try:
+        sizes = [int(size) for size in sizes.split(',')]
+    except ValueError:
+        sizes = []
+    if len(sys.argv) < 2 or len(sizes) == 0 or n_repeat < 1:
+        print('Usage: python benchmark_suite.py output.json [--sizes 1000,10000,50000] [--repeat N] '
+              '[--compare previous.json]')
+        print('       python benchmark_suite.py --imports [--repeat N]')
+        exit(1)
+
+    run_benchmark_suite(sys.argv[1], sizes, n_repeat, previous_fpath)
@@ -8,89 +8,458 @@
 import os
 import re
 import sys
+import json
 import time
+import traceback
+import multiprocessing
+import numpy as np
 import data_reader
+import data_stat
+import gaze_events
+import gaze_samples
+import gaze_trial
+import rebuild_manifest
+import stage_profiler
+import trial_catalog
 import utils
 
 
-def add_to_data_line(frameid, frameid2data, data_line='', separator=','):
-    if frameid in frameid2data and frameid2data[frameid] is not None:
-        data_line = data_line + str(frameid2data[frameid]) + separator
-    else:
-        data_line = data_line + 'null' + separator
-    return data_line
+# scale from the eye tracker coordinates to the game frame coordinates (x, y)
+GAZE_SCALE = (8.0, 4.0)
+CSV_TITLES = 'frame_id,episode_id,score,duration(ms),unclipped_reward,action,gaze_positions\n'
+# number of frames formatted and written at a time
+WRITE_CHUNK_FRAMES = 4096
+CSV_BUFFER_SIZE = 1 << 20
 
 
-def save_gaze_data_asc_file_to_csv(fname, saved_dir, is_include_title=True, saved_as_plain_txt=True):
-    gaze_data = data_reader.read_gaze_data_asc_file(fname)
-    frameid2pos = gaze_data[0]
-    frameid2action = gaze_data[1]
-    frameid2duration = gaze_data[2]
-    frameid2unclipped_reward = gaze_data[3]
-    frameid2episode = gaze_data[4]
-    frameid2score = gaze_data[5]
-    frameid_list = gaze_data[6]
-    file_meta_data = gaze_data[7]
+def format_frameid(frameid):
+    return str(frameid[0]) + '_' + str(frameid[1])
 
-    # create the saved_dir if not exists
-    if not os.path.exists(saved_dir):
-        os.makedirs(saved_dir)
 
-    # create the csv file (saved as txt file)
-    csv_fname = os.path.basename(fname).split('.')[0]
+def format_column(trial, name):
+    """ Format a per-frame column of a GazeTrial as strings ('null' for null values) """
+    values = trial.columns[name].tolist()
+    null_mask = trial.null_masks[name].tolist()
+    return ['null' if is_null else str(value) for value, is_null in zip(values, null_mask)]
+
+
+def round_floats_2f(values):
+    """ The values of a float64 array rounded to 2 decimals like format(value, '.2f'): half to even on the exact
+        binary value, so the rounding error of value*100 is computed exactly (Dekker's product with a Veltkamp split).
+        Returns the rounded values times 100 (int64) and a bool array that is False where the value is too large
+        (or nan/inf) to be rounded this way (its rounded value is 0) """
+    scaled = values * 100.0
+    is_formatted = np.abs(scaled) < 2.0 ** 31 - 2
+    values = np.where(is_formatted, values, 0.0)
+    scaled = np.where(is_formatted, scaled, 0.0)
+    # the exact value of values*100 is scaled + error
+    split = 134217729.0 * values
+    values_hi = split - (split - values)
+    error = (values_hi * 100.0 - scaled) + (values - values_hi) * 100.0
+    scaled_floor = np.floor(scaled)
+    diff_to_half = (scaled - scaled_floor - 0.5) + error
+    rounded = scaled_floor.astype(np.int64)
+    rounded += (diff_to_half > 0) | ((diff_to_half == 0) & (rounded & 1 == 1))
+    return rounded, is_formatted
+
+
+def format_floats_2f(values, separator=','):
+    """ Vectorized format(value, '.2f') + separator for a float64 array (see round_floats_2f).
+        Returns the text of all the values, the end index (in the text) of each value, and a bool array that is
+        False where the value is too large (or nan/inf) to be formatted this way. """
+    n_value = len(values)
+    rounded, is_formatted = round_floats_2f(values)
+    abs_rounded = np.abs(rounded).astype(np.int32)
+
+    # all the digits (at least 3: x.xx)
+    n_digit = max(3, len(str(int(abs_rounded.max())))) if n_value > 0 else 3
+    separator_chars = bytearray(separator.encode('ascii'))
+    width = 2 + n_digit + len(separator_chars)
+    # one row per character position (sign, digits, '.', separator), one column per value
+    chars = np.empty((width, n_value), dtype=np.uint8)
+    is_kept = np.ones((width, n_value), dtype=bool)
+    chars[0] = ord('-')
+    is_kept[0] = np.signbit(values) & is_formatted
+    rest = abs_rounded
+    for i_digit in range(n_digit):
+        # the 2 decimals come after the '.'
+        row = n_digit + 1 - i_digit if i_digit < 2 else n_digit - i_digit
+        chars[row] = rest % 10 + 48
+        rest = rest // 10
+        # drop the leading zeros of the integer part
+        if i_digit > 2:
+            is_kept[row] = abs_rounded >= 10 ** i_digit
+    chars[n_digit - 1] = ord('.')
+    for i, separator_char in enumerate(separator_chars):
+        chars[2 + n_digit + i] = separator_char
+
+    value_ends = np.cumsum(is_kept.sum(axis=0))
+    text = chars.T[is_kept.T].tobytes().decode('ascii')
+    return text, value_ends, is_formatted
+
+
+def write_gaze_trial_to_csv(trial, csv_file, separator=',', pos_separator=','):
+    """ Write the frames of a GazeTrial (with float64 gazes) to the csv file.
+        The gazes are scaled and formatted over the array, a chunk of frames at a time,
+        and each chunk is written with one call. """
+    n_frame = len(trial)
+    frameid_strs = [format_frameid(frameid) for frameid in trial.frameid_list]
+    # columns: episode_id,score,duration,unclipped_reward,action
+    column_strs = [format_column(trial, name) for name in gaze_trial.COLUMN_NAMES]
+    scaled_gaze = (trial.gaze / np.array(GAZE_SCALE)).ravel()
+    offsets = (2 * trial.gaze_offsets).tolist()
+
+    for chunk_start in range(0, n_frame, WRITE_CHUNK_FRAMES):
+        chunk_stop = min(chunk_start + WRITE_CHUNK_FRAMES, n_frame)
+        chunk_offset = offsets[chunk_start]
+        chunk_gaze = scaled_gaze[chunk_offset:offsets[chunk_stop]]
+        gaze_text, value_ends, is_formatted = format_floats_2f(chunk_gaze, pos_separator)
+        value_ends = [0] + value_ends.tolist()
+        n_unformatted = [0] + np.cumsum(~is_formatted).tolist()
+
+        lines = []
+        for i in range(chunk_start, chunk_stop):
+            start, stop = offsets[i] - chunk_offset, offsets[i + 1] - chunk_offset
+            if start == stop:
+                pos_str = 'null'
+            elif n_unformatted[stop] == n_unformatted[start]:
+                # drop the separator after the last value
+                pos_str = gaze_text[value_ends[start]:value_ends[stop] - len(pos_separator)]
+            else:
+                pos_str = pos_separator.join([format(value, '.2f') for value in chunk_gaze[start:stop].tolist()])
+            lines.append(separator.join([frameid_strs[i], column_strs[0][i], column_strs[1][i], column_strs[2][i],
+                                         column_strs[3][i], column_strs[4][i], pos_str]))
+            lines.append('\n')
+        csv_file.write(''.join(lines))
+
+
+def get_csv_fname(asc_fname, saved_as_plain_txt=True):
+    csv_fname = os.path.basename(asc_fname).split('.')[0]
     if saved_as_plain_txt:
         csv_fname += '.txt'
     else:
         csv_fname += '.csv'
-    csv_fpath = os.path.join(saved_dir, csv_fname)
-    csv_file = open(csv_fpath, 'w')
+    return csv_fname
+
+
+def get_npz_fname(asc_fname):
+    return os.path.basename(asc_fname).split('.')[0] + '.npz'
+
+
+def get_events_fname(asc_fname):
+    return os.path.basename(asc_fname).split('.')[0] + '.events'
+
+
+def get_samples_fname(asc_fname):
+    return os.path.basename(asc_fname).split('.')[0] + '.samples'
+
+
+def get_index_fname(asc_fname):
+    return os.path.basename(asc_fname).split('.')[0] + '.index'
+
+
+def get_output_fnames(asc_fname, saved_as_plain_txt=True, saved_as_binary=False, event_method=None,
+                      saved_samples=False, saved_index=False):
+    output_fnames = [get_csv_fname(asc_fname, saved_as_plain_txt)]
+    if saved_index:
+        output_fnames.append(get_index_fname(asc_fname))
+    if saved_as_binary:
+        output_fnames.append(get_npz_fname(asc_fname))
+    if saved_samples:
+        output_fnames.append(get_samples_fname(asc_fname))
+    if event_method is not None:
+        output_fnames.append(get_events_fname(asc_fname))
+    return output_fnames
+
+
+def round_gaze_2f(gaze):
+    """ The gazes rounded to the values written in the csv file (2 decimals, see format_floats_2f) """
+    rounded, is_formatted = round_floats_2f(gaze.ravel())
+    # the sign of the values rounded to zero is kept ('-0.00')
+    rounded_gaze = np.where(is_formatted, np.copysign(rounded / 100.0, gaze.ravel()), gaze.ravel())
+    return rounded_gaze.reshape(gaze.shape)
+
+
+def save_gaze_trial_to_npz(trial, npz_fpath):
+    """ Save a GazeTrial (read from an asc file) to an uncompressed npz file, which data_reader.read_gaze_trial_npz_file
+        loads by memory mapping. The gazes are scaled and rounded like in the csv file, and saved as float32 (the
+        reader recovers the 2 decimals, see GazeTrial.gaze_decimals). """
+    arrays = {'frameid': np.array([format_frameid(frameid) for frameid in trial.frameid_list], dtype=np.str_),
+              'gaze': round_gaze_2f(trial.gaze / np.array(GAZE_SCALE)).astype(np.float32),
+              'gaze_offsets': trial.gaze_offsets,
+              'gaze_null': trial.gaze_null_mask,
+              'file_meta_data': np.array(json.dumps(trial.file_meta_data))}
+    for name in gaze_trial.COLUMN_NAMES:
+        arrays[name] = trial.columns[name]
+        arrays['null_' + name] = trial.null_masks[name]
+    np.savez(npz_fpath, **arrays)
+
+
+def save_gaze_samples(samples, samples_fpath):
+    """ Save the gaze samples of a trial as fixed-width arrays in an uncompressed npz container (without the .npz
+        extension), which data_reader.read_gaze_samples_file loads by memory mapping:
+        timestamp int64 (ms), x and y float32 (eye tracker coordinates, not scaled), pupil float32,
+        frame_index int32 (index of the frame in the trial file, -1 for the samples outside the frames) """
+    with open(samples_fpath, 'wb') as f:
+        # with a file object, np.savez doesn't add the .npz extension
+        np.savez(f, timestamp=samples.timestamp.astype(np.int64), x=samples.x.astype(np.float32),
+                 y=samples.y.astype(np.float32), pupil=samples.pupil.astype(np.float32),
+                 frame_index=samples.frame_index.astype(np.int32))
+
+
+def save_frame_index(csv_fpath, index_fpath):
+    """ Save the frame index of a csv file (see data_reader.build_frame_index) as fixed-width arrays in an
+        uncompressed npz container (without the .npz extension), which data_reader.read_frame_index loads by memory
+        mapping. It is used by data_reader.read_frames and read_episode to read a range of frames without parsing
+        the whole csv file """
+    with open(index_fpath, 'wb') as f:
+        # with a file object, np.savez doesn't add the .npz extension
+        np.savez(f, **data_reader.build_frame_index(csv_fpath))
+
+
+def save_gaze_data_asc_file_to_csv(fname, saved_dir, is_include_title=True, saved_as_plain_txt=True, is_interactive=True,
+                                   saved_as_binary=False):
+    """ Convert an asc file to a csv (txt) file, and also to a binary npz file if saved_as_binary is set.
+        Returns the meta data of the trial """
+    trial = save_gaze_trial_asc_file_to_csv(fname, saved_dir, is_include_title, saved_as_plain_txt, is_interactive,
+                                            saved_as_binary)
+    return trial.file_meta_data
+
+
+def make_gaze_trial_of_frames(frames):
+    """ Convert a list of frame records (see data_reader.iter_gaze_frames_asc_file) to a GazeTrial with float64 gazes """
+    frameid_list = [frame[0] for frame in frames]
+    # the fields after the frame id are in the order of the dictionaries of data_reader.read_gaze_data_asc_file
+    gaze_data = tuple([dict(zip(frameid_list, values)) for values in list(zip(*frames))[1:]]) + (frameid_list,)
+    return gaze_trial.make_gaze_trial(gaze_data, np.float64)
 
-    # define the separator in csv file
-    separator = ','
-    pos_separator = ','
 
-    # write the title information if is_include_title is set
+def stream_gaze_asc_file_to_csv(fname, saved_dir, is_include_title=True, saved_as_plain_txt=True, is_interactive=True,
+                                line_counts=None):
+    """ Same as save_gaze_data_asc_file_to_csv (only the csv file), in constant memory: each frame is formatted as
+        soon as it is complete, and written with the next frames of its chunk (WRITE_CHUNK_FRAMES frames), so the
+        memory does not grow with the size of the asc file. The csv file is the same.
+        Returns the meta data of the trial, which is only known at the end of the file.
+        line_counts: see data_reader.read_gaze_data_asc_file """
+    file_meta_data = {}
+    frames = data_reader.iter_gaze_frames_asc_file(fname, is_interactive, line_counts=line_counts,
+                                                   file_meta_data=file_meta_data)
+    csv_file = open(os.path.join(saved_dir, get_csv_fname(fname, saved_as_plain_txt)), 'w', CSV_BUFFER_SIZE)
     if is_include_title:
-        titles = 'frame_id,episode_id,score,duration(ms),unclipped_reward,action,gaze_positions\n'
-        csv_file.write(titles)
-
-    # save the data to the file
-    for frameid in frameid_list:
-        # write the frameid
-        data_line = str(frameid[0]) + '_' + str(frameid[1]) + separator
-        # write the episode id
-        data_line = add_to_data_line(frameid, frameid2episode, data_line, separator)
-        # write the score
-        data_line = add_to_data_line(frameid, frameid2score, data_line, separator)
-        # write the duration
-        data_line = add_to_data_line(frameid, frameid2duration, data_line, separator)
-        # write the unclipped_reward
-        data_line = add_to_data_line(frameid, frameid2unclipped_reward, data_line, separator)
-        # write the action
-        data_line = add_to_data_line(frameid, frameid2action, data_line, separator)
-        # write the pos (use space as separator)
-        if frameid in frameid2pos:
-            pos_list = frameid2pos[frameid]
-            n_pos = len(pos_list)
-            if n_pos == 0:
-                data_line += 'null'
-            else:
-                for i in range(0, n_pos):
-                    data_line = data_line + format(pos_list[i][0]/8.0, '.2f') + pos_separator + format(pos_list[i][1]/4.0, '.2f')
-                    if i < n_pos-1:
-                        data_line += pos_separator
-        else:
-            data_line += 'null'
-        # write the line to the csv file
-        csv_file.write(data_line + '\n')
-    # close the file
-    csv_file.close()
+        csv_file.write(CSV_TITLES)
 
-    # return the meta data
+    chunk = []
+    for frame in frames:
+        if frame[0] == gaze_trial.BEFORE_FIRST_FRAME:
+            continue
+        chunk.append(frame)
+        if len(chunk) == WRITE_CHUNK_FRAMES:
+            write_gaze_trial_to_csv(make_gaze_trial_of_frames(chunk), csv_file)
+            chunk = []
+    if len(chunk) > 0:
+        write_gaze_trial_to_csv(make_gaze_trial_of_frames(chunk), csv_file)
+    csv_file.close()
     return file_meta_data
 
 
-def save_asc_files_in_dir_to_csv(asc_dir, saved_dir, fname_regex='.', is_include_title=True, saved_as_plain_txt=True, saved_to_excel=True):
+def save_gaze_trial_asc_file_to_csv(fname, saved_dir, is_include_title=True, saved_as_plain_txt=True,
+                                    is_interactive=True, saved_as_binary=False, event_method=None, saved_samples=False,
+                                    profiler=None):
+    """ Same as save_gaze_data_asc_file_to_csv, but returns the parsed trial (a GazeTrial with the meta data),
+        so that it can be used without reading the saved files again.
+        If event_method is set ('ivt' or 'idt'), the fixations and saccades are detected in the gaze samples and
+        the per-frame event columns are saved to an events file (and kept in trial.frame_events).
+        If saved_samples is set, the timestamp, position and pupil size of each gaze sample are saved to a samples
+        file (see save_gaze_samples). The samples are recorded in the same pass that parses the asc file.
+        If profiler is a stage_profiler.StageProfiler, the cost of each stage is recorded in it. """
+    sample_buffer = gaze_samples.SampleBuffer() if event_method is not None or saved_samples else None
+    with stage_profiler.measure(profiler, 'parse') as record:
+        line_counts = profiler.line_counts if profiler is not None else None
+        gaze_data = data_reader.read_gaze_data_asc_file(fname, is_interactive, sample_buffer, line_counts)
+        if profiler is not None:
+            record['bytes_read'] = os.path.getsize(fname)
+            record['n_line'] = sum(line_counts.values())
+
+    # create the saved_dir if not exists
+    if not os.path.exists(saved_dir):
+        os.makedirs(saved_dir)
+
+    with stage_profiler.measure(profiler, 'write_csv') as record:
+        # create the csv file (saved as txt file)
+        csv_fname = get_csv_fname(fname, saved_as_plain_txt)
+        csv_fpath = os.path.join(saved_dir, csv_fname)
+        csv_file = open(csv_fpath, 'w', CSV_BUFFER_SIZE)
+
+        # write the title information if is_include_title is set
+        if is_include_title:
+            csv_file.write(CSV_TITLES)
+
+        # save the data to the file (keep the gazes in float64 so the output is the same as formatting the floats)
+        trial = gaze_trial.make_gaze_trial(gaze_data, np.float64)
+        write_gaze_trial_to_csv(trial, csv_file)
+        # close the file
+        csv_file.close()
+        if profiler is not None:
+            record['bytes_written'] = os.path.getsize(csv_fpath)
+            record['n_line'] = len(trial) + (1 if is_include_title else 0)
+
+    if saved_as_binary:
+        with stage_profiler.measure(profiler, 'write_npz') as record:
+            npz_fpath = os.path.join(saved_dir, get_npz_fname(fname))
+            save_gaze_trial_to_npz(trial, npz_fpath)
+            if profiler is not None:
+                record['bytes_written'] = os.path.getsize(npz_fpath)
+
+    if sample_buffer is not None:
+        with stage_profiler.measure(profiler, 'samples') as record:
+            samples = gaze_samples.make_gaze_samples(sample_buffer, len(trial))
+            # free the buffers of the samples (the arrays are kept)
+            sample_buffer = None
+            if saved_samples:
+                samples_fpath = os.path.join(saved_dir, get_samples_fname(fname))
+                save_gaze_samples(samples, samples_fpath)
+                if profiler is not None:
+                    record['bytes_written'] = os.path.getsize(samples_fpath)
+    if event_method is not None:
+        with stage_profiler.measure(profiler, 'events') as record:
+            events = gaze_events.detect_events(samples, event_method)
+            trial.frame_events = gaze_events.compute_frame_events(events, len(trial))
+            events_fpath = os.path.join(saved_dir, get_events_fname(fname))
+            gaze_events.write_frame_events([format_frameid(frameid) for frameid in trial.frameid_list],
+                                           trial.frame_events, events_fpath)
+            if profiler is not None:
+                record['bytes_written'] = os.path.getsize(events_fpath)
+                record['n_line'] = len(trial) + 1
+
+    return trial
+
+
+def convert_trial(fpath, saved_dir, options, is_interactive, is_stat, profiler=None, is_streamed=False):
+    """ Convert the asc file and compute the statistics of the trial if is_stat is set.
+        If is_streamed is set, the csv file is written in constant memory (see stream_gaze_asc_file_to_csv), the
+        other outputs and the statistics are not available.
+        If options['saved_index'] is set, the frame index of the csv file is saved (see save_frame_index).
+        Returns the meta data of the trial and its statistics """
+    trial_stat = None
+    if is_streamed:
+        with stage_profiler.measure(profiler, 'stream') as record:
+            line_counts = profiler.line_counts if profiler is not None else None
+            file_meta_data = stream_gaze_asc_file_to_csv(fpath, saved_dir, options['is_include_title'],
+                                                         options['saved_as_plain_txt'], is_interactive, line_counts)
+            if profiler is not None:
+                record['bytes_read'] = os.path.getsize(fpath)
+                record['bytes_written'] = os.path.getsize(
+                    os.path.join(saved_dir, get_csv_fname(fpath, options['saved_as_plain_txt'])))
+                record['n_line'] = sum(line_counts.values())
+    else:
+        trial = save_gaze_trial_asc_file_to_csv(fpath, saved_dir, options['is_include_title'],
+                                                options['saved_as_plain_txt'], is_interactive,
+                                                options['saved_as_binary'], options.get('event_method'),
+                                                options.get('saved_samples', False), profiler)
+        file_meta_data = trial.file_meta_data
+        # the statistics only need the per-frame columns, which are already in memory
+        if is_stat:
+            with stage_profiler.measure(profiler, 'stat'):
+                trial_stat = data_stat.compute_trial_stat(trial)
+                if trial.frame_events is not None:
+                    trial_stat.update(gaze_events.compute_trial_event_stat(trial.frame_events))
+
+    if options.get('saved_index', False):
+        with stage_profiler.measure(profiler, 'write_index') as record:
+            index_fpath = os.path.join(saved_dir, get_index_fname(fpath))
+            save_frame_index(os.path.join(saved_dir, get_csv_fname(fpath, options['saved_as_plain_txt'])),
+                             index_fpath)
+            if profiler is not None:
+                record['bytes_written'] = os.path.getsize(index_fpath)
+    return file_meta_data, trial_stat
+
+
+def convert_asc_file(task):
+    """ Convert one asc file (run in a worker process when n_workers > 1).
+        Returns (fname, trial_id, file_meta_data, error, file_record, trial_stat, file_profile), error is the traceback
+        if the conversion failed, file_record is the size, mtime and hash of the source file
+        (see rebuild_manifest.make_file_record), trial_stat is the statistics of the trial if is_stat is set
+        (see data_stat.compute_trial_stat), file_profile is the cost of each stage if is_profile is set
+        (see stage_profiler.StageProfiler.to_dict).
+        If cprofile_fpath is set, the conversion is run with cProfile and the statistics are saved to this file.
+        is_streamed: see convert_trial """
+    fname, fpath, saved_dir, options, is_interactive, is_stat, is_profile, cprofile_fpath, is_streamed = task
+    print('Processing asc file: ' + fpath)
+    profiler = stage_profiler.StageProfiler(fname) if is_profile else None
+    file_profile = None
+    try:
+        trial_id = int(fname.split('_')[0])
+        # record the source file before reading it, so a change during the conversion is detected next time
+        file_record = rebuild_manifest.make_file_record(fpath)
+        args = (fpath, saved_dir, options, is_interactive, is_stat, profiler, is_streamed)
+        if cprofile_fpath is not None:
+            file_meta_data, trial_stat = stage_profiler.run_cprofile(convert_trial, args, cprofile_fpath)
+        else:
+            file_meta_data, trial_stat = convert_trial(*args)
+        if profiler is not None:
+            file_profile = profiler.to_dict()
+        return fname, trial_id, file_meta_data, None, file_record, trial_stat, file_profile
+    except Exception:
+        return fname, None, None, traceback.format_exc(), None, None, None
+
+
+def get_cached_trial_stat(entry, saved_dir):
+    """ Return the statistics of a skipped (unchanged) file: from its manifest entry, or computed from
+        its output file if the entry has none """
+    if 'trial_stat' not in entry:
+        npz_fnames = [fname for fname in entry['output_fnames'] if fname.endswith('.npz')]
+        output_fname = npz_fnames[0] if len(npz_fnames) > 0 else entry['output_fnames'][0]
+        entry['trial_stat'] = data_stat.compute_trial_stat(
+            data_reader.read_gaze_trial_file(os.path.join(saved_dir, output_fname)))
+        events_fnames = [fname for fname in entry['output_fnames'] if fname.endswith('.events')]
+        if len(events_fnames) > 0:
+            entry['trial_stat'].update(data_stat.compute_trial_event_stat_of_file(
+                os.path.join(saved_dir, events_fnames[0])))
+    return entry['trial_stat']
+
+
+def compute_other_trial_stats(saved_dir, fname_regex, trial_ids, is_event_stat, n_workers=1):
+    """ The statistics of the trial files in saved_dir whose trial id isn't in trial_ids (e.g. converted from another
+        asc directory), read from the files like data_stat.do_per_trial_stat. The event statistics are added to the
+        trials that have an events file if is_event_stat is set. Returns a dictionary trial id -> statistics """
+    fnames = data_stat.list_stat_files(saved_dir, fname_regex,
+                                       lambda fname: int(fname.split('_')[0]) not in trial_ids)
+    tasks = []
+    for fname in fnames:
+        fpath = os.path.join(saved_dir, fname)
+        tasks.append((fpath, False, is_event_stat and os.path.exists(data_stat.get_events_fpath(fpath)), False))
+    return dict([result[:2] for result in utils.map_in_processes(data_stat.do_trial_stat_of_file, tasks, n_workers)])
+
+
+def save_asc_files_in_dir_to_csv(asc_dir, saved_dir, fname_regex='.', is_include_title=True, saved_as_plain_txt=True,
+                                 saved_to_excel=True, n_workers=1, is_incremental=True, saved_as_binary=False,
+                                 is_stat=False, event_method=None, saved_samples=False, profile_fpath=None,
+                                 cprofile_fname=None, is_streamed=False, saved_summary_csv=False, saved_index=False):
+    """ Convert all the asc files in asc_dir. If n_workers > 1, the files are converted in a process pool.
+        The meta data is saved in the order of trial id. A file that fails is reported and skipped.
+        If is_incremental is set, the files that haven't changed since the last run (with the same options) are
+        not converted again, and their meta data is taken from the manifest in saved_dir.
+        If saved_as_binary is set, each trial is also saved as a binary npz file (see save_gaze_trial_to_npz).
+        If event_method is set ('ivt' or 'idt'), the fixations and saccades of each trial are detected and saved to
+        an events file (see save_gaze_trial_asc_file_to_csv).
+        If saved_samples is set, the gaze samples of each trial are saved to a samples file (see save_gaze_samples).
+        If saved_index is set, the frame index of each csv file is saved to an index file (see save_frame_index).
+        If is_stat is set, the statistics of each trial are computed from the parsed data while converting, and
+        saved the same way as data_stat.do_per_trial_stat (the saved files are not read again), with the event
+        statistics if event_method is set. Like data_stat.do_per_trial_stat on saved_dir, the statistics also cover
+        the other trial files of saved_dir (not converted from asc_dir), which are read (see
+        compute_other_trial_stats).
+        If profile_fpath is set, the cost of each stage of each file and of the whole run is saved to this JSON file
+        (see stage_profiler.save_report).
+        If cprofile_fname is set, this asc file is converted again (even if it is unchanged) with cProfile, and the
+        statistics are saved to <saved_dir>/<cprofile_fname>.prof
+        If is_streamed is set, the csv files are written in constant memory (see stream_gaze_asc_file_to_csv). It
+        can't be used with saved_as_binary, event_method, saved_samples and is_stat, which need the whole trial.
+        If saved_summary_csv is set, the meta data (and the statistics) are also saved to CSV files next to the Excel
+        files (see utils.save_trials_data_to_excel).
+        The trials are recorded in the trial catalog of saved_dir (see trial_catalog.update_catalog). """
+    if is_streamed and (saved_as_binary or event_method is not None or saved_samples or is_stat):
+        raise ValueError('The streaming mode only writes the csv files (no binary, events, samples or statistics)')
     # create the saved_dir if not exists (to store meta data)
     if not os.path.exists(saved_dir):
         os.makedirs(saved_dir)
@@ -98,26 +467,131 @@ def save_asc_files_in_dir_to_csv(asc_dir, saved_dir, fname_regex='.', is_include
     str_timestamp = str(int(time.time() * 1000))
     fname_meta_data = str_timestamp + '_meta.txt'
     meta_fpath = os.path.join(saved_dir, fname_meta_data)
-    meta_file = open(meta_fpath, 'w')
 
     meta_data_dict = {}
     fname_meta_excel = str_timestamp + '_meta.xlsx'
 
+    manifest = rebuild_manifest.load_manifest(saved_dir)
+    options = {'is_include_title': is_include_title, 'saved_as_plain_txt': saved_as_plain_txt,
+               'saved_as_binary': saved_as_binary}
+    if event_method is not None:
+        # only added when set, so the files converted without events by an older version are still up to date
+        options['event_method'] = event_method
+    if saved_samples:
+        options['saved_samples'] = True
+    if saved_index:
+        options['saved_index'] = True
+
+    is_profile = profile_fpath is not None
+    run_profiler = stage_profiler.StageProfiler('run') if is_profile else None
+
     fname_format = re.compile(fname_regex)
-    for fname in os.listdir(asc_dir):
+    tasks = []
+    cached_results = []
+    for fname in sorted(os.listdir(asc_dir)):
         if fname.endswith(".asc") and fname_format.match(fname):
             fpath = os.path.join(asc_dir, fname)
-            print('Processing asc file: ' + fpath)
-            file_meta_data = save_gaze_data_asc_file_to_csv(fpath, saved_dir, is_include_title, saved_as_plain_txt)
-            # write the meta data
-            trial_id = int(fname.split('_')[0])
+            entry = manifest.get(os.path.abspath(fpath))
+            is_cprofile = fname == cprofile_fname
+            if is_incremental and not is_cprofile and rebuild_manifest.is_up_to_date(entry, fpath, options, saved_dir):
+                print('Skipping unchanged asc file: ' + fpath)
+                trial_stat = get_cached_trial_stat(entry, saved_dir) if is_stat else None
+                cached_results.append((fname, entry['trial_id'], entry['file_meta_data'], None, None, trial_stat,
+                                       None))
+                continue
+            cprofile_fpath = os.path.join(saved_dir, fname + '.prof') if is_cprofile else None
+            # the batch conversion never waits for a key press (the sanity check only warns), with any number of
+            # workers, so a short trial is converted the same way in sequential and pooled runs
+            tasks.append((fname, fpath, saved_dir, options, False, is_stat, is_profile, cprofile_fpath,
+                          is_streamed))
+    if cprofile_fname is not None and all(task[0] != cprofile_fname for task in tasks):
+        print('Warning: %s is not one of the asc files to convert, nothing is profiled with cProfile' % cprofile_fname)
+
+    with stage_profiler.measure(run_profiler, 'convert'):
+        if n_workers > 1:
+            pool = multiprocessing.Pool(n_workers)
+            try:
+                results = list(pool.imap_unordered(convert_asc_file, tasks))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [convert_asc_file(task) for task in tasks]
+
+    # update the manifest with the converted files
+    for fname, trial_id, file_meta_data, error, file_record, trial_stat, _ in results:
+        if error is None:
+            output_fnames = get_output_fnames(fname, saved_as_plain_txt, saved_as_binary, event_method, saved_samples,
+                                              saved_index)
+            manifest[os.path.abspath(os.path.join(asc_dir, fname))] = rebuild_manifest.make_entry(
+                file_record, options, output_fnames, trial_id, file_meta_data, trial_stat)
+    rebuild_manifest.save_manifest(saved_dir, manifest)
+    results += cached_results
+
+    # collect the meta data in the order of trial id
+    failed_results = [result for result in results if result[3] is not None]
+    succeeded_results = sorted([result for result in results if result[3] is None], key=lambda result: result[1])
+    for fname, trial_id, file_meta_data, _, _, _, _ in succeeded_results:
+        meta_data_dict[trial_id] = file_meta_data
+
+    # record all the trials in the trial catalog (the old values of the converted trials are replaced)
+    with stage_profiler.measure(run_profiler, 'catalog'):
+        converted_records = []
+        skipped_records = []
+        for fname, trial_id, file_meta_data, _, file_record, trial_stat, _ in succeeded_results:
+            asc_path = os.path.abspath(os.path.join(asc_dir, fname))
+            record = trial_catalog.make_trial_record(fname, file_meta_data, trial_stat,
+                                                     manifest[asc_path]['output_fnames'], asc_path)
+            (skipped_records if file_record is None else converted_records).append(record)
+        catalog_fpath = trial_catalog.get_catalog_fpath(saved_dir)
+        trial_catalog.update_catalog(catalog_fpath, converted_records, is_replaced=True)
+        trial_catalog.update_catalog(catalog_fpath, skipped_records)
+
+    # write the meta data
+    with stage_profiler.measure(run_profiler, 'write_meta') as record:
+        meta_file = open(meta_fpath, 'w')
+        for fname, trial_id, file_meta_data, _, _, _, _ in succeeded_results:
             meta_file.write('\'' + str(trial_id) + '\'' + ':' + str(file_meta_data) + '\n')
-            meta_data_dict[trial_id] = file_meta_data
-    # close the meta data file
-    meta_file.close()
+        # close the meta data file
+        meta_file.close()
+        if is_profile:
+            record['bytes_written'] = os.path.getsize(meta_fpath)
+            record['n_line'] = len(succeeded_results)
     # save the mata data to excel file
     if saved_to_excel:
-        utils.save_trials_data_to_excel(saved_dir, fname_meta_excel, meta_data_dict)
+        with stage_profiler.measure(run_profiler, 'excel') as record:
+            utils.save_trials_data_to_excel(saved_dir, fname_meta_excel, meta_data_dict, saved_summary_csv)
+            if is_profile:
+                record['bytes_written'] = os.path.getsize(os.path.join(saved_dir, fname_meta_excel))
+
+    # report the failed files
+    for fname, _, _, error, _, _, _ in sorted(failed_results):
+        print('Error: failed to process asc file %s' % fname)
+        print(error)
+    if len(failed_results) > 0:
+        print('%d of %d asc files failed.' % (len(failed_results), len(results)))
+
+    if is_stat:
+        stat_dict = {}
+        for fname, trial_id, _, _, _, trial_stat, _ in succeeded_results:
+            stat_dict[trial_id] = trial_stat
+        with stage_profiler.measure(run_profiler, 'stat_files'):
+            stat_fname_regex = data_stat.BINARY_FNAME_REGEX if saved_as_binary else data_stat.CSV_FNAME_REGEX
+            other_stat_dict = compute_other_trial_stats(saved_dir, stat_fname_regex, set(stat_dict.keys()),
+                                                        event_method is not None, n_workers)
+            stat_dict.update(other_stat_dict)
+            records = []
+            for trial_id in sorted(other_stat_dict.keys()):
+                record = dict(other_stat_dict[trial_id])
+                record['trial_id'] = trial_id
+                records.append(record)
+            trial_catalog.update_catalog(catalog_fpath, records)
+        with stage_profiler.measure(run_profiler, 'stat_report'):
+            data_stat.report_trial_stat(stat_dict, saved_dir, saved_summary_csv)
+
+    if is_profile:
+        file_profiles = [result[6] for result in sorted(results) if result[6] is not None]
+        stage_profiler.save_report(profile_fpath, file_profiles, run_profiler.to_dict())
     return meta_data_dict
 
 
@@ -134,8 +608,21 @@ def do_testing():
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print('Usage: python data_cleaning.py source_dir dest_dir [whether to include titles in txt file]')
+    n_workers = utils.pop_int_option(sys.argv, '--workers', 1)
+    is_rebuild = utils.pop_flag(sys.argv, '--rebuild')
+    is_binary = utils.pop_flag(sys.argv, '--binary')
+    is_samples = utils.pop_flag(sys.argv, '--samples')
+    event_method = utils.pop_option(sys.argv, '--events', None, str, 'ivt or idt')
+    profile_fpath = utils.pop_option(sys.argv, '--profile', None, str, 'a report file')
+    cprofile_fname = utils.pop_option(sys.argv, '--cprofile', None, str, 'an asc file name')
+    is_streamed = utils.pop_flag(sys.argv, '--stream')
+    is_summary_csv = utils.pop_flag(sys.argv, '--summary-csv')
+    is_index = utils.pop_flag(sys.argv, '--index')
+    if len(sys.argv) < 3 or event_method not in (None,) + gaze_events.EVENT_METHODS:
+        print('Usage: python data_cleaning.py source_dir dest_dir [whether to include titles in txt file] [--workers N] [--rebuild] [--binary] [--events ivt|idt] [--samples] [--index] [--profile report.json] [--cprofile asc_fname] [--stream] [--summary-csv]')
+        exit(1)
+    if is_streamed and (is_binary or event_method is not None or is_samples):
+        print('--stream only writes the txt files, it can\'t be used with --binary, --events or --samples')
         exit(1)
 
     source_dir = sys.argv[1]
@@ -150,6 +637,10 @@ if __name__ == '__main__':
             print('For the third argument, please use True or False')
             exit(1)
 
-    save_asc_files_in_dir_to_csv(source_dir, dest_dir, is_include_title=include_title)
+    save_asc_files_in_dir_to_csv(source_dir, dest_dir, is_include_title=include_title, n_workers=n_workers,
+                                 is_incremental=not is_rebuild, saved_as_binary=is_binary, event_method=event_method,
+                                 saved_samples=is_samples, profile_fpath=profile_fpath,
+                                 cprofile_fname=cprofile_fname, is_streamed=is_streamed,
+                                 saved_summary_csv=is_summary_csv, saved_index=is_index)
 
 
@@ -2,128 +2,250 @@
 #
 # Read gaze dataset from asc file or csv file
 # -----------------------
-import os, re, threading, time
+import os, re, gc, json, struct, time, hashlib, warnings, zipfile
+from itertools import islice
 import numpy as np
-from IPython import embed
-from scipy import misc
+import gaze_samples
+import gaze_trial
 
+try:
+    input = raw_input  # Python 2 (its input evaluates the line)
+except NameError:
+    pass
 
-def read_gaze_data_asc_file(fname):
+
+# number of lines parsed at a time by the csv reader
+CSV_CHUNK_LINES = 65536
+# number of bytes hashed at the start and at the end of a trial file, to detect a change since it was indexed
+INDEX_DIGEST_BYTES = 1 << 16
+# regex for floating point numbers
+freg = r"[-+]?[0-9]*\.?[0-9]+"
+# regex for starting message
+scr_msg = re.compile(r"MSG\s+(\d+)\s+SCR_RECORDER FRAMEID (\d+) UTID (\w+)")
+# regex for action message
+act_msg = re.compile(r"MSG\s+(\d+)\s+key_pressed atari_action (\d+)")
+# regex for reward message
+reward_msg = re.compile(r"MSG\s+(\d+)\s+reward (\d+)")
+# regex for episode message
+episode_msg = re.compile(r"MSG\s+(\d+)\s+episode (\d+)")
+# regex for score message
+score_msg = re.compile(r"MSG\s+(\d+)\s+score (\d+)")
+# regex for meta data (validation)
+validation_msg = re.compile(r"MSG\s+(\d+)\s+!CAL\sVALIDATION.+ERROR\s+(%s)\s+avg\.\s+(%s)\s+max\s+OFFSET.+" % (freg, freg))
+# the branches of the asc parser, to count the lines of each (other_msg: the messages that are not used)
+MSG_BRANCHES = ('frame', 'action', 'reward', 'episode', 'score', 'validation')
+LINE_BRANCHES = ('sample', 'missing_sample') + MSG_BRANCHES + ('other_msg', 'other')
+
+
+# the regex and the branch of each message keyword (the third token of a message line)
+MSG_REGEXES = {'SCR_RECORDER': (scr_msg, 'frame'), 'key_pressed': (act_msg, 'action'), 'reward': (reward_msg, 'reward'),
+               'episode': (episode_msg, 'episode'), 'score': (score_msg, 'score'),
+               '!CAL': (validation_msg, 'validation')}
+
+
+def read_gaze_data_asc_file(fname, is_interactive=True, samples=None, line_counts=None):
     """ This function reads a ASC file and returns
         a dictionary mapping frame ID to a list of gaze positions,
-        a dictionary mapping frame ID to action """
+        a dictionary mapping frame ID to action
+        If is_interactive is False, the sanity check only prints a warning instead of waiting for a key press.
+        If samples is a gaze_samples.SampleBuffer, the timestamp, x, y, pupil size and frame index (in frameid_list)
+        of each gaze sample are appended to it.
+        If line_counts is a dictionary, the number of lines matched by each branch (see LINE_BRANCHES) is added to it.
 
-    with open(fname, 'r') as f:
-        lines = f.readlines()
-    frameid, xpos, ypos = 'BEFORE-FIRST-FRAME', None, None
-    frameid2pos = {frameid: []}
-    frameid2action = {frameid: None}
-    frameid2duration = {frameid: None}
-    frameid2unclipped_reward = {frameid: None}
-    frameid2episode = {frameid: None}
-    frameid2score = {frameid: None}
-    file_meta_data = {'avg_error': None, 'max_error': None, 'low_sample_rate': None, 'total_frame': None}
+        The frames are parsed by iter_gaze_frames_asc_file. The 'BEFORE-FIRST-FRAME' has an entry (None) in every
+        dictionary, the other frames only have the durations, rewards, episodes and scores that are recorded. """
+    before_first_frame = gaze_trial.BEFORE_FIRST_FRAME
+    frameid2pos = {}
+    frameid2action = {}
+    frameid2duration = {}
+    frameid2unclipped_reward = {before_first_frame: None}
+    frameid2episode = {before_first_frame: None}
+    frameid2score = {before_first_frame: None}
+    file_meta_data = {}
     # frame id list (exclude the 'BEFORE-FIRST-FRAME')
     frameid_list = []
+
+    # building millions of gaze tuples triggers many useless collections, pause the garbage collector
+    is_gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for frameid, pos_list, action, duration, unclipped_reward, episode, score in \
+                iter_gaze_frames_asc_file(fname, is_interactive, samples, line_counts, file_meta_data):
+            # a repeated frame id keeps the values that its last frame doesn't have, and its first reward
+            frameid2pos[frameid] = pos_list
+            frameid2action[frameid] = action
+            if duration is not None:
+                frameid2duration[frameid] = duration
+            if unclipped_reward is not None:
+                if frameid in frameid2unclipped_reward:
+                    print ("Warning: there is more than 1 reward for frame id %s. Not supposed to happen." % str(frameid))
+                else:
+                    frameid2unclipped_reward[frameid] = unclipped_reward
+            if episode is not None:
+                frameid2episode[frameid] = episode
+            if score is not None:
+                frameid2score[frameid] = score
+            if frameid is not before_first_frame:
+                frameid_list.append(frameid)
+    finally:
+        if is_gc_enabled:
+            gc.enable()
+
+    return frameid2pos, frameid2action, frameid2duration, frameid2unclipped_reward, frameid2episode, frameid2score, frameid_list, file_meta_data
+
+
+def iter_gaze_frames_asc_file(fname, is_interactive=True, samples=None, line_counts=None, file_meta_data=None):
+    """ Stream the frames of an ASC file. Yields (frameid, pos_list, action, duration, unclipped_reward, episode,
+        score) of each frame as soon as the next frame starts (the duration of a frame is the time to the next
+        frame), so only the current frame is kept in memory. None is used for the values that are not recorded.
+        The first record is the gazes before the first frame (frameid 'BEFORE-FIRST-FRAME'). The last frame is
+        yielded at the end of the file without its gazes (the game has ended but the eye tracker keeps recording)
+        and without its duration.
+        If file_meta_data is a dictionary, the meta data of the file is set in it when all the frames are read
+        (avg_error, max_error, low_sample_rate, total_frame).
+        is_interactive, samples and line_counts: see read_gaze_data_asc_file.
+
+        The file is streamed line by line. Each line is dispatched on its first token: the gaze samples (a digit)
+        are split on whitespace, and for the messages ('MSG' plus the message keyword) only the one regex that can
+        match the line is applied (see parse_msg_line). """
+    if file_meta_data is None:
+        file_meta_data = {}
+    file_meta_data.update([('avg_error', None), ('max_error', None), ('low_sample_rate', None), ('total_frame', None)])
+
+    # the data of the current frame
+    frameid = gaze_trial.BEFORE_FIRST_FRAME
+    pos_list = []
+    action = unclipped_reward = episode = score = None
     start_timestamp = 0
-    # regex for starting message
-    scr_msg = re.compile(r"MSG\s+(\d+)\s+SCR_RECORDER FRAMEID (\d+) UTID (\w+)")
-    # regex for floating point numbers
-    freg = r"[-+]?[0-9]*\.?[0-9]+"
-    # regex for gaze message
-    gaze_msg = re.compile(r"(\d+)\s+(%s)\s+(%s)" % (freg, freg))
-    # regex for action message
-    act_msg = re.compile(r"MSG\s+(\d+)\s+key_pressed atari_action (\d+)")
-    # regex for reward message
-    reward_msg = re.compile(r"MSG\s+(\d+)\s+reward (\d+)")
-    # regex for episode message
-    episode_msg = re.compile(r"MSG\s+(\d+)\s+episode (\d+)")
-    # regex for score message
-    score_msg = re.compile(r"MSG\s+(\d+)\s+score (\d+)")
-    # regex for meta data (validation)
-    validation_msg = re.compile(r"MSG\s+(\d+)\s+!CAL\sVALIDATION.+ERROR\s+(%s)\s+avg\.\s+(%s)\s+max\s+OFFSET.+" % (freg, freg))
-
-    for (i, line) in enumerate(lines):
-        match_sample = gaze_msg.match(line)
-        if match_sample:
-            timestamp, xpos, ypos = match_sample.group(1), match_sample.group(2), match_sample.group(3)
-            xpos, ypos = float(xpos), float(ypos)
-            frameid2pos[frameid].append((xpos, ypos))
-            continue
+    # index of the current frame in the frame id list (-1 before the first frame)
+    frame_index = -1
+    # whether the last frame of each frame id (with the 'BEFORE-FIRST-FRAME') has less than 10 gazes: a repeated frame
+    # id is counted once, as in the dictionaries of read_gaze_data_asc_file
+    frameid2few = {}
+    # number of lines of each branch, counted only in the branches of the rare lines (the samples are counted per frame)
+    branch_counts = dict((branch, 0) for branch in LINE_BRANCHES)
+    n_sample = 0
+    n_msg = 0
 
-        match_scr_msg = scr_msg.match(line)
-        # when a new id is encountered
-        if match_scr_msg:
-            old_frameid = frameid
-            timestamp, frameid, UTID = match_scr_msg.group(1), match_scr_msg.group(2), match_scr_msg.group(3)
-            frameid2duration[old_frameid] = int(timestamp) - start_timestamp
-            start_timestamp = int(timestamp)
-            frameid = make_unique_frame_id(UTID, frameid)
-            frameid_list.append(frameid)
-            frameid2pos[frameid] = []
-            frameid2action[frameid] = None
-            continue
+    with open(fname, 'r') as f:
+        for line in f:
+            # gaze sample: the line starts with the timestamp, split on whitespace instead of matched with a regex
+            # (timestamp, x, y, pupil size, ...)
+            if line[:1].isdigit():
+                tokens = line.split(None, 4)
+                try:
+                    pos = (float(tokens[1]), float(tokens[2]))
+                except (ValueError, IndexError):
+                    # the gaze position of a missing sample is '.'
+                    branch_counts['missing_sample'] += 1
+                    continue
+                pos_list.append(pos)
+                if samples is not None:
+                    samples.append(int(tokens[0]), pos[0], pos[1], parse_pupil_size(tokens), frame_index)
+                continue
 
-        match_action = act_msg.match(line)
-        if match_action:
-            timestamp, action_label = match_action.group(1), match_action.group(2)
-            if frameid2action[frameid] is None:
-                frameid2action[frameid] = int(action_label)
-            else:
-                print ("Warning: there is more than 1 action for frame id %s. Not supposed to happen." % str(frameid))
-            continue
+            # all other useful lines are messages: MSG timestamp keyword ...
+            if not line.startswith('MSG'):
+                branch_counts['other'] += 1
+                continue
+            n_msg += 1
+            branch, groups = parse_msg_line(line)
+            if branch is None:
+                continue
+            branch_counts[branch] += 1
 
-        match_reward = reward_msg.match(line)
-        if match_reward:
-            timestamp, reward = match_reward.group(1), match_reward.group(2)
-            if frameid not in frameid2unclipped_reward:
-                frameid2unclipped_reward[frameid] = int(reward)
-            else:
-                print ("Warning: there is more than 1 reward for frame id %s. Not supposed to happen." % str(frameid))
-            continue
+            # when a new id is encountered, the current frame is complete
+            if branch == 'frame':
+                n_sample += len(pos_list)
+                frameid2few[frameid] = len(pos_list) < 10
+                timestamp = int(groups[0])
+                yield frameid, pos_list, action, timestamp - start_timestamp, unclipped_reward, episode, score
+                start_timestamp = timestamp
+                frameid = make_unique_frame_id(groups[2], groups[1])
+                frame_index += 1
+                pos_list = []
+                action = unclipped_reward = episode = score = None
 
-        match_episode = episode_msg.match(line)
-        if match_episode:
-            timestamp, episode = match_episode.group(1), match_episode.group(2)
-            assert frameid not in frameid2episode, "ERROR: there is more than 1 episode for frame id %s. Not supposed to happen." % str(frameid)
-            frameid2episode[frameid] = int(episode)
-            continue
+            elif branch == 'action':
+                if action is None:
+                    action = int(groups[1])
+                else:
+                    print ("Warning: there is more than 1 action for frame id %s. Not supposed to happen." % str(frameid))
 
-        match_score = score_msg.match(line)
-        if match_score:
-            timestamp, score = match_score.group(1), match_score.group(2)
-            assert frameid not in frameid2score, "ERROR: there is more than 1 score for frame id %s. Not supposed to happen." % str(
-                frameid)
-            frameid2score[frameid] = int(score)
-            continue
+            # the 'BEFORE-FIRST-FRAME' has no reward, episode and score (they are None by default)
+            elif branch == 'reward':
+                if unclipped_reward is None and frame_index >= 0:
+                    unclipped_reward = int(groups[1])
+                else:
+                    print ("Warning: there is more than 1 reward for frame id %s. Not supposed to happen." % str(frameid))
 
-        match_validation = validation_msg.match(line)
-        if match_validation:
-            avg_error, max_error = match_validation.group(2), match_validation.group(3)
-            # replace the old value since we will only use the validation data after the last frame
-            file_meta_data['avg_error'] = float(avg_error)
-            file_meta_data['max_error'] = float(max_error)
-            continue
+            elif branch == 'episode':
+                assert episode is None and frame_index >= 0, "ERROR: there is more than 1 episode for frame id %s. Not supposed to happen." % str(frameid)
+                episode = int(groups[1])
+
+            elif branch == 'score':
+                assert score is None and frame_index >= 0, "ERROR: there is more than 1 score for frame id %s. Not supposed to happen." % str(
+                    frameid)
+                score = int(groups[1])
 
+            else:
+                # replace the old value since we will only use the validation data after the last frame
+                file_meta_data['avg_error'] = float(groups[1])
+                file_meta_data['max_error'] = float(groups[2])
+
+    add_line_counts(line_counts, branch_counts, n_sample + len(pos_list), n_msg)
     # throw out gazes after the last frame, because the game has ended but eye tracker keeps recording
-    frameid2pos[frameid] = []
+    yield frameid, [], action, None, unclipped_reward, episode, score
+    frameid2few[frameid] = True
+    set_asc_file_meta_data(file_meta_data, frame_index + 1, len(frameid2few), sum(frameid2few.values()),
+                           is_interactive)
+
 
-    if len(frameid2pos) < 1000:     # simple sanity check
-        print ("Warning: did you provide the correct ASC file? Because the data for only %d frames is detected" % (len(frameid2pos)))
-        raw_input("Press any key to continue")
+def parse_msg_line(line):
+    """ Match a message line (MSG timestamp keyword ...) with the regex of its keyword.
+        Returns the branch (see MSG_BRANCHES) and the groups of the match, (None, None) if the message is not used """
+    tokens = line.split(None, 3)
+    if len(tokens) < 3 or tokens[2] not in MSG_REGEXES:
+        return None, None
+    regex, branch = MSG_REGEXES[tokens[2]]
+    match = regex.match(line)
+    if match is None:
+        return None, None
+    return branch, match.groups()
+
+
+def add_line_counts(line_counts, branch_counts, n_sample, n_msg):
+    """ Add the number of lines of each branch to line_counts (if it is not None) """
+    if line_counts is None:
+        return
+    branch_counts['sample'] = n_sample
+    branch_counts['other_msg'] = n_msg - sum([branch_counts[branch] for branch in MSG_BRANCHES])
+    for branch in LINE_BRANCHES:
+        line_counts[branch] = line_counts.get(branch, 0) + branch_counts[branch]
+
+
+def set_asc_file_meta_data(file_meta_data, n_frame, n_frameid, few_cnt, is_interactive):
+    """ Check the number of frames and save the rate of the frames with few gazes and the number of frames to the
+        meta data. n_frame: the number of frames in frameid_list, n_frameid and few_cnt: the number of distinct frame
+        ids, and of those that have less than 10 gazes (with the 'BEFORE-FIRST-FRAME') """
+    if n_frameid < 1000:     # simple sanity check (with the 'BEFORE-FIRST-FRAME')
+        print ("Warning: did you provide the correct ASC file? Because the data for only %d frames is detected" % n_frameid)
+        if is_interactive:
+            input("Press any key to continue")
 
-    few_cnt = 0
-    n_frame = len(frameid_list)
-    for v in frameid2pos.values():
-        if len(v) < 10:
-            few_cnt += 1
     print ("Warning:  %d frames have less than 10 gaze samples. (%.1f%%, total frame: %d)" %
            (few_cnt, 100.0*few_cnt/n_frame, n_frame))
     # save the values to meta data
     file_meta_data['low_sample_rate'] = "{:.1f}".format(100.0*float(few_cnt)/float(n_frame)) + "%"
     file_meta_data['total_frame'] = n_frame
 
-    return frameid2pos, frameid2action, frameid2duration, frameid2unclipped_reward, frameid2episode, frameid2score, frameid_list, file_meta_data
+
+def parse_pupil_size(tokens):
+    """ The pupil size of a gaze sample split into tokens (NaN if it is not recorded) """
+    try:
+        return float(tokens[3])
+    except (ValueError, IndexError):
+        return float('nan')
 
 
 def make_unique_frame_id(UTID, frameid):
@@ -131,86 +253,332 @@ def make_unique_frame_id(UTID, frameid):
     return (UTID, int(frameid))
 
 
+def parse_csv_numbers(text, n_value, dtype, separator=','):
+    """ Convert the text of n_value numbers (joined by the separator) to an array in one call """
+    if n_value == 0:
+        return np.zeros(0, dtype=dtype)
+    try:
+        with warnings.catch_warnings():
+            # depending on the numpy version, np.fromstring warns or raises when a value is not a number
+            warnings.simplefilter('ignore', DeprecationWarning)
+            numbers = np.fromstring(text, dtype=dtype, sep=separator)
+    except ValueError:
+        numbers = None
+    if numbers is None or len(numbers) != n_value:
+        # raise the same error as converting each value
+        numbers = np.array([dtype(value) for value in text.split(separator)], dtype=dtype)
+    return numbers
+
+
+def parse_csv_column(values):
+    """ Convert a column of strings to an int64 array and a null mask ('null' values) """
+    null_mask = np.array([value == 'null' for value in values], dtype=bool)
+    if null_mask.any():
+        values = ['0' if is_null else value for value, is_null in zip(values, null_mask.tolist())]
+    return parse_csv_numbers(','.join(values), len(values), np.int64), null_mask
+
+
+def parse_csv_lines(lines, separator=',', pos_separator=','):
+    """ Parse the data lines (without the title) of a csv file.
+        Returns frameid_list, a dictionary mapping column name (see gaze_trial.COLUMN_NAMES) to the values,
+        a dictionary mapping column name to the null masks, the flat float64 gaze values (x0, y0, x1, y1, ...),
+        the number of gazes of each frame and the null mask of the gazes.
+        The gazes of all the frames are converted to floats in bulk. """
+    # parse each section: frameid,episode_id,score,duration,unclipped_reward,action,pos
+    data_lines = [line.split(separator, 6) for line in lines]
+    frameid_list = [data_line[0] for data_line in data_lines]
+    columns = {}
+    null_masks = {}
+    for i, name in enumerate(gaze_trial.COLUMN_NAMES):
+        columns[name], null_masks[name] = parse_csv_column([data_line[i + 1] for data_line in data_lines])
+
+    # pos
+    if separator == pos_separator:
+        pos_data_list = [data_line[6] for data_line in data_lines]
+    else:
+        pos_data_list = [data_line[6].split(separator, 1)[0] for data_line in data_lines]
+    gaze_null_mask = np.array([pos_data == 'null' for pos_data in pos_data_list], dtype=bool)
+    n_values = [pos_data.count(pos_separator) + 1 for pos_data in pos_data_list]
+    valid_pos_data_list = []
+    for i, pos_data in enumerate(pos_data_list):
+        if n_values[i] < 2:
+            # null, or a single value (not a position)
+            n_values[i] = 0
+            continue
+        if n_values[i] % 2 == 1:
+            # ignore the last value if there is no pair for it
+            pos_data = pos_data.rsplit(pos_separator, 1)[0]
+            n_values[i] -= 1
+        valid_pos_data_list.append(pos_data)
+    n_gazes = np.array(n_values, dtype=np.int64) // 2
+    gaze_values = parse_csv_numbers(pos_separator.join(valid_pos_data_list), 2 * int(n_gazes.sum()), np.float64,
+                                    pos_separator)
+    return frameid_list, columns, null_masks, gaze_values, n_gazes, gaze_null_mask
+
+
+def read_csv_file_to_arrays(fname, separator=',', pos_separator=','):
+    """ Read a csv file, a chunk of lines at a time, into the arrays of parse_csv_lines """
+    frameid_list = []
+    chunks = []
+    with open(fname, 'r') as f:
+        first_line = f.readline()
+        # for the first line, check if titles (column names) are included
+        lines = [] if 'frame' in first_line or first_line == '' else [first_line]
+        lines.extend(islice(f, CSV_CHUNK_LINES))
+        while len(lines) > 0:
+            chunk = parse_csv_lines(lines, separator, pos_separator)
+            frameid_list.extend(chunk[0])
+            chunks.append(chunk[1:])
+            lines = list(islice(f, CSV_CHUNK_LINES))
+
+    columns = {}
+    null_masks = {}
+    for name in gaze_trial.COLUMN_NAMES:
+        columns[name] = np.concatenate([np.zeros(0, dtype=np.int64)] + [chunk[0][name] for chunk in chunks])
+        null_masks[name] = np.concatenate([np.zeros(0, dtype=bool)] + [chunk[1][name] for chunk in chunks])
+    gaze_values = np.concatenate([np.zeros(0, dtype=np.float64)] + [chunk[2] for chunk in chunks])
+    n_gazes = np.concatenate([np.zeros(0, dtype=np.int64)] + [chunk[3] for chunk in chunks])
+    gaze_null_mask = np.concatenate([np.zeros(0, dtype=bool)] + [chunk[4] for chunk in chunks])
+    return frameid_list, columns, null_masks, gaze_values, n_gazes, gaze_null_mask
+
+
 def read_gaze_data_csv_file(fname, separator=',', pos_separator=','):
     """ This function reads a csv file and returns
             a dictionary mapping frame ID to a list of gaze positions,
             a dictionary mapping frame ID to action """
-    with open(fname, 'r') as f:
-        lines = f.readlines()
-    frameid, xpos, ypos = 'BEFORE-FIRST-FRAME', None, None
-    frameid2pos = {frameid: []}
-    frameid2action = {frameid: None}
-    frameid2duration = {frameid: None}
-    frameid2unclipped_reward = {frameid: None}
-    frameid2episode = {frameid: None}
-    frameid2score = {frameid: None}
-    # frame id list (exclude the 'BEFORE-FIRST-FRAME')
-    frameid_list = []
+    return read_gaze_trial_csv_file(fname, separator, pos_separator, np.float64, gaze_decimals=None).to_gaze_data()
+
+
+def read_gaze_trial_asc_file(fname, gaze_dtype=np.float32, is_interactive=True):
+    """ Read an asc file into a gaze_trial.GazeTrial (columnar NumPy arrays instead of dictionaries) """
+    return gaze_trial.make_gaze_trial(read_gaze_data_asc_file(fname, is_interactive), gaze_dtype)
+
+
+def read_gaze_trial_csv_file(fname, separator=',', pos_separator=',', gaze_dtype=np.float32, gaze_decimals=2):
+    """ Read a csv file into a gaze_trial.GazeTrial (columnar NumPy arrays instead of dictionaries)
+        The gaze positions in the csv file are saved with 2 decimals (gaze_decimals) """
+    return make_gaze_trial_of_arrays(read_csv_file_to_arrays(fname, separator, pos_separator), gaze_dtype,
+                                     gaze_decimals)
+
+
+def make_gaze_trial_of_arrays(arrays, gaze_dtype=np.float32, gaze_decimals=2):
+    """ Convert the arrays of parse_csv_lines to a gaze_trial.GazeTrial """
+    frameid_list, columns, null_masks, gaze_values, n_gazes, gaze_null_mask = arrays
+    gaze_offsets = np.zeros(len(frameid_list) + 1, dtype=np.int64)
+    np.cumsum(n_gazes, out=gaze_offsets[1:])
+    gaze = gaze_values.astype(gaze_dtype).reshape((-1, 2))
+    return gaze_trial.GazeTrial(frameid_list, columns, null_masks, gaze, gaze_offsets, gaze_null_mask,
+                                gaze_decimals=gaze_decimals)
+
+
+def load_npz_arrays(fname):
+    """ Load the arrays of an npz file, memory mapping the arrays stored without compression
+        (np.load reads the whole arrays of an npz file into memory) """
+    arrays = {}
+    with zipfile.ZipFile(fname) as zip_file:
+        with open(fname, 'rb') as f:
+            for info in zip_file.infolist():
+                name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+                if info.compress_type != zipfile.ZIP_STORED:
+                    arrays[name] = np.lib.format.read_array(zip_file.open(info.filename))
+                    continue
+                # skip the local file header to reach the npy data
+                f.seek(info.header_offset)
+                local_header = f.read(30)
+                name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(f)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+                if dtype.hasobject or len(shape) == 0 or int(np.prod(shape)) == 0:
+                    arrays[name] = np.lib.format.read_array(zip_file.open(info.filename))
+                else:
+                    arrays[name] = np.memmap(fname, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                             order='F' if fortran_order else 'C')
+    return arrays
+
+
+def read_gaze_trial_npz_file(fname):
+    """ Read a binary npz file (saved by data_cleaning.save_gaze_trial_to_npz) into a gaze_trial.GazeTrial.
+        The arrays are memory mapped, so only the data that is used is read from the disk.
+        The gazes are float32, with the 2 decimals of the csv file (gaze_decimals) """
+    arrays = load_npz_arrays(fname)
+    columns = {}
+    null_masks = {}
+    for name in gaze_trial.COLUMN_NAMES:
+        columns[name] = arrays[name]
+        null_masks[name] = arrays['null_' + name]
+    return gaze_trial.GazeTrial(arrays['frameid'].tolist(), columns, null_masks, arrays['gaze'], arrays['gaze_offsets'],
+                                arrays['gaze_null'], gaze_decimals=2,
+                                file_meta_data=json.loads(str(arrays['file_meta_data'])))
+
+
+def read_gaze_trial_file(fname):
+    """ Read a cleaned trial file (npz or csv/txt, by the file extension) into a gaze_trial.GazeTrial """
+    if fname.endswith('.npz'):
+        return read_gaze_trial_npz_file(fname)
+    return read_gaze_trial_csv_file(fname)
+
+
+def get_index_fpath(fname):
+    """ The frame index file of a csv trial file (saved by data_cleaning with --index) """
+    return os.path.splitext(fname)[0] + '.index'
+
 
-    for (i, line) in enumerate(lines):
+def get_episode_ranges(episode, null_mask):
+    """ The frames of each episode: a frame starts a new episode if its episode id is not null and differs from the
+        last non-null episode id (as in data_stat.compute_trial_stat), and the episode lasts until the next one starts.
+        Returns the episode ids, the first frame and the stop frame (excluded) of each episode """
+    episode_indices = np.flatnonzero(~np.asarray(null_mask))
+    episode_ids = np.asarray(episode)[episode_indices]
+    is_changed = np.ones(len(episode_indices), dtype=bool)
+    is_changed[1:] = episode_ids[1:] != episode_ids[:-1]
+    episode_starts = episode_indices[is_changed]
+    episode_stops = np.append(episode_starts[1:], len(null_mask)).astype(np.int64)
+    return episode_ids[is_changed], episode_starts, episode_stops
+
+
+def get_file_signature(fname):
+    """ The size, the mtime and a hash of the start and the end (INDEX_DIGEST_BYTES each) of a file, as arrays:
+        cheap to compute on a large file, and different if the file is rewritten (even with the same size) """
+    stat = os.stat(fname)
+    sha1 = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        sha1.update(f.read(INDEX_DIGEST_BYTES))
+        if stat.st_size > INDEX_DIGEST_BYTES:
+            f.seek(max(INDEX_DIGEST_BYTES, stat.st_size - INDEX_DIGEST_BYTES))
+            sha1.update(f.read(INDEX_DIGEST_BYTES))
+    return {'file_size': np.array(stat.st_size, dtype=np.int64), 'file_mtime': np.array(stat.st_mtime, dtype=np.float64),
+            'file_digest': np.array(sha1.hexdigest().encode('ascii'))}
+
+
+def build_frame_index(fname, separator=','):
+    """ Scan a csv trial file (only the frame id and the episode id of each line are split).
+        Returns a dictionary of arrays: line_offsets, the byte offset of each frame line in the file and the end of
+        the last line (n_frame+1 values), episode_ids, episode_starts and episode_stops (see get_episode_ranges),
+        and file_size, file_mtime and file_digest, the signature of the file that is indexed (see
+        get_file_signature) """
+    # the signature is taken before the scan, so a change during the scan makes the index out of date
+    index = get_file_signature(fname)
+    line_offsets = []
+    episode_values = []
+    offset = 0
+    with open(fname, 'rb') as f:
+        first_line = f.readline()
         # for the first line, check if titles (column names) are included
-        if i == 0 and 'frame' in line:
-            continue
+        if b'frame' in first_line:
+            offset = len(first_line)
+        elif first_line != b'':
+            f.seek(0)
+        for line in f:
+            line_offsets.append(offset)
+            episode_values.append(line.split(separator.encode('ascii'), 2)[1].decode('ascii'))
+            offset += len(line)
+    line_offsets.append(offset)
+    episode, null_mask = parse_csv_column(episode_values)
+    episode_ids, episode_starts, episode_stops = get_episode_ranges(episode, null_mask)
+    index.update([('line_offsets', np.array(line_offsets, dtype=np.int64)), ('episode_ids', episode_ids),
+                  ('episode_starts', episode_starts), ('episode_stops', episode_stops)])
+    return index
+
+
+def is_index_up_to_date(index, fname):
+    """ Whether the csv file has the signature (size, mtime and hash, see get_file_signature) it had when it was
+        indexed (an index without a signature is out of date) """
+    signature = get_file_signature(fname)
+    return all([name in index and index[name].item() == value.item() for name, value in signature.items()])
+
+
+def read_frame_index(fname, separator=','):
+    """ Read the frame index of a csv trial file (see build_frame_index). If there is no index file, or the csv
+        file has changed since it was indexed (see is_index_up_to_date), the index is built from the csv file
+        (not saved) """
+    index_fpath = get_index_fpath(fname)
+    if os.path.exists(index_fpath):
+        index = load_npz_arrays(index_fpath)
+        if is_index_up_to_date(index, fname):
+            return index
+        print('Warning: the index %s is out of date, the frames of %s are indexed again' % (index_fpath, fname))
+    return build_frame_index(fname, separator)
+
+
+def read_frames(fname, start, stop, separator=',', pos_separator=','):
+    """ Read the frames start..stop-1 (python slice bounds) of a trial file into a gaze_trial.GazeTrial.
+        For a csv file, only the lines of these frames are read and parsed, from their offsets in the frame index
+        (see read_frame_index). The arrays of an npz file are memory mapped, only the frames are sliced. """
+    if fname.endswith('.npz'):
+        return read_gaze_trial_npz_file(fname).slice_frames(start, stop)
+    line_offsets = read_frame_index(fname, separator)['line_offsets']
+    start, stop, _ = slice(start, stop).indices(len(line_offsets) - 1)
+    stop = max(start, stop)
+    return read_frames_at(fname, int(line_offsets[start]), int(line_offsets[stop]), separator, pos_separator)
+
+
+def read_frames_at(fname, start_offset, stop_offset, separator=',', pos_separator=','):
+    """ Read the frame lines between two byte offsets of a csv trial file (from its frame index, see
+        build_frame_index) into a gaze_trial.GazeTrial. A caller that reads many ranges of a file can get the
+        index once and skip read_frame_index """
+    with open(fname, 'rb') as f:
+        f.seek(start_offset)
+        text = f.read(stop_offset - start_offset)
+    if not isinstance(text, str):
+        text = text.decode('ascii')
+    lines = text.replace('\r\n', '\n').splitlines(True)
+    return make_gaze_trial_of_arrays(parse_csv_lines(lines, separator, pos_separator))
+
+
+def read_episode(fname, episode_id, separator=',', pos_separator=','):
+    """ Read the frames of one episode (see get_episode_ranges) of a trial file into a gaze_trial.GazeTrial,
+        like read_frames """
+    if fname.endswith('.npz'):
+        trial = read_gaze_trial_npz_file(fname)
+        episode_ids, episode_starts, episode_stops = get_episode_ranges(trial.columns['episode'],
+                                                                        trial.null_masks['episode'])
+    else:
+        index = read_frame_index(fname, separator)
+        episode_ids, episode_starts, episode_stops = \
+            index['episode_ids'], index['episode_starts'], index['episode_stops']
+    matches = np.flatnonzero(np.asarray(episode_ids) == episode_id)
+    if len(matches) == 0:
+        raise ValueError('There is no episode %d in %s' % (episode_id, fname))
+    start, stop = int(episode_starts[matches[0]]), int(episode_stops[matches[0]])
+    if fname.endswith('.npz'):
+        return trial.slice_frames(start, stop)
+    return read_frames(fname, start, stop, separator, pos_separator)
+
+
+def read_gaze_samples_file(fname):
+    """ Read a samples file (saved by data_cleaning.save_gaze_samples) into a gaze_samples.GazeSamples.
+        The arrays are memory mapped, so only the samples that are used are read from the disk. """
+    arrays = load_npz_arrays(fname)
+    return gaze_samples.GazeSamples(arrays['timestamp'], arrays['x'], arrays['y'], arrays['frame_index'],
+                                    arrays['pupil'])
+
+
+def read_frame_events_file(fname):
+    """ Read an events file (saved by data_cleaning with the per-frame fixation and saccade columns, see
+        gaze_events.EVENT_COLUMN_NAMES). Returns frameid_list and a dictionary mapping column name to the values """
+    with open(fname, 'r') as f:
+        f.readline()
+        data_lines = [line.rstrip('\n').split(',') for line in f if line.strip()]
+    frameid_list = [data_line[0] for data_line in data_lines]
+    frame_events = {}
+    for i, name in enumerate(('n_fixation', 'fixation_duration', 'n_saccade')):
+        frame_events[name] = parse_csv_numbers(','.join([data_line[i + 1] for data_line in data_lines]),
+                                               len(data_lines), np.int64)
+    frame_events['saccade_amplitude'] = parse_csv_numbers(','.join([data_line[4] for data_line in data_lines]),
+                                                          len(data_lines), np.float64)
+    return frameid_list, frame_events
 
-        # parse each section: frameid,episode_id,score,duration,unclipped_reward,action,pos
-        data_line = line.split(separator)
-        # frame id
-        frameid = data_line[0]
-        frameid_list.append(frameid)
-        # episode id
-        episode_id = data_line[1]
-        if episode_id == 'null':
-            episode_id = None
-        else:
-            episode_id = int(episode_id)
-        frameid2episode[frameid] = episode_id
-        # score
-        score = data_line[2]
-        if score == 'null':
-            score = None
-        else:
-            score = int(score)
-        frameid2score[frameid] = score
-        # duration
-        duration = data_line[3]
-        if duration == 'null':
-            duration = None
-        else:
-            duration = int(duration)
-        frameid2duration[frameid] = duration
-        # unclipped_reward
-        unclipped_reward = data_line[4]
-        if unclipped_reward == 'null':
-            unclipped_reward = None
-        else:
-            unclipped_reward = int(unclipped_reward)
-        frameid2unclipped_reward[frameid] = unclipped_reward
-        # action
-        action = data_line[5]
-        if action == 'null':
-            action = None
-        else:
-            action = int(action)
-        frameid2action[frameid] = action
-        # pos
-        pos_data = data_line[6]
-        if pos_data == 'null':
-            frameid2pos[frameid] = None
-        else:
-            # if the separator and the pos separator are the same
-            if separator == pos_separator:
-                pos_data_list = data_line[6:]
-            else:
-                pos_data_list = pos_data.split(pos_separator)
-            pos_list = []
-            n_pos = len(pos_data_list) / 2
-            for j in range(0, n_pos):
-                posX = float(pos_data_list[2*j])
-                posY = float(pos_data_list[2*j+1])
-                pos_list.append((posX, posY))
-            frameid2pos[frameid] = pos_list
 
-    return frameid2pos, frameid2action, frameid2duration, frameid2unclipped_reward, frameid2episode, frameid2score, frameid_list
+def read_gaze_data_file(fname):
+    """ Read a cleaned trial file (npz or csv/txt, by the file extension) and return the same dictionaries as
+        read_gaze_data_csv_file """
+    if fname.endswith('.npz'):
+        return read_gaze_trial_npz_file(fname).to_gaze_data()[:7]
+    return read_gaze_data_csv_file(fname)
 
 
 if __name__ == '__main__':
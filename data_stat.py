@@ -6,13 +6,27 @@
 import os
 import re
 import sys
+import numpy as np
 import data_reader
+import gaze_events
+import stage_profiler
+import trial_catalog
 import utils
 
 
-def do_per_game_stat(csv_dir, fname_regex='.*_.*_.*\.txt', is_ignore_null=False, func_fname_condition=None):
-    # stat data
-    cnt_file = 0
+# file name patterns of the binary (npz) and the txt trial files
+BINARY_FNAME_REGEX = '.*_.*_.*\\.npz'
+CSV_FNAME_REGEX = '.*_.*_.*\\.txt'
+
+
+def compute_game_stat_of_trial(gaze_data, is_ignore_null=False):
+    """ Compute the contribution of one trial to the game statistics (see merge_game_stat) """
+    frameid2duration = gaze_data[2]
+    frameid2unclipped_reward = gaze_data[3]
+    frameid2episode = gaze_data[4]
+    frameid2score = gaze_data[5]
+    frameid_list = gaze_data[6]
+
     cnt_frame = 0
     cnt_episode = 0
     game_play_time = 0
@@ -21,204 +35,412 @@ def do_per_game_stat(csv_dir, fname_regex='.*_.*_.*\.txt', is_ignore_null=False,
     lowest_cumulative_reward = float('inf')
     highest_cumulative_reward = -float('inf')
 
-    fname_format = re.compile(fname_regex)
-    for fname in os.listdir(csv_dir):
-        if fname_format.match(fname):
-            # skip the file if it doesn't meet the file name condition
-            if (func_fname_condition is not None) and (not func_fname_condition(fname)):
-                continue
-
-            print('Processing csv file: ' + fname)
-            cnt_file += 1
-
-            # read data from the csv file
-            fpath = os.path.join(csv_dir, fname)
-            gaze_data = data_reader.read_gaze_data_csv_file(fpath)
-            frameid2duration = gaze_data[2]
-            frameid2unclipped_reward = gaze_data[3]
-            frameid2episode = gaze_data[4]
-            frameid2score = gaze_data[5]
-            frameid_list = gaze_data[6]
-
-            episode_score = 0
-            episode_time = 0
-            episode_cumulative_reward = 0
-            episode_frame = 0
-            current_episode = None
-
-            for frameid in frameid_list:
-                duration = frameid2duration[frameid]
-                unclipped_reward = frameid2unclipped_reward[frameid]
-                episode_id = frameid2episode[frameid]
-                score = frameid2score[frameid]
-
-                if is_ignore_null:
-                    if duration is None or unclipped_reward is None or episode_id is None or score is None:
-                        break
-
-                # if it's a new episode
-                if episode_id is not None and episode_id != current_episode:
-                    # compute the stat data for previous episode
-                    game_play_time += episode_time
-                    lowest_cumulative_reward = min(lowest_cumulative_reward, episode_cumulative_reward)
-                    highest_cumulative_reward = max(highest_cumulative_reward, episode_cumulative_reward)
-                    cnt_frame += episode_frame
-                    if current_episode is not None:
-                        cnt_episode += 1
-                    lowest_score = min(lowest_score, episode_score)
-                    highest_score = max(highest_score, episode_score)
-
-                    # reset the stat variables
-                    episode_time = utils.set_value_by_int(0, duration)
-                    episode_frame = 1
-                    episode_score = utils.set_value_by_int(0, score)
-                    episode_cumulative_reward = utils.set_value_by_int(0, unclipped_reward)
-                    current_episode = episode_id
-                # if it's still in the same episode
-                else:
-                    episode_time = utils.increment_by_int(episode_time, duration)
-                    episode_frame += 1
-                    episode_cumulative_reward = utils.increment_by_int(episode_cumulative_reward, unclipped_reward)
-                    episode_score = utils.set_value_by_int(episode_score, score)
-
-            # compute the stat data for the last episode
+    episode_score = 0
+    episode_time = 0
+    episode_cumulative_reward = 0
+    episode_frame = 0
+    current_episode = None
+
+    for frameid in frameid_list:
+        duration = frameid2duration[frameid]
+        unclipped_reward = frameid2unclipped_reward[frameid]
+        episode_id = frameid2episode[frameid]
+        score = frameid2score[frameid]
+
+        if is_ignore_null:
+            if duration is None or unclipped_reward is None or episode_id is None or score is None:
+                break
+
+        # if it's a new episode
+        if episode_id is not None and episode_id != current_episode:
+            # compute the stat data for previous episode
             game_play_time += episode_time
             lowest_cumulative_reward = min(lowest_cumulative_reward, episode_cumulative_reward)
             highest_cumulative_reward = max(highest_cumulative_reward, episode_cumulative_reward)
             cnt_frame += episode_frame
-            cnt_episode += 1
+            if current_episode is not None:
+                cnt_episode += 1
             lowest_score = min(lowest_score, episode_score)
             highest_score = max(highest_score, episode_score)
 
+            # reset the stat variables
+            episode_time = utils.set_value_by_int(0, duration)
+            episode_frame = 1
+            episode_score = utils.set_value_by_int(0, score)
+            episode_cumulative_reward = utils.set_value_by_int(0, unclipped_reward)
+            current_episode = episode_id
+        # if it's still in the same episode
+        else:
+            episode_time = utils.increment_by_int(episode_time, duration)
+            episode_frame += 1
+            episode_cumulative_reward = utils.increment_by_int(episode_cumulative_reward, unclipped_reward)
+            episode_score = utils.set_value_by_int(episode_score, score)
+
+    # compute the stat data for the last episode
+    game_play_time += episode_time
+    lowest_cumulative_reward = min(lowest_cumulative_reward, episode_cumulative_reward)
+    highest_cumulative_reward = max(highest_cumulative_reward, episode_cumulative_reward)
+    cnt_frame += episode_frame
+    cnt_episode += 1
+    lowest_score = min(lowest_score, episode_score)
+    highest_score = max(highest_score, episode_score)
+
+    return {'cnt_episode': cnt_episode, 'cnt_frame': cnt_frame, 'game_play_time': game_play_time,
+            'lowest_cumulative_reward': lowest_cumulative_reward, 'highest_cumulative_reward': highest_cumulative_reward,
+            'lowest_score': lowest_score, 'highest_score': highest_score}
+
+
+def merge_game_stat(game_stat, trial_game_stat):
+    """ Add the contribution of one trial to the game statistics """
+    for key in ('cnt_episode', 'cnt_frame', 'game_play_time'):
+        game_stat[key] += trial_game_stat[key]
+    for key in ('lowest_cumulative_reward', 'lowest_score'):
+        game_stat[key] = min(game_stat[key], trial_game_stat[key])
+    for key in ('highest_cumulative_reward', 'highest_score'):
+        game_stat[key] = max(game_stat[key], trial_game_stat[key])
+
+
+def list_stat_files(csv_dir, fname_regex, func_fname_condition=None):
+    """ Return the names of the files to do statistics on, sorted so that the results don't depend on
+        the order of os.listdir """
+    fname_format = re.compile(fname_regex)
+    fnames = []
+    for fname in sorted(os.listdir(csv_dir)):
+        if fname_format.match(fname):
+            # skip the file if it doesn't meet the file name condition
+            if (func_fname_condition is not None) and (not func_fname_condition(fname)):
+                continue
+            fnames.append(fname)
+    return fnames
+
+
+def get_catalog_fname_condition(csv_dir, where, func_fname_condition=None):
+    """ The file name condition that selects the trials that meet the condition where in the trial catalog of
+        csv_dir: a list of conditions whose values are bound (e.g. [('avg_error', '<', 0.5)]), or a trusted SQL
+        condition that is pasted into the query (e.g. 'avg_error < 0.5 AND total_frame > 5000', the --where
+        option), see trial_catalog.select_trials """
+    catalog_fpath = trial_catalog.get_catalog_fpath(csv_dir)
+    if not os.path.exists(catalog_fpath):
+        raise IOError('There is no trial catalog in %s (it is created by data_cleaning.py)' % csv_dir)
+    return trial_catalog.make_fname_condition(catalog_fpath, where, func_fname_condition=func_fname_condition)
+
+
+def do_game_stat_of_file(task):
+    """ Compute the game statistics of one file (run in a worker process when n_workers > 1) """
+    fpath, is_ignore_null = task
+    print('Processing csv file: ' + os.path.basename(fpath))
+    return compute_game_stat_of_trial(data_reader.read_gaze_data_file(fpath), is_ignore_null)
+
+
+def do_per_game_stat(csv_dir, fname_regex='.*_.*_.*\.txt', is_ignore_null=False, func_fname_condition=None,
+                     n_workers=1, where=None):
+    """ Do statistics over all the trial files under csv_dir (only the trials that meet the condition where,
+        if it is given, see get_catalog_fname_condition) """
+    if where is not None:
+        func_fname_condition = get_catalog_fname_condition(csv_dir, where, func_fname_condition)
+    # stat data
+    game_stat = {'cnt_episode': 0, 'cnt_frame': 0, 'game_play_time': 0,
+                 'lowest_cumulative_reward': float('inf'), 'highest_cumulative_reward': -float('inf'),
+                 'lowest_score': float('inf'), 'highest_score': -float('inf')}
+
+    fnames = list_stat_files(csv_dir, fname_regex, func_fname_condition)
+    tasks = [(os.path.join(csv_dir, fname), is_ignore_null) for fname in fnames]
+    for trial_game_stat in utils.map_in_processes(do_game_stat_of_file, tasks, n_workers):
+        merge_game_stat(game_stat, trial_game_stat)
+
     # display the result
     print('\n-------------------------------------')
     print('-------------------------------------')
-    print('Statistics results from %d files' % cnt_file)
-    print('Episodes: %d' % cnt_episode)
-    print('Frames: %d' % cnt_frame)
-    print('Game play time: %d' % game_play_time)
-    print('Lowest cumulative reward: %d' % lowest_cumulative_reward)
-    print('Highest cumulative reward: %d' % highest_cumulative_reward)
-    print('Lowest score: %d' % lowest_score)
-    print('Highest score: %d' % highest_score)
+    print('Statistics results from %d files' % len(fnames))
+    print('Episodes: %d' % game_stat['cnt_episode'])
+    print('Frames: %d' % game_stat['cnt_frame'])
+    print('Game play time: %d' % game_stat['game_play_time'])
+    print('Lowest cumulative reward: %d' % game_stat['lowest_cumulative_reward'])
+    print('Highest cumulative reward: %d' % game_stat['highest_cumulative_reward'])
+    print('Lowest score: %d' % game_stat['lowest_score'])
+    print('Highest score: %d' % game_stat['highest_score'])
     print('-------------------------------------')
     print('-------------------------------------')
+    return game_stat
+
+
+# the "no value" (-inf) of the int64 reductions in compute_trial_stat
+NO_VALUE = np.iinfo(np.int64).min
+
+
+def make_trial_stat_dict(highest_score, lowest_score, highest_cumulative_reward, lowest_cumulative_reward,
+                         cnt_episode, n_frame, game_play_time):
+    trial_stat_dict = {}
+    if highest_score == float('inf') or highest_score == -float('inf'):
+        highest_score = 0
+    trial_stat_dict['highest_score'] = highest_score
+    if lowest_score == float('inf') or lowest_score == -float('inf'):
+        lowest_score = 0
+    trial_stat_dict['lowest_score'] = lowest_score
+    trial_stat_dict['highest_cumulative_score'] = highest_cumulative_reward
+    trial_stat_dict['lowest_cumulative_score'] = lowest_cumulative_reward
+    trial_stat_dict['total_episode'] = cnt_episode
+    trial_stat_dict['total_frame'] = n_frame
+    trial_stat_dict['total_game_play_time'] = game_play_time
+    return trial_stat_dict
+
+
+def compute_trial_stat_by_frame(gaze_data, is_ignore_null=False):
+    """ Compute the statistics of one trial frame by frame from the dictionaries of data_reader
+        (the reference implementation of compute_trial_stat) """
+    frameid2duration = gaze_data[2]
+    frameid2unclipped_reward = gaze_data[3]
+    frameid2episode = gaze_data[4]
+    frameid2score = gaze_data[5]
+    frameid_list = gaze_data[6]
+
+    trial_lowest_score = float('inf')
+    trial_highest_score = -float('inf')
+    trial_lowest_cumulative_reward = float('inf')
+    trial_highest_cumulative_reward = -float('inf')
+
+    episode_max_score = -float('inf')
+    episode_max_cumulative_reward = -float('inf')
+    episode_time = 0
+    episode_cumulative_reward = 0
+    current_episode = None
+
+    n_frame = len(frameid_list)
+    cnt_episode = 0
+    game_play_time = 0
 
+    for i_frame, frameid in enumerate(frameid_list):
+        duration = frameid2duration[frameid]
+        unclipped_reward = frameid2unclipped_reward[frameid]
+        episode_id = frameid2episode[frameid]
+        score = frameid2score[frameid]
+
+        # check if there are None values
+        if is_ignore_null:
+            if duration is None or unclipped_reward is None or episode_id is None or score is None:
+                break
+
+        # if it's a new episode
+        if episode_id is not None and episode_id != current_episode:
+            # if it's not the beginning of the first episode
+            if i_frame != 0:
+                # compute the stat data for previous episode
+                trial_lowest_cumulative_reward = min(trial_lowest_cumulative_reward,
+                                                     episode_max_cumulative_reward)
+                trial_highest_cumulative_reward = max(trial_highest_cumulative_reward,
+                                                      episode_max_cumulative_reward)
+                trial_lowest_score = min(trial_lowest_score, episode_max_score)
+                trial_highest_score = max(trial_highest_score, episode_max_score)
+                cnt_episode += 1
+
+            # reset the stat variables for the new episode
+            episode_time = utils.set_value_by_int(0, duration)
+            episode_max_score = utils.set_value_by_int(0, score)
+            episode_max_cumulative_reward = utils.set_value_by_int(0, unclipped_reward)
+            episode_cumulative_reward = unclipped_reward
+            current_episode = episode_id
+
+            game_play_time += episode_time
+        # compute the stat data for the last frame of the last episode
+        elif i_frame == n_frame - 1:
+            game_play_time += episode_time
+            cnt_episode += 1
+            trial_lowest_cumulative_reward = min(trial_lowest_cumulative_reward, episode_max_cumulative_reward)
+            trial_highest_cumulative_reward = max(trial_highest_cumulative_reward,
+                                                  episode_max_cumulative_reward)
+            trial_lowest_score = min(trial_lowest_score, episode_max_score)
+            trial_highest_score = max(trial_highest_score, episode_max_score)
+        # if it's still in the same episode
+        else:
+            episode_time = utils.increment_by_int(episode_time, duration)
+            episode_cumulative_reward = utils.increment_by_int(episode_cumulative_reward, unclipped_reward)
+            episode_max_cumulative_reward = max(episode_max_cumulative_reward, episode_cumulative_reward)
+            episode_max_score = max(episode_max_score, utils.set_value_by_int(episode_max_score, score))
+
+    return make_trial_stat_dict(trial_highest_score, trial_lowest_score, trial_highest_cumulative_reward,
+                                trial_lowest_cumulative_reward, cnt_episode, n_frame, game_play_time)
+
+
+def to_stat_value(value):
+    if value == NO_VALUE:
+        return -float('inf')
+    return int(value)
+
+
+def compute_trial_stat(trial, is_ignore_null=False):
+    """ Compute the statistics of one trial (a gaze_trial.GazeTrial) with array operations: the frames are split
+        into episodes where the episode id changes, and the per-episode values are computed with segmented
+        cumulative sums and reduceat maxima. The result is the same as compute_trial_stat_by_frame. """
+    n_frame = len(trial)
+    # the frame by frame computation reads the values by frame id, a repeated frame id uses its last values
+    if len(set(trial.frameid_list)) != n_frame:
+        return compute_trial_stat_by_frame(trial.to_gaze_data(), is_ignore_null)
+
+    names = ('duration', 'unclipped_reward', 'episode', 'score')
+    values = dict((name, np.asarray(trial.columns[name])) for name in names)
+    null_masks = dict((name, np.asarray(trial.null_masks[name])) for name in names)
+
+    # the frame by frame computation stops at the first frame with a null value
+    n_used = n_frame
+    if is_ignore_null:
+        null_indices = np.flatnonzero(null_masks['duration'] | null_masks['unclipped_reward'] |
+                                      null_masks['episode'] | null_masks['score'])
+        if len(null_indices) > 0:
+            n_used = int(null_indices[0])
+    if n_used == 0:
+        return make_trial_stat_dict(-float('inf'), float('inf'), -float('inf'), float('inf'), 0, n_frame, 0)
+
+    for name in names:
+        values[name] = values[name][:n_used]
+        null_masks[name] = null_masks[name][:n_used]
+    duration = np.where(null_masks['duration'], 0, values['duration'])
+    reward = np.where(null_masks['unclipped_reward'], 0, values['unclipped_reward'])
+    score = np.where(null_masks['score'], 0, values['score'])
+
+    # a frame starts a new episode if its episode id is not null and differs from the last non-null episode id
+    episode_indices = np.flatnonzero(~null_masks['episode'])
+    episode_ids = values['episode'][episode_indices]
+    is_changed = np.ones(len(episode_indices), dtype=bool)
+    is_changed[1:] = episode_ids[1:] != episode_ids[:-1]
+    new_episode_indices = episode_indices[is_changed]
+    is_new_episode = np.zeros(n_used, dtype=bool)
+    is_new_episode[new_episode_indices] = True
+
+    # the last frame closes the current episode (if it is reached and doesn't start a new one), its values are not used
+    is_last_frame_closing = n_used == n_frame and not is_new_episode[-1]
+    is_in_episode = ~is_new_episode
+    if is_last_frame_closing:
+        is_in_episode[-1] = False
+
+    # segment 0 holds the frames before the first new episode (empty if the first frame starts an episode, then it
+    # is never used), segment k holds the k-th episode
+    segment_starts = np.concatenate(([0], new_episode_indices))
+    segment_ids = np.cumsum(is_new_episode)
+
+    # an episode starting with a null reward has a None cumulative reward, leave it to the frame by frame computation
+    n_in_episode = np.bincount(segment_ids[is_in_episode], minlength=len(segment_starts))
+    if np.any(null_masks['unclipped_reward'][new_episode_indices] & (n_in_episode[1:] > 0)):
+        return compute_trial_stat_by_frame(trial.to_gaze_data(), is_ignore_null)
+
+    # the values of the segments when they start
+    init_time = np.concatenate(([0], duration[new_episode_indices]))
+    init_reward = np.concatenate(([0], reward[new_episode_indices]))
+    init_max_reward = np.concatenate(([NO_VALUE], reward[new_episode_indices]))
+    init_max_score = np.concatenate(([NO_VALUE], score[new_episode_indices]))
+
+    segment_time = init_time + np.add.reduceat(np.where(is_in_episode, duration, 0), segment_starts)
+    cumulative_reward = np.cumsum(np.where(is_in_episode, reward, 0))
+    reward_before_segment = np.concatenate(([0], cumulative_reward))[segment_starts]
+    episode_reward = cumulative_reward - reward_before_segment[segment_ids] + init_reward[segment_ids]
+    segment_max_reward = np.maximum(init_max_reward, np.maximum.reduceat(
+        np.where(is_in_episode, episode_reward, NO_VALUE), segment_starts))
+    segment_max_score = np.maximum(init_max_score, np.maximum.reduceat(
+        np.where(is_in_episode & ~null_masks['score'], values['score'], NO_VALUE), segment_starts))
+
+    # each new episode (except at the first frame) closes the segment before it
+    closed_segments = np.flatnonzero(new_episode_indices > 0)
+    game_play_time = int(init_time[1:].sum())
+    if is_last_frame_closing:
+        closed_segments = np.append(closed_segments, len(segment_starts) - 1)
+        game_play_time += int(segment_time[-1])
+
+    episode_max_rewards = [to_stat_value(value) for value in segment_max_reward[closed_segments].tolist()]
+    episode_max_scores = [to_stat_value(value) for value in segment_max_score[closed_segments].tolist()]
+    return make_trial_stat_dict(max([-float('inf')] + episode_max_scores), min([float('inf')] + episode_max_scores),
+                                max([-float('inf')] + episode_max_rewards), min([float('inf')] + episode_max_rewards),
+                                len(closed_segments), n_frame, game_play_time)
+
+
+def get_events_fpath(fpath):
+    """ The events file saved next to the trial file (see data_cleaning.get_events_fname) """
+    return os.path.join(os.path.dirname(fpath), os.path.basename(fpath).split('.')[0] + '.events')
+
+
+def compute_trial_event_stat_of_file(events_fpath):
+    """ The fixation and saccade statistics of a trial from its events file """
+    _, frame_events = data_reader.read_frame_events_file(events_fpath)
+    return gaze_events.compute_trial_event_stat(frame_events)
+
+
+def do_trial_stat_of_file(task):
+    """ Compute the statistics of one trial file (run in a worker process when n_workers > 1).
+        Returns (trial_id, trial_stat, file_profile), file_profile is the cost of each stage if is_profile is set
+        (see stage_profiler.StageProfiler.to_dict) """
+    fpath, is_ignore_null, is_event_stat, is_profile = task
+    fname = os.path.basename(fpath)
+    trial_id = int(fname.split('_')[0])
+    print('Processing trial ' + str(trial_id) + ' in csv file: ' + fname)
+    profiler = stage_profiler.StageProfiler(fname) if is_profile else None
+    with stage_profiler.measure(profiler, 'read') as record:
+        trial = data_reader.read_gaze_trial_file(fpath)
+        if is_profile:
+            record['bytes_read'] = os.path.getsize(fpath)
+            record['n_line'] = len(trial)
+    with stage_profiler.measure(profiler, 'stat'):
+        trial_stat = compute_trial_stat(trial, is_ignore_null)
+    if is_event_stat:
+        with stage_profiler.measure(profiler, 'event_stat') as record:
+            events_fpath = get_events_fpath(fpath)
+            trial_stat.update(compute_trial_event_stat_of_file(events_fpath))
+            if is_profile:
+                record['bytes_read'] = os.path.getsize(events_fpath)
+    return trial_id, trial_stat, profiler.to_dict() if is_profile else None
+
+
+def do_per_trial_stat(csv_dir, saved_dir=None, fname_regex='.*_.*_.*\.txt', is_ignore_null=False,
+                      func_fname_condition=None, n_workers=1, is_event_stat=False, profile_fpath=None,
+                      saved_summary_csv=False, where=None):
+    """ Do statistics for each trial file under csv_dir. If n_workers > 1, the files are processed in a process pool.
+        The results are merged in the order of trial id.
+        If is_event_stat is set, the fixation and saccade statistics are added from the events file of each trial
+        (saved by data_cleaning with --events).
+        If profile_fpath is set, the cost of each stage of each file and of the whole run is saved to this JSON file
+        (see stage_profiler.save_report).
+        If saved_summary_csv is set, the statistics are also saved to stat_data.csv (see report_trial_stat).
+        If where is set, only the trials that meet this condition in the trial catalog of csv_dir are used
+        (see get_catalog_fname_condition). The statistics are saved to the catalog if csv_dir has one. """
+    if where is not None:
+        func_fname_condition = get_catalog_fname_condition(csv_dir, where, func_fname_condition)
+    is_profile = profile_fpath is not None
+    run_profiler = stage_profiler.StageProfiler('run') if is_profile else None
+    fnames = list_stat_files(csv_dir, fname_regex, func_fname_condition)
+    tasks = [(os.path.join(csv_dir, fname), is_ignore_null, is_event_stat, is_profile) for fname in fnames]
+    with stage_profiler.measure(run_profiler, 'stat_files'):
+        results = sorted(utils.map_in_processes(do_trial_stat_of_file, tasks, n_workers), key=lambda result: result[0])
 
-def do_per_trial_stat(csv_dir, saved_dir=None, fname_regex='.*_.*_.*\.txt', is_ignore_null=False, func_fname_condition=None):
     # stat data
-    stat_dict = {}
-    cnt_file = 0
+    stat_dict = dict((trial_id, trial_stat) for trial_id, trial_stat, _ in results)
+    with stage_profiler.measure(run_profiler, 'stat_report'):
+        report_trial_stat(stat_dict, saved_dir, saved_summary_csv)
+    catalog_fpath = trial_catalog.get_catalog_fpath(csv_dir)
+    if os.path.exists(catalog_fpath):
+        records = []
+        for trial_id, trial_stat, _ in results:
+            record = dict(trial_stat)
+            record['trial_id'] = trial_id
+            records.append(record)
+        trial_catalog.update_catalog(catalog_fpath, records)
+
+    if is_profile:
+        stage_profiler.save_report(profile_fpath, [result[2] for result in results], run_profiler.to_dict())
+    return stat_dict
 
-    fname_format = re.compile(fname_regex)
-    for fname in os.listdir(csv_dir):
-        if fname_format.match(fname):
-            # skip the file if it doesn't meet the file name condition
-            if (func_fname_condition is not None) and (not func_fname_condition(fname)):
-                continue
 
-            trial_id = int(fname.split('_')[0])
-            print('Processing trial ' + str(trial_id) + ' in csv file: ' + fname)
-            cnt_file += 1
-
-            # read data from the csv file
-            fpath = os.path.join(csv_dir, fname)
-            gaze_data = data_reader.read_gaze_data_csv_file(fpath)
-            frameid2duration = gaze_data[2]
-            frameid2unclipped_reward = gaze_data[3]
-            frameid2episode = gaze_data[4]
-            frameid2score = gaze_data[5]
-            frameid_list = gaze_data[6]
-
-            trial_lowest_score = float('inf')
-            trial_highest_score = -float('inf')
-            trial_lowest_cumulative_reward = float('inf')
-            trial_highest_cumulative_reward = -float('inf')
-            trial_stat_dict = {}
-
-            episode_max_score = -float('inf')
-            episode_max_cumulative_reward = -float('inf')
-            episode_time = 0
-            episode_cumulative_reward = 0
-            current_episode = None
-
-            n_frame = len(frameid_list)
-            cnt_episode = 0
-            game_play_time = 0
-
-            for i_frame, frameid in enumerate(frameid_list):
-                duration = frameid2duration[frameid]
-                unclipped_reward = frameid2unclipped_reward[frameid]
-                episode_id = frameid2episode[frameid]
-                score = frameid2score[frameid]
-
-                # check if there are None values
-                if is_ignore_null:
-                    if duration is None or unclipped_reward is None or episode_id is None or score is None:
-                        break
-
-                # if it's a new episode
-                if episode_id is not None and episode_id != current_episode:
-                    # if it's not the beginning of the first episode
-                    if i_frame != 0:
-                        # compute the stat data for previous episode
-                        trial_lowest_cumulative_reward = min(trial_lowest_cumulative_reward,
-                                                             episode_max_cumulative_reward)
-                        trial_highest_cumulative_reward = max(trial_highest_cumulative_reward,
-                                                              episode_max_cumulative_reward)
-                        trial_lowest_score = min(trial_lowest_score, episode_max_score)
-                        trial_highest_score = max(trial_highest_score, episode_max_score)
-                        cnt_episode += 1
-
-                    # reset the stat variables for the new episode
-                    episode_time = utils.set_value_by_int(0, duration)
-                    episode_max_score = utils.set_value_by_int(0, score)
-                    episode_max_cumulative_reward = utils.set_value_by_int(0, unclipped_reward)
-                    episode_cumulative_reward = unclipped_reward
-                    current_episode = episode_id
-
-                    game_play_time += episode_time
-                # compute the stat data for the last frame of the last episode
-                elif i_frame == n_frame - 1:
-                    game_play_time += episode_time
-                    cnt_episode += 1
-                    trial_lowest_cumulative_reward = min(trial_lowest_cumulative_reward, episode_max_cumulative_reward)
-                    trial_highest_cumulative_reward = max(trial_highest_cumulative_reward,
-                                                          episode_max_cumulative_reward)
-                    trial_lowest_score = min(trial_lowest_score, episode_max_score)
-                    trial_highest_score = max(trial_highest_score, episode_max_score)
-                # if it's still in the same episode
-                else:
-                    episode_time = utils.increment_by_int(episode_time, duration)
-                    episode_cumulative_reward = utils.increment_by_int(episode_cumulative_reward, unclipped_reward)
-                    episode_max_cumulative_reward = max(episode_max_cumulative_reward, episode_cumulative_reward)
-                    episode_max_score = max(episode_max_score, utils.set_value_by_int(episode_max_score, score))
-
-            # save and display the result
-            if trial_highest_score == float('inf') or trial_highest_score == -float('inf'):
-                trial_highest_score = 0
-            trial_stat_dict['highest_score'] = trial_highest_score
-            if trial_lowest_score == float('inf') or trial_lowest_score == -float('inf'):
-                trial_lowest_score = 0
-            trial_stat_dict['lowest_score'] = trial_lowest_score
-            trial_stat_dict['highest_cumulative_score'] = trial_highest_cumulative_reward
-            trial_stat_dict['lowest_cumulative_score'] = trial_lowest_cumulative_reward
-            trial_stat_dict['total_episode'] = cnt_episode
-            trial_stat_dict['total_frame'] = n_frame
-            trial_stat_dict['total_game_play_time'] = game_play_time
-            stat_dict[trial_id] = trial_stat_dict
-            print('Statistics results from trial %d: ' % trial_id)
-            print(trial_stat_dict)
-            print(' ')
+def report_trial_stat(stat_dict, saved_dir=None, saved_as_csv=False):
+    """ Display the statistics of each trial (in the order of trial id) and save them to stat_data.xlsx in saved_dir
+        (and to stat_data.csv if saved_as_csv is set) """
+    for trial_id in sorted(stat_dict.keys()):
+        print('Statistics results from trial %d: ' % trial_id)
+        print(stat_dict[trial_id])
+        print(' ')
 
     print('\n----------------------------------')
-    print('Done statistics from %d files.' % cnt_file)
+    print('Done statistics from %d files.' % len(stat_dict))
     print('----------------------------------')
 
-    # save the data to excel then return
+    # save the data to excel
     if saved_dir is not None:
-        utils.save_trials_data_to_excel(saved_dir, 'stat_data.xlsx', stat_dict)
-    return stat_dict
+        utils.save_trials_data_to_excel(saved_dir, 'stat_data.xlsx', stat_dict, saved_as_csv)
 
 
 def fname_condition(fname):
@@ -237,11 +459,24 @@ def do_stat():
 
 
 if __name__ == '__main__':
+    n_workers = utils.pop_int_option(sys.argv, '--workers', 1)
+    is_binary = utils.pop_flag(sys.argv, '--binary')
+    is_event_stat = utils.pop_flag(sys.argv, '--events')
+    profile_fpath = utils.pop_option(sys.argv, '--profile', None, str, 'a report file')
+    is_summary_csv = utils.pop_flag(sys.argv, '--summary-csv')
+    # trusted input: the condition is pasted into the SQL query of the trial catalog
+    where = utils.pop_option(sys.argv, '--where', None, str, 'an SQL condition')
     if len(sys.argv) < 3:
-        print('Usage: python data_stat.py source_dir saved_dir')
+        print('Usage: python data_stat.py source_dir saved_dir [--binary] [--workers N] [--events] [--profile report.json] [--summary-csv] [--where "avg_error < 0.5"]')
         exit(1)
 
     source_dir = sys.argv[1]
     saved_dir = sys.argv[2]
 
-    do_per_trial_stat(source_dir, saved_dir)
+    if is_binary:
+        do_per_trial_stat(source_dir, saved_dir, fname_regex=BINARY_FNAME_REGEX, n_workers=n_workers,
+                          is_event_stat=is_event_stat, profile_fpath=profile_fpath, saved_summary_csv=is_summary_csv,
+                          where=where)
+    else:
+        do_per_trial_stat(source_dir, saved_dir, n_workers=n_workers, is_event_stat=is_event_stat,
+                          profile_fpath=profile_fpath, saved_summary_csv=is_summary_csv, where=where)
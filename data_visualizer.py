@@ -2,19 +2,37 @@
 #
 # Visualize the cleaned data (to verify the correctness)
 # -----------------------
+import io
 import os
 import time
-import shutil
 import data_reader
+import frame_archive
+import frame_loader
+import replay_scheduler
+import utils
 import sys
 # noinspection PyClassHasNoInit
-import tarfile
+import numpy as np
 import pygame
 
+try:
+    input = raw_input  # Python 2 (its input evaluates the line)
+except NameError:
+    pass
+
+
+# size of the cache of the loaded (decoded and scaled) frames
+DEFAULT_CACHE_MB = 512
+# size of the game frames, and their scale on the screen (x, y)
+ORIGIN_SIZE = (160, 210)
+FRAME_SCALE = (2.0, 2.0)
+SCREEN_SIZE = (int(ORIGIN_SIZE[0] * FRAME_SCALE[0]), int(ORIGIN_SIZE[1] * FRAME_SCALE[1]))
+CURSOR_FNAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'target.png')
+
 
 class DrawgcWrapper:
     def __init__(self):
-        self.cursor = pygame.image.load('target.png')
+        self.cursor = pygame.image.load(CURSOR_FNAME)
         self.cursor_size = (self.cursor.get_width(), self.cursor.get_height())
 
     def draw_gc(self, screen, gaze_position):
@@ -23,6 +41,61 @@ class DrawgcWrapper:
         # Draws and shows the cursor content;
         screen.blit(self.cursor, region_top_left)
 
+    def convert_cursor(self):
+        """ convert the cursor to the pixel format of the display (it is blitted much faster), needs a display mode """
+        self.cursor = self.cursor.convert_alpha()
+
+    def draw_gcs(self, screen, gaze_positions):
+        """ draw the gaze-contingent windows of an (n, 2) array of positions on screen in one batch """
+        top_lefts = gaze_positions - (self.cursor_size[0] // 2, self.cursor_size[1] // 2)
+        if hasattr(screen, 'blits'):
+            screen.blits([(self.cursor, top_left) for top_left in top_lefts.tolist()], doreturn=False)
+        else:
+            # Surface.blits is not available before pygame 1.9.4
+            for top_left in top_lefts.tolist():
+                screen.blit(self.cursor, top_left)
+
+
+class GazeHeatmap:
+    """ Draw the gazes of a frame as a heat map: the gazes are counted on a coarse grid, blurred with a gaussian
+        kernel and drawn as one translucent surface scaled to the screen """
+
+    def __init__(self, screen_size, cell_size=4, sigma=1.5):
+        self.screen_size = screen_size
+        self.cell_size = cell_size
+        self.grid_size = (screen_size[0] // cell_size + 1, screen_size[1] // cell_size + 1)
+        # the blur is separable: heat = blur_x . counts . blur_y
+        self.blur_x = self.make_blur_matrix(self.grid_size[0], sigma)
+        self.blur_y = self.make_blur_matrix(self.grid_size[1], sigma)
+
+    @staticmethod
+    def make_blur_matrix(n, sigma):
+        index = np.arange(n)
+        return np.exp(-0.5 * ((index[:, None] - index[None, :]) / sigma) ** 2)
+
+    def draw(self, screen, gaze_positions):
+        if len(gaze_positions) == 0:
+            return
+        cells = (gaze_positions // self.cell_size).astype(np.int64)
+        cells[:, 0] = np.clip(cells[:, 0], 0, self.grid_size[0] - 1)
+        cells[:, 1] = np.clip(cells[:, 1], 0, self.grid_size[1] - 1)
+        counts = np.bincount(cells[:, 0] * self.grid_size[1] + cells[:, 1],
+                             minlength=self.grid_size[0] * self.grid_size[1]).reshape(self.grid_size)
+        heat = self.blur_x.dot(counts).dot(self.blur_y)
+        heat /= heat.max()
+
+        # from transparent red (few gazes) to opaque yellow (many gazes)
+        heat_surface = pygame.Surface(self.grid_size, pygame.SRCALPHA, 32)
+        rgb = pygame.surfarray.pixels3d(heat_surface)
+        rgb[:, :, 0] = 255
+        rgb[:, :, 1] = (255 * heat).astype(np.uint8)
+        rgb[:, :, 2] = 0
+        del rgb
+        alpha = pygame.surfarray.pixels_alpha(heat_surface)
+        alpha[:, :] = (200 * np.sqrt(heat)).astype(np.uint8)
+        del alpha
+        screen.blit(pygame.transform.smoothscale(heat_surface, self.screen_size), (0, 0))
+
 
 class DrawingStatus:
     def __init__(self):
@@ -30,7 +103,9 @@ class DrawingStatus:
     cur_frame_index = 0
     total_frame = 0
     target_fps = 60
+    speed = 1.0
     pause = False
+    draw_many_gazes = False
     terminated = False
 ds = DrawingStatus()
 
@@ -70,6 +145,35 @@ def check_gaze_range(pos_x, pos_y, w, h):
     return True
 
 
+def get_gazes_in_range(gaze, w, h):
+    """ Return the gazes (an (n, 2) array) within the screen, the same as check_gaze_range """
+    pos_x = gaze[:, 0]
+    pos_y = gaze[:, 1]
+    return gaze[~((pos_x < 0) | (pos_x > w) | (pos_y < 0) | (pos_y > h))]
+
+
+def draw_frame_gazes(screen, gaze, dw, heatmap=None):
+    """ Draw the gazes of a frame (an (n, 2) array in the game frame coordinates, or None) on the scaled frame,
+        as cursors, or as a heat map if heatmap is given """
+    if gaze is None or len(gaze) == 0:
+        return
+    gaze_positions = get_gazes_in_range(gaze.astype(np.float64), ORIGIN_SIZE[0], ORIGIN_SIZE[1]) * FRAME_SCALE
+    if heatmap is not None:
+        heatmap.draw(screen, gaze_positions)
+    else:
+        dw.draw_gcs(screen, gaze_positions)
+
+
+def load_scaled_frame(archive, png_fname, size):
+    """ Load and scale the png file of a frame from the archive.
+        Returns (surface, n_bytes), or (None, 0) if the file isn't in the archive """
+    if png_fname not in archive:
+        return None, 0
+    s = pygame.image.load(io.BytesIO(archive.read(png_fname)), png_fname)
+    s = pygame.transform.scale(s, size)
+    return s, s.get_pitch() * s.get_height()
+
+
 def event_handler_func():
     global ds
 
@@ -88,13 +192,19 @@ def event_handler_func():
                 print("Moving to next frame")
                 ds.cur_frame_id += 1
             elif event.key == pygame.K_F3:
-                p = float(raw_input("Seeking through the video. Enter a percentage in float: "))
+                p = float(input("Seeking through the video. Enter a percentage in float: "))
                 ds.cur_frame_id = int(p/100*ds.total_frame)
             elif event.key == pygame.K_SPACE:
                 ds.pause = not ds.pause
+            elif event.key == pygame.K_F7:
+                ds.speed /= 2
+                print("Setting replay speed to x%g" % ds.speed)
+            elif event.key == pygame.K_F8:
+                ds.speed *= 2
+                print("Setting replay speed to x%g" % ds.speed)
             elif event.key == pygame.K_F9:
                 ds.draw_many_gazes = not ds.draw_many_gazes
-                print("draw all gazes belonging to a frame: %s" % ("ON" if ds.draw_many_gazes else "OFF"))
+                print("draw the gazes of a frame as a heat map: %s" % ("ON" if ds.draw_many_gazes else "OFF"))
             elif event.key == pygame.K_F11:
                 ds.target_fps -= 2
                 print("Setting target FPS to %d" % ds.target_fps)
@@ -108,43 +218,36 @@ def event_handler_func():
     ds.target_fps = max(1, ds.target_fps)
 
 
-def visualize_csv(tar_fname, csv_fname):
+def visualize_csv(tar_fname, csv_fname, cache_mb=DEFAULT_CACHE_MB, is_seekable_cache=False, speed=1.0):
     # read from the csv file
-    frameid2pos, _, frameid2duration, _, _, _, frameid_list = data_reader.read_gaze_data_csv_file(csv_fname)
-    frameid_list = sorted(frameid_list, key=frameid_sort_key)
+    trial = data_reader.read_gaze_trial_file(csv_fname)
+    frameid_list = sorted(trial.frameid_list, key=frameid_sort_key)
 
-    # open the tar file
-    tar = tarfile.open(tar_fname, 'r')
-    png_files = tar.getnames()
+    # open the tar file (the png files are read from the archive when they are needed)
+    archive = frame_archive.open_frame_archive(tar_fname, is_seekable_cache)
+    png_files = archive.get_names()
+    if not archive.is_seekable:
+        print("The tar file is compressed, seeking backward is slow. Use --seekable-cache for a faster seeking.")
 
     preprocess_and_sanity_check(png_files, frameid_list)
 
     print("\nYou can control the replay using keyboard. Try pressing space/up/down/left/right.")
     print("For all available keys, see event_handler_func() code.\n")
-    temp_extract_dir = os.path.dirname(tar_fname) + "/gaze_data_tmp/"
-    if not os.path.exists(temp_extract_dir):
-        os.mkdir(temp_extract_dir)
-    print("Uncompressing PNG tar file")
-    tar.extractall(temp_extract_dir)
-    # get the full path
-    temp_extract_full_path_dir = temp_extract_dir + '/' + png_files[0].split('/')[0]
-    print("Uncompressed PNG tar file into temporary directory: " + temp_extract_full_path_dir)
+    based_dir = png_files[0].split('/')[0]
 
     # init pygame and other stuffs
-    origin_w = 160
-    x_scale = 2.0
-    origin_h = 210
-    y_scale = 2.0
-    w, h = int(origin_w*x_scale), int(origin_h*y_scale)
+    w, h = SCREEN_SIZE
 
     global ds
     ds.target_fps = 60
     ds.total_frame = len(png_files)
+    ds.speed = speed
     ds.cur_frame_id = 0
     ds.terminated = False
 
     # init Drawgc Wrapper
     dw = DrawgcWrapper()
+    heatmap = GazeHeatmap((w, h))
 
     # init pygame
     pygame.init()
@@ -152,48 +255,62 @@ def visualize_csv(tar_fname, csv_fname):
     pygame_font = pygame.font.SysFont('Consolas', 28)
     pygame.display.set_mode((w, h), pygame.RESIZABLE | pygame.DOUBLEBUF | pygame.RLEACCEL, 32)
     screen = pygame.display.get_surface()
+    dw.convert_cursor()
+
+    # load the frames around the current one in a background thread
+    # (in a compressed archive, loading the frames behind would decompress it again from the beginning)
+    frame_cache = frame_loader.FrameCache(cache_mb)
+    prefetcher = frame_loader.FramePrefetcher(
+        lambda index: load_scaled_frame(archive, based_dir + '/' + frameid_list[index] + '.png', (w, h)),
+        len(frameid_list), frame_cache, n_behind=30 if archive.is_seekable else 0)
+    prefetcher.start()
+
+    # pace the replay on the recorded frame durations (frames are dropped when the replay is behind)
+    scheduler = replay_scheduler.ReplayScheduler(
+        [trial.get_value('duration', trial.frame_index(frameid)) for frameid in frameid_list], ds.speed,
+        1000.0 / ds.target_fps)
 
     while ds.cur_frame_id < ds.total_frame:
+        cur_frame_id, pause, speed = ds.cur_frame_id, ds.pause, ds.speed
         event_handler_func()
+        if ds.speed != speed:
+            scheduler.set_speed(ds.speed)
+        # start the schedule again from the current frame after seeking, pausing or resuming
+        if ds.cur_frame_id != cur_frame_id or ds.pause != pause:
+            scheduler.seek(ds.cur_frame_id)
 
         # Load PNG file and draw the frame and the gaze-contingent window
         frame_id = frameid_list[ds.cur_frame_id]
-        png_fname = temp_extract_full_path_dir + '/' + frame_id + '.png'
+        s = prefetcher.get_frame(ds.cur_frame_id)
         # check if the corresponding png file exists
-        if not os.path.isfile(png_fname):
+        if s is None:
             screen.fill((0, 0, 0))
             text_surface_desc = pygame_font.render('Missing png file for frame id:', True, (255, 255, 255))
             screen.blit(text_surface_desc, (w // 10, 2 * h // 5))
             text_surface_frameid = pygame_font.render(frame_id, True, (255, 255, 255))
             screen.blit(text_surface_frameid, (w // 10, 3 * h // 5))
         else:
-            s = pygame.image.load(png_fname)
-            s = pygame.transform.scale(s, (w, h))
             screen.blit(s, (0, 0))
 
-            # visualize the gaze
-            gaze_list = frameid2pos[frame_id]
-            if gaze_list is not None and len(gaze_list) > 0:
-                for (posX, posY) in gaze_list:
-                    if check_gaze_range(posX, posY, origin_w, origin_h):
-                        dw.draw_gc(screen, (posX*x_scale, posY*y_scale))
+            # visualize the gaze (all the gazes of the frame are filtered, scaled and drawn at once)
+            draw_frame_gazes(screen, trial.get_gaze(trial.frame_index(frame_id)), dw,
+                             heatmap if ds.draw_many_gazes else None)
 
         pygame.display.flip()
 
-        if not ds.pause:
-            ds.cur_frame_id = ds.cur_frame_id + 1
         if ds.terminated:
             break
+        if not ds.pause:
+            scheduler.frame_shown(ds.cur_frame_id)
+            ds.cur_frame_id = scheduler.wait_next_frame(ds.cur_frame_id)
+        else:
+            time.sleep(1.0 / ds.target_fps)
 
-        duration = frameid2duration[frame_id]
-        if duration is not None:
-            time.sleep(duration * 0.001)  # duration is in msec
-
+    prefetcher.stop()
     print("Replay ended.")
-
-    # remove the temporary files
-    print("Deleting PNG files in temporary directory.")
-    shutil.rmtree(temp_extract_full_path_dir)
+    print(frame_cache.get_report())
+    print(scheduler.get_report())
+    archive.close()
 
 
 def do_testing_visualize_csv():
@@ -203,13 +320,19 @@ def do_testing_visualize_csv():
 
 
 if __name__ == '__main__':
+    cache_mb = utils.pop_int_option(sys.argv, '--cache-mb', DEFAULT_CACHE_MB)
+    is_seekable_cache = utils.pop_flag(sys.argv, '--seekable-cache')
+    speed = utils.pop_float_option(sys.argv, '--speed', 1.0)
     if len(sys.argv) < 3:
-        print('Usage: python data_visualizer.py tar_fname csv_fname')
+        print('Usage: python data_visualizer.py tar_fname csv_fname [--cache-mb N] [--seekable-cache] [--speed X]')
+        exit(1)
+    if speed <= 0:
+        print('For the option --speed, please use a positive number')
         exit(1)
 
     tar_fname = sys.argv[1]
     csv_fname = sys.argv[2]
 
-    visualize_csv(tar_fname, csv_fname)
+    visualize_csv(tar_fname, csv_fname, cache_mb, is_seekable_cache, speed)
 
 
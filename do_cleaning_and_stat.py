@@ -6,12 +6,21 @@
 # -----------------------
 import sys
 import data_cleaning
-import data_stat
+import gaze_events
+import utils
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 3:
-        print('Usage: python data_cleaning_and_stat.py source_dir dest_dir [whether to include titles in txt file]')
+    n_workers = utils.pop_int_option(sys.argv, '--workers', 1)
+    is_rebuild = utils.pop_flag(sys.argv, '--rebuild')
+    is_binary = utils.pop_flag(sys.argv, '--binary')
+    event_method = utils.pop_option(sys.argv, '--events', None, str, 'ivt or idt')
+    profile_fpath = utils.pop_option(sys.argv, '--profile', None, str, 'a report file')
+    cprofile_fname = utils.pop_option(sys.argv, '--cprofile', None, str, 'an asc file name')
+    is_summary_csv = utils.pop_flag(sys.argv, '--summary-csv')
+    is_index = utils.pop_flag(sys.argv, '--index')
+    if len(sys.argv) < 3 or event_method not in (None,) + gaze_events.EVENT_METHODS:
+        print('Usage: python data_cleaning_and_stat.py source_dir dest_dir [whether to include titles in txt file] [--workers N] [--rebuild] [--binary] [--events ivt|idt] [--index] [--profile report.json] [--cprofile asc_fname] [--summary-csv]')
         exit(1)
 
     source_dir = sys.argv[1]
@@ -27,7 +36,11 @@ if __name__ == '__main__':
             exit(1)
 
     print('#'*20)
-    data_cleaning.save_asc_files_in_dir_to_csv(source_dir, dest_dir, is_include_title=include_title)
-    print('#' * 20)
-    data_stat.do_per_trial_stat(dest_dir, dest_dir)
+    # the statistics are computed from the parsed asc files while converting them (the saved files are not read again)
+    # and read from the other trial files of dest_dir, so they cover every trial file in dest_dir
+    data_cleaning.save_asc_files_in_dir_to_csv(source_dir, dest_dir, is_include_title=include_title, n_workers=n_workers,
+                                               is_incremental=not is_rebuild, saved_as_binary=is_binary, is_stat=True,
+                                               event_method=event_method, profile_fpath=profile_fpath,
+                                               cprofile_fname=cprofile_fname, saved_summary_csv=is_summary_csv,
+                                               saved_index=is_index)
     print('#' * 20)
@@ -9,13 +9,15 @@ def read_excel(excel_fname, id_col_name, sheet_name, func_id_data_type=None):
     book = xlrd.open_workbook(excel_fname)
     sheet = book.sheet_by_name(sheet_name)
 
+    if sheet.nrows == 0:
+        return {}
     # read header values into the list
-    col_names = [str(sheet.cell(0, col_index).value) for col_index in xrange(sheet.ncols)]
+    col_names = [str(value) for value in sheet.row_values(0)]
+    # read the values column by column (one call per column instead of one per cell)
+    columns = [[str(value) for value in sheet.col_values(col_index, start_rowx=1)] for col_index in range(sheet.ncols)]
     data_dict = {}
-    for row_index in xrange(1, sheet.nrows):
-        col_data = {}
-        for col_index in xrange(sheet.ncols):
-            col_data[col_names[col_index]] = str(sheet.cell(row_index, col_index).value)
+    for row_values in zip(*columns):
+        col_data = dict(zip(col_names, row_values))
 
         if func_id_data_type is not None:
             data_dict[func_id_data_type(col_data[id_col_name])] = col_data
@@ -25,67 +27,123 @@ def read_excel(excel_fname, id_col_name, sheet_name, func_id_data_type=None):
     return data_dict
 
 
-def fill_excel_col(dest_excel_fname, dest_col_name, dest_id_col_name, dest_sheet_name
-                   , source_excel_name, source_col_name, source_id_col_name, source_sheet_name
-                   , func_expected_data_type=None):
-    # read the source excel into data_dict
-    source_data = read_excel(source_excel_name, source_id_col_name, source_sheet_name)
+class ColumnSource:
+    """ The columns to copy from a source Excel file (see fill_excel_cols_from_sources)
+
+        excel_fname, sheet_name: the source sheet
+        id_col_name: the column of the source that has the ids of the rows
+        col_names: the source columns to copy
+        dest_col_names: the destination column of each source column
+        func_expected_data_type: converts the values (read as strings) before writing them, if not None """
+
+    def __init__(self, excel_fname, id_col_name, sheet_name, col_names, dest_col_names, func_expected_data_type=None):
+        self.excel_fname = excel_fname
+        self.id_col_name = id_col_name
+        self.sheet_name = sheet_name
+        self.col_names = col_names
+        self.dest_col_names = dest_col_names
+        self.func_expected_data_type = func_expected_data_type
+
+
+def get_col_indices(col_names):
+    """ The index of each column name (the first column if a name is repeated) """
+    col_indices = {}
+    for col_index, col_name in enumerate(col_names):
+        col_indices.setdefault(col_name, col_index)
+    return col_indices
+
+
+def load_source_columns(source):
+    """ Read the columns of the source (only the id column and the copied columns, each one in one call).
+        Returns a dictionary mapping the id (as a string) to the row index, and the values (as strings) of each
+        copied column """
+    book = xlrd.open_workbook(source.excel_fname, on_demand=True)
+    sheet = book.sheet_by_name(source.sheet_name)
+    col_indices = get_col_indices([str(value) for value in sheet.row_values(0)])
+    for col_name in [source.id_col_name] + list(source.col_names):
+        if col_name not in col_indices:
+            raise ValueError('There is no column %s in sheet %s of %s' % (col_name, source.sheet_name,
+                                                                          source.excel_fname))
+
+    ids = [str(value) for value in sheet.col_values(col_indices[source.id_col_name], start_rowx=1)]
+    # hash index on the ids (the last row of a repeated id is used)
+    id2row = dict((row_id, row_index) for row_index, row_id in enumerate(ids))
+    columns = [[str(value) for value in sheet.col_values(col_indices[col_name], start_rowx=1)]
+               for col_name in source.col_names]
+    book.release_resources()
+    return id2row, columns
+
+
+def fill_excel_cols_from_sources(dest_excel_fname, dest_id_col_name, dest_sheet_name, sources):
+    """ Fill the columns of the destination sheet with the values of the sources (a list of ColumnSource): the rows
+        are joined on their ids, and a row of the destination without a match in a source keeps its values.
+        Each workbook is read once, all the columns are filled in one pass over the rows, and the destination file
+        is written once (with the destination sheet only). The sources are applied in order, so a later source
+        overwrites the columns filled by an earlier one. A destination column that doesn't exist is added after
+        the last column """
+    source_columns = [load_source_columns(source) for source in sources]
 
     # read the destinated excel
     destinated_excel = xlrd.open_workbook(dest_excel_fname)
     destinated_sheet = destinated_excel.sheet_by_name(dest_sheet_name)
-
-    edited_excel_fname = '' + os.path.basename(dest_excel_fname)
-    edited_excel_dir = os.path.dirname(dest_excel_fname)
-    edited_destinated_excel = xlsxwriter.Workbook(os.path.join(edited_excel_dir, edited_excel_fname))
-    edited_destinated_sheet = edited_destinated_excel.add_worksheet(dest_sheet_name)
-
-    # find destinated id column index
-    destinated_id_col_index = 0
-    for col_index in xrange(destinated_sheet.ncols):
-        if str(destinated_sheet.cell(0, col_index).value) == dest_id_col_name:
-            destinated_id_col_index = col_index
-            break
-
-    # find destinated column index
-    destinated_col_index = 0
-    for col_index in xrange(destinated_sheet.ncols):
-        if str(destinated_sheet.cell(0, col_index).value) == dest_col_name:
-            destinated_col_index = col_index
-            break
-
-    for row_index in xrange(0, destinated_sheet.nrows):
-        # copy all other values
-        for col_index in xrange(destinated_sheet.ncols):
-            edited_destinated_sheet.write(row_index, col_index, destinated_sheet.cell(row_index, col_index).value)
-        # if row_index is 0, we just copy column names (titles), then continue
-        if row_index == 0:
-            continue
-
-        destinated_id = str(destinated_sheet.cell(row_index, destinated_id_col_index).value)
+    rows = [destinated_sheet.row_values(row_index) for row_index in range(destinated_sheet.nrows)]
+    if len(rows) == 0:
+        # empty sheet: the title row only has the added columns
+        rows.append([])
+    titles = rows[0]
+    col_indices = get_col_indices([str(value) for value in titles])
+    # the first column is the id column if there is no column of this name
+    destinated_id_col_index = col_indices.get(dest_id_col_name, 0)
+
+    # (source column, destination column index, conversion) of each filled column
+    fills = []
+    for source, (id2row, columns) in zip(sources, source_columns):
+        for column, dest_col_name in zip(columns, source.dest_col_names):
+            if dest_col_name not in col_indices:
+                col_indices[dest_col_name] = len(titles)
+                titles.append(dest_col_name)
+            fills.append((id2row, column, col_indices[dest_col_name], source.func_expected_data_type))
+
+    n_col = len(titles)
+    for row_values in rows[1:]:
+        row_values.extend([''] * (n_col - len(row_values)))
+        destinated_id = str(row_values[destinated_id_col_index])
         # skip empty row
         if destinated_id.strip() == '':
             continue
-
-        if destinated_id in source_data:
-            source_value = source_data[destinated_id][source_col_name]
+        for id2row, column, dest_col_index, func_expected_data_type in fills:
+            source_row = id2row.get(destinated_id)
+            if source_row is None:
+                continue
+            source_value = column[source_row]
             # convert to expected data type
             if func_expected_data_type is not None:
                 source_value = func_expected_data_type(source_value)
-            edited_destinated_sheet.write(row_index, destinated_col_index, source_value)
+            row_values[dest_col_index] = source_value
 
+    # write the rows in order, in the constant memory mode
+    edited_destinated_excel = xlsxwriter.Workbook(dest_excel_fname, {'constant_memory': True})
+    edited_destinated_sheet = edited_destinated_excel.add_worksheet(dest_sheet_name)
+    for row_index, row_values in enumerate(rows):
+        edited_destinated_sheet.write_row(row_index, 0, row_values)
     # save the excel
     edited_destinated_excel.close()
 
 
+def fill_excel_col(dest_excel_fname, dest_col_name, dest_id_col_name, dest_sheet_name
+                   , source_excel_name, source_col_name, source_id_col_name, source_sheet_name
+                   , func_expected_data_type=None):
+    fill_excel_cols(dest_excel_fname, [dest_col_name], dest_id_col_name, dest_sheet_name
+                    , source_excel_name, [source_col_name], source_id_col_name, source_sheet_name
+                    , func_expected_data_type)
+
+
 def fill_excel_cols(dest_excel_fname, dest_col_names, dest_id_col_name, dest_sheet_name
                     , source_excel_name, source_col_names, source_id_col_name, source_sheet_name
                     , func_expected_data_type=None):
-    for i, dest_col_name in enumerate(dest_col_names):
-        source_col_name = source_col_names[i]
-        fill_excel_col(dest_excel_fname, dest_col_name, dest_id_col_name, dest_sheet_name
-                       , source_excel_name, source_col_name, source_id_col_name, source_sheet_name
-                       , func_expected_data_type)
+    source = ColumnSource(source_excel_name, source_id_col_name, source_sheet_name, source_col_names, dest_col_names,
+                          func_expected_data_type)
+    fill_excel_cols_from_sources(dest_excel_fname, dest_id_col_name, dest_sheet_name, [source])
 
 
 def func_to_int(value):
@@ -96,32 +154,45 @@ def func_to_float(value):
     return float(value)
 
 
-def fill_meta_data():
+DESTINATED_EXCEL_FNAME = '/Users/lguan/Documents/Study/Research/Gaze-Dataset/data_processing/csv/results.xlsx'
+DESTINATED_ID_NAME = 'TrialNumber'
+DESTINATED_SHEET_NAME = 'Sheet1'
+
+
+def get_meta_data_source():
     sour_excel_fname = '/Users/lguan/Documents/Study/Research/Gaze-Dataset/data_processing/csv/1551916382338_meta.xlsx'
     sour_id_name = 'trial_id'
     sour_col_names = ['total_frame', 'avg_error']
     sour_sheet_name = 'Sheet1'
-    destinated_excel_fname = '/Users/lguan/Documents/Study/Research/Gaze-Dataset/data_processing/csv/results.xlsx'
-    destinated_id_name = 'TrialNumber'
     destinated_col_names = ['NumberOfFrames', 'AverageValError']
-    destinated_sheet_name = 'Sheet1'
+    return ColumnSource(sour_excel_fname, sour_id_name, sour_sheet_name, sour_col_names, destinated_col_names,
+                        func_to_float)
 
-    fill_excel_cols(destinated_excel_fname, destinated_col_names, destinated_id_name, destinated_sheet_name,
-                    sour_excel_fname, sour_col_names, sour_id_name, sour_sheet_name, func_to_float)
 
-
-def fill_score_data():
+def get_score_data_source():
     sour_excel_fname = '/Users/lguan/Documents/Study/Research/Gaze-Dataset/data_processing/csv/stat_data.xlsx'
     sour_id_name = 'trial_id'
     sour_col_names = ['highest_score']
     sour_sheet_name = 'Sheet1'
-    destinated_excel_fname = '/Users/lguan/Documents/Study/Research/Gaze-Dataset/data_processing/csv/results.xlsx'
-    destinated_id_name = 'TrialNumber'
     destinated_col_names = ['BestScore']
-    destinated_sheet_name = 'Sheet1'
+    return ColumnSource(sour_excel_fname, sour_id_name, sour_sheet_name, sour_col_names, destinated_col_names,
+                        func_to_float)
+
+
+def fill_meta_data():
+    fill_excel_cols_from_sources(DESTINATED_EXCEL_FNAME, DESTINATED_ID_NAME, DESTINATED_SHEET_NAME,
+                                 [get_meta_data_source()])
+
+
+def fill_score_data():
+    fill_excel_cols_from_sources(DESTINATED_EXCEL_FNAME, DESTINATED_ID_NAME, DESTINATED_SHEET_NAME,
+                                 [get_score_data_source()])
+
 
-    fill_excel_cols(destinated_excel_fname, destinated_col_names, destinated_id_name, destinated_sheet_name,
-                    sour_excel_fname, sour_col_names, sour_id_name, sour_sheet_name, func_to_float)
+def fill_meta_and_score_data():
+    """ fill_meta_data and fill_score_data in one pass (the results file is read and written once) """
+    fill_excel_cols_from_sources(DESTINATED_EXCEL_FNAME, DESTINATED_ID_NAME, DESTINATED_SHEET_NAME,
+                                 [get_meta_data_source(), get_score_data_source()])
 
 
 if __name__ == '__main__':
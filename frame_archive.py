@@ -0,0 +1,112 @@
+# frame_archive.py
+#
+# Read the png files of the frames directly from the tar archive (without extracting it to disk)
+# A compressed archive can be converted once to a seekable (uncompressed zip) file, cached next to the archive (or in
+# a cache directory)
+# -----------------------
+import os
+import tarfile
+import threading
+import zipfile
+
+
+# the seekable copy of an archive is saved as archive_fname + SEEKABLE_SUFFIX (in the cache directory if there is one)
+SEEKABLE_SUFFIX = '.frames.zip'
+# magic numbers of the compressed archives (bz2, gzip, xz)
+COMPRESSED_MAGIC_NUMBERS = (b'BZh', b'\x1f\x8b', b'\xfd7zXZ')
+
+
+def is_compressed_archive(fname):
+    with open(fname, 'rb') as f:
+        header = f.read(6)
+    return any(header.startswith(magic_number) for magic_number in COMPRESSED_MAGIC_NUMBERS)
+
+
+class TarFrameArchive:
+    """ Read the files of a tar archive on demand. The index of the files is built once when opening.
+        Random access is fast in an uncompressed tar; in a compressed tar, reading a file before the last one read
+        decompresses the archive again from the beginning (is_seekable is False) """
+
+    def __init__(self, fname):
+        self.tar = tarfile.open(fname, 'r')
+        members = [member for member in self.tar.getmembers() if member.isfile()]
+        self.names = [member.name for member in members]
+        self.name2member = dict((member.name, member) for member in members)
+        self.is_seekable = not is_compressed_archive(fname)
+        # the frames are read by the replay loop and the prefetching thread
+        self.lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self.name2member
+
+    def get_names(self):
+        return list(self.names)
+
+    def read(self, name):
+        with self.lock:
+            return self.tar.extractfile(self.name2member[name]).read()
+
+    def close(self):
+        self.tar.close()
+
+
+class ZipFrameArchive:
+    """ Read the files of a zip archive (the seekable copy of a compressed tar archive) on demand """
+
+    def __init__(self, fname):
+        self.zip = zipfile.ZipFile(fname, 'r')
+        self.names = [info.filename for info in self.zip.infolist() if not info.filename.endswith('/')]
+        self.name_set = set(self.names)
+        self.is_seekable = True
+        self.lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self.name_set
+
+    def get_names(self):
+        return list(self.names)
+
+    def read(self, name):
+        with self.lock:
+            return self.zip.read(name)
+
+    def close(self):
+        self.zip.close()
+
+
+def get_seekable_fname(archive_fname, cache_dir=None):
+    if cache_dir is not None:
+        return os.path.join(cache_dir, os.path.basename(archive_fname) + SEEKABLE_SUFFIX)
+    return archive_fname + SEEKABLE_SUFFIX
+
+
+def convert_to_seekable(archive_fname, seekable_fname):
+    """ Copy the files of the tar archive to an uncompressed zip file in one sequential pass
+        (the png files are already compressed) """
+    temp_fname = seekable_fname + '.tmp'
+    tar = tarfile.open(archive_fname, 'r|*')
+    zip_file = zipfile.ZipFile(temp_fname, 'w', zipfile.ZIP_STORED, allowZip64=True)
+    try:
+        for member in tar:
+            if member.isfile():
+                zip_file.writestr(member.name, tar.extractfile(member).read())
+    finally:
+        zip_file.close()
+        tar.close()
+    # replace the old file only when the new one is completely written
+    if os.path.exists(seekable_fname):
+        os.remove(seekable_fname)
+    os.rename(temp_fname, seekable_fname)
+
+
+def open_frame_archive(archive_fname, is_seekable_cache=False, cache_dir=None):
+    """ Open the archive of the frames. If is_seekable_cache is set and the archive is compressed, the archive is read
+        from its seekable copy (created the first time, or when the archive is newer than the copy), saved in
+        cache_dir (next to the archive if it is None) """
+    if is_seekable_cache and is_compressed_archive(archive_fname):
+        seekable_fname = get_seekable_fname(archive_fname, cache_dir)
+        if (not os.path.exists(seekable_fname)) or os.path.getmtime(seekable_fname) < os.path.getmtime(archive_fname):
+            print('Converting %s to the seekable file %s (only done once)' % (archive_fname, seekable_fname))
+            convert_to_seekable(archive_fname, seekable_fname)
+        return ZipFrameArchive(seekable_fname)
+    return TarFrameArchive(archive_fname)
@@ -0,0 +1,124 @@
+# frame_loader.py
+#
+# Load the frames of the replay ahead of (and behind) the current frame in a background thread
+# The loaded frames are kept in an LRU cache bounded by its size in MB
+# -----------------------
+import threading
+from collections import OrderedDict
+
+
+class FrameCache:
+    """ LRU cache of loaded frames (frame index -> frame), bounded by the total size of the frames """
+
+    def __init__(self, max_mb):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.frames = OrderedDict()
+        self.n_bytes = 0
+        self.n_hit = 0
+        self.n_miss = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, index):
+        with self.lock:
+            return index in self.frames
+
+    def get(self, index):
+        """ Return the frame (None if it is not in the cache), and count the hit or miss """
+        with self.lock:
+            if index not in self.frames:
+                self.n_miss += 1
+                return None
+            self.n_hit += 1
+            frame_and_size = self.frames.pop(index)
+            self.frames[index] = frame_and_size
+            return frame_and_size[0]
+
+    def put(self, index, frame, n_bytes):
+        """ Add the frame, then remove the least recently used frames until the cache fits in its size
+            (the new frame is always kept) """
+        with self.lock:
+            if index in self.frames:
+                self.n_bytes -= self.frames.pop(index)[1]
+            self.frames[index] = (frame, n_bytes)
+            self.n_bytes += n_bytes
+            while self.n_bytes > self.max_bytes and len(self.frames) > 1:
+                _, (_, old_n_bytes) = self.frames.popitem(last=False)
+                self.n_bytes -= old_n_bytes
+
+    def get_report(self):
+        n_access = self.n_hit + self.n_miss
+        hit_rate = 100.0 * self.n_hit / n_access if n_access > 0 else 0.0
+        return 'Frame cache: %d hits, %d misses (%.1f%% hit rate), %d frames in %.1f MB' % (
+            self.n_hit, self.n_miss, hit_rate, len(self.frames), self.n_bytes / (1024.0 * 1024.0))
+
+
+class FramePrefetcher:
+    """ Load the frames around the current position into the cache in a background thread
+
+        load_func(index): return (frame, n_bytes), or (None, 0) if the frame is not available (it is not cached)
+        n_ahead, n_behind: the number of frames to load after and before the current position
+        (the frames after it are loaded first) """
+
+    def __init__(self, load_func, n_frame, cache, n_ahead=120, n_behind=30):
+        self.load_func = load_func
+        self.n_frame = n_frame
+        self.cache = cache
+        self.n_ahead = n_ahead
+        self.n_behind = n_behind
+        self.position = 0
+        # the size of a loaded frame, to limit the prefetched frames to what fits in the cache
+        self.frame_bytes = None
+        self.is_stopped = False
+        self.position_changed = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.is_stopped = True
+        self.position_changed.set()
+        self.thread.join()
+
+    def set_position(self, index):
+        if index != self.position:
+            self.position = index
+            self.position_changed.set()
+
+    def load(self, index):
+        frame, n_bytes = self.load_func(index)
+        if frame is not None:
+            self.frame_bytes = max(n_bytes, 1)
+            self.cache.put(index, frame, n_bytes)
+        return frame
+
+    def get_frame(self, index):
+        """ Return the frame from the cache, or load it now if it hasn't been loaded yet """
+        self.set_position(index)
+        frame = self.cache.get(index)
+        if frame is None:
+            frame = self.load(index)
+        return frame
+
+    def get_prefetch_indices(self, position):
+        ahead = range(position, min(position + self.n_ahead + 1, self.n_frame))
+        behind = range(position - 1, max(position - self.n_behind, 0) - 1, -1)
+        indices = list(ahead) + list(behind)
+        if self.frame_bytes is not None:
+            # don't load more frames than the cache can keep, they would replace the nearest ones
+            indices = indices[:max(self.cache.max_bytes // self.frame_bytes, 1)]
+        return indices
+
+    def run(self):
+        while not self.is_stopped:
+            self.position_changed.clear()
+            position = self.position
+            for index in self.get_prefetch_indices(position):
+                # start again from the new position as soon as it changes
+                if self.is_stopped or self.position != position:
+                    break
+                if index not in self.cache:
+                    self.load(index)
+            else:
+                self.position_changed.wait()
@@ -0,0 +1,264 @@
+# gaze_events.py
+#
+# Detect the fixations and saccades in the gaze sample stream of a trial (see gaze_samples.GazeSamples)
+# I-VT: threshold on the velocity of the samples (measured over a short window)
+# I-DT: threshold on the dispersion of the samples in a time window
+# Per-frame event columns: n_fixation,fixation_duration,n_saccade,saccade_amplitude
+# -----------------------
+import numpy as np
+import gaze_samples
+
+
+EVENT_METHODS = ('ivt', 'idt')
+# approximate number of eye tracker screen pixels per degree of visual angle
+# (depends on the screen size and the viewing distance of the setup)
+PIXELS_PER_DEGREE = 35.0
+# I-VT: the samples moving faster than this (degrees/sec) are in saccades
+IVT_VELOCITY_THRESHOLD = 30.0
+# I-VT: the velocity of a sample is measured over this window (ms), to smooth the noise of the eye tracker
+IVT_VELOCITY_WINDOW = 20
+# I-DT: max dispersion ((max x - min x) + (max y - min y), in degrees) and min duration (ms) of a fixation
+IDT_DISPERSION_THRESHOLD = 1.0
+IDT_MIN_DURATION = 100
+# consecutive samples further apart than this (ms) are not connected (blink, lost tracking): no event spans them
+MAX_SAMPLE_GAP = 50
+# per-frame event columns, in the order of the events file
+EVENT_COLUMN_NAMES = ('n_fixation', 'fixation_duration', 'n_saccade', 'saccade_amplitude')
+EVENTS_TITLES = 'frame_id,n_fixation,fixation_duration(ms),n_saccade,saccade_amplitude(deg)\n'
+
+
+class GazeEvents:
+    """ The fixations and saccades detected in a GazeSamples.
+        Each event is the samples [start, stop) of the stream, the events are in the order of time """
+
+    def __init__(self, samples, fixation_start, fixation_stop, saccade_start, saccade_stop,
+                 pixels_per_degree=PIXELS_PER_DEGREE):
+        self.samples = samples
+        self.fixation_start = fixation_start
+        self.fixation_stop = fixation_stop
+        self.saccade_start = saccade_start
+        self.saccade_stop = saccade_stop
+        self.pixels_per_degree = pixels_per_degree
+
+    def n_fixation(self):
+        return len(self.fixation_start)
+
+    def n_saccade(self):
+        return len(self.saccade_start)
+
+    def get_fixation_durations(self):
+        """ The duration (ms) of each fixation, from its first to its last sample """
+        return self.samples.timestamp[self.fixation_stop - 1] - self.samples.timestamp[self.fixation_start]
+
+    def get_fixation_positions(self):
+        """ The mean position of the samples of each fixation, an (n_fixation, 2) array """
+        n_sample = (self.fixation_stop - self.fixation_start).astype(np.float64)
+        positions = np.zeros((self.n_fixation(), 2))
+        for i, values in enumerate((self.samples.x, self.samples.y)):
+            cumsum = np.concatenate(([0.0], np.cumsum(values)))
+            positions[:, i] = (cumsum[self.fixation_stop] - cumsum[self.fixation_start]) / n_sample
+        return positions
+
+    def get_saccade_durations(self):
+        return self.samples.timestamp[self.saccade_stop - 1] - self.samples.timestamp[self.saccade_start]
+
+    def get_saccade_amplitudes(self):
+        """ The distance (degrees) between the first and the last sample of each saccade """
+        dx = self.samples.x[self.saccade_stop - 1] - self.samples.x[self.saccade_start]
+        dy = self.samples.y[self.saccade_stop - 1] - self.samples.y[self.saccade_start]
+        return np.hypot(dx, dy) / self.pixels_per_degree
+
+
+def get_gap_mask(timestamp, max_gap=MAX_SAMPLE_GAP):
+    """ True for the intervals between consecutive samples that are too long to be in the same event """
+    return np.diff(timestamp) > max_gap
+
+
+def get_segment_bounds(gap_counts):
+    """ The first and the last sample of the gap-free stretch of each sample """
+    segment_starts = np.searchsorted(gap_counts, gap_counts, side='left')
+    segment_lasts = np.searchsorted(gap_counts, gap_counts, side='right') - 1
+    return segment_starts, segment_lasts
+
+
+def get_run_bounds(labels, is_break):
+    """ The runs of samples with the same label: returns run_starts, run_stops (exclusive) and the label of each run.
+        is_break is True for the samples that start a new run even when the label doesn't change """
+    run_starts = np.flatnonzero(np.concatenate(([True], (labels[1:] != labels[:-1]) | is_break[1:])))
+    run_stops = np.append(run_starts[1:], len(labels))
+    return run_starts, run_stops, labels[run_starts]
+
+
+def detect_events_ivt(timestamp, x, y, velocity_threshold=IVT_VELOCITY_THRESHOLD, velocity_window=IVT_VELOCITY_WINDOW,
+                      pixels_per_degree=PIXELS_PER_DEGREE, max_gap=MAX_SAMPLE_GAP):
+    """ I-VT: the velocity of each sample is measured between the samples half a window before and after it
+        (without crossing a gap), the samples under the threshold are in fixations and the others in saccades.
+        A run of samples with the same label (and without a gap) is an event.
+        Returns fixation_start, fixation_stop, saccade_start, saccade_stop (sample indices) """
+    empty = np.zeros(0, dtype=np.int64)
+    n_sample = len(timestamp)
+    if n_sample < 2:
+        return empty, empty, empty, empty
+    is_gap = get_gap_mask(timestamp, max_gap)
+    gap_counts = np.concatenate(([0], np.cumsum(is_gap)))
+    segment_starts, segment_lasts = get_segment_bounds(gap_counts)
+
+    interval = max(1, int(np.median(np.diff(timestamp))))
+    half_window = max(1, int(round(velocity_window / (2.0 * interval))))
+    indices = np.arange(n_sample)
+    before = np.maximum(indices - half_window, segment_starts)
+    after = np.minimum(indices + half_window, segment_lasts)
+    distance = np.hypot(x[after] - x[before], y[after] - y[before]) / pixels_per_degree
+    velocity = distance * 1000.0 / np.maximum(timestamp[after] - timestamp[before], 1)
+    # a sample alone in its stretch has no velocity, count it as a fixation sample
+    labels = ((velocity > velocity_threshold) & (after > before)).astype(np.int8)
+
+    run_starts, run_stops, run_labels = get_run_bounds(labels, np.concatenate(([False], is_gap)))
+    is_fixation = run_labels == 0
+    is_saccade = run_labels == 1
+    return run_starts[is_fixation], run_stops[is_fixation], run_starts[is_saccade], run_stops[is_saccade]
+
+
+def get_window_extremes(values, window):
+    """ The min and max of values[i:i + window] for each i in O(n log window): the ranges are doubled in size
+        until the next doubling would exceed the window, then two overlapping ranges cover the window """
+    low, high = values, values
+    span = 1
+    while span * 2 <= window:
+        low = np.minimum(low[:-span], low[span:])
+        high = np.maximum(high[:-span], high[span:])
+        span *= 2
+    shift = window - span
+    n_window = len(values) - window + 1
+    return (np.minimum(low[:n_window], low[shift:shift + n_window]),
+            np.maximum(high[:n_window], high[shift:shift + n_window]))
+
+
+def detect_events_idt(timestamp, x, y, dispersion_threshold=IDT_DISPERSION_THRESHOLD, min_duration=IDT_MIN_DURATION,
+                      pixels_per_degree=PIXELS_PER_DEGREE, max_gap=MAX_SAMPLE_GAP):
+    """ I-DT: a fixation starts with a window of at least min_duration whose dispersion is under the threshold,
+        and is extended while the dispersion stays under the threshold. The samples between two fixations
+        (without a gap) are a saccade.
+        The dispersion of all the initial windows is computed on the arrays, the loop only runs once per fixation.
+        Returns fixation_start, fixation_stop, saccade_start, saccade_stop (sample indices) """
+    empty = np.zeros(0, dtype=np.int64)
+    n_sample = len(timestamp)
+    if n_sample < 2:
+        return empty, empty, empty, empty
+    threshold = dispersion_threshold * pixels_per_degree
+    is_gap = get_gap_mask(timestamp, max_gap)
+    # number of gaps before each sample: the samples [i, j] are connected if gap_counts[j] == gap_counts[i]
+    gap_counts = np.concatenate(([0], np.cumsum(is_gap)))
+    gap_indices = np.flatnonzero(is_gap)
+
+    # the initial window: enough samples to cover min_duration at the usual sampling interval
+    interval = max(1, int(np.median(np.diff(timestamp))))
+    window = max(2, int(np.ceil(float(min_duration) / interval)) + 1)
+    if n_sample < window:
+        return empty, empty, empty, empty
+    low_x, high_x = get_window_extremes(x, window)
+    low_y, high_y = get_window_extremes(y, window)
+    window_ends = np.arange(window - 1, n_sample)
+    is_candidate = (((high_x - low_x) + (high_y - low_y) <= threshold) &
+                    (gap_counts[window_ends] == gap_counts[:len(window_ends)]) &
+                    (timestamp[window_ends] - timestamp[:len(window_ends)] >= min_duration))
+    candidates = np.flatnonzero(is_candidate)
+
+    fixation_start = []
+    fixation_stop = []
+    position = 0
+    while True:
+        i_candidate = int(np.searchsorted(candidates, position))
+        if i_candidate >= len(candidates):
+            break
+        start = int(candidates[i_candidate])
+        stop = start + window
+        # the fixation can't extend over the next gap
+        i_gap = int(np.searchsorted(gap_indices, start))
+        limit = int(gap_indices[i_gap]) + 1 if i_gap < len(gap_indices) else n_sample
+        window_x, window_y = x[start:stop], y[start:stop]
+        min_x, max_x, min_y, max_y = window_x.min(), window_x.max(), window_y.min(), window_y.max()
+        # extend by chunks of samples, doubling the chunk while it fits and halving it when it doesn't
+        step = window
+        while stop < limit:
+            next_stop = min(stop + step, limit)
+            chunk_x, chunk_y = x[stop:next_stop], y[stop:next_stop]
+            new_min_x, new_max_x = min(min_x, chunk_x.min()), max(max_x, chunk_x.max())
+            new_min_y, new_max_y = min(min_y, chunk_y.min()), max(max_y, chunk_y.max())
+            if (new_max_x - new_min_x) + (new_max_y - new_min_y) <= threshold:
+                min_x, max_x, min_y, max_y = new_min_x, new_max_x, new_min_y, new_max_y
+                stop = next_stop
+                step *= 2
+            elif next_stop - stop == 1:
+                break
+            else:
+                step = (next_stop - stop) // 2
+        fixation_start.append(start)
+        fixation_stop.append(stop)
+        position = stop
+
+    fixation_start = np.array(fixation_start, dtype=np.int64)
+    fixation_stop = np.array(fixation_stop, dtype=np.int64)
+    # a saccade goes from the last sample of a fixation to the first sample of the next one
+    saccade_start = fixation_stop[:-1] - 1
+    saccade_stop = fixation_start[1:] + 1
+    is_connected = gap_counts[saccade_stop - 1] == gap_counts[saccade_start]
+    return fixation_start, fixation_stop, saccade_start[is_connected], saccade_stop[is_connected]
+
+
+def detect_events(samples, method='ivt', pixels_per_degree=PIXELS_PER_DEGREE):
+    """ Detect the fixations and saccades (method: 'ivt' or 'idt', with the default thresholds) in the samples
+        that belong to a frame. Returns a GazeEvents """
+    if method not in EVENT_METHODS:
+        raise ValueError('Unknown event detection method %s (use one of %s)' % (method, ', '.join(EVENT_METHODS)))
+    sample_indices = np.flatnonzero(samples.frame_index != gaze_samples.NO_FRAME)
+    timestamp = samples.timestamp[sample_indices]
+    x = samples.x[sample_indices]
+    y = samples.y[sample_indices]
+    if method == 'ivt':
+        events = detect_events_ivt(timestamp, x, y, pixels_per_degree=pixels_per_degree)
+    else:
+        events = detect_events_idt(timestamp, x, y, pixels_per_degree=pixels_per_degree)
+    fixation_start, fixation_stop, saccade_start, saccade_stop = events
+    # back to the indices of all the samples (stop is one past the last sample of the event)
+    return GazeEvents(samples, sample_indices[fixation_start], sample_indices[fixation_stop - 1] + 1,
+                      sample_indices[saccade_start], sample_indices[saccade_stop - 1] + 1, pixels_per_degree)
+
+
+def compute_frame_events(events, n_frame):
+    """ Return a dictionary mapping event column name (see EVENT_COLUMN_NAMES) to an array of length n_frame.
+        An event is counted in the frame of its first sample. The durations are in ms and the sums of
+        the saccade amplitudes (degrees) are rounded to 2 decimals, like in the events file """
+    frame_index = events.samples.frame_index
+    fixation_frames = frame_index[events.fixation_start]
+    saccade_frames = frame_index[events.saccade_start]
+    frame_events = {
+        'n_fixation': np.bincount(fixation_frames, minlength=n_frame).astype(np.int64),
+        'fixation_duration': np.bincount(fixation_frames, weights=events.get_fixation_durations(),
+                                         minlength=n_frame).astype(np.int64),
+        'n_saccade': np.bincount(saccade_frames, minlength=n_frame).astype(np.int64),
+        'saccade_amplitude': np.round(np.bincount(saccade_frames, weights=events.get_saccade_amplitudes(),
+                                                  minlength=n_frame), 2)}
+    return frame_events
+
+
+def compute_trial_event_stat(frame_events):
+    """ The event statistics of a trial from its per-frame event columns """
+    n_fixation = int(frame_events['n_fixation'].sum())
+    total_fixation_duration = int(frame_events['fixation_duration'].sum())
+    n_saccade = int(frame_events['n_saccade'].sum())
+    total_saccade_amplitude = float(frame_events['saccade_amplitude'].sum())
+    return {'fixation_count': n_fixation,
+            'total_fixation_duration': total_fixation_duration,
+            'mean_fixation_duration': round(float(total_fixation_duration) / n_fixation, 2) if n_fixation > 0 else 0,
+            'saccade_count': n_saccade,
+            'mean_saccade_amplitude': round(total_saccade_amplitude / n_saccade, 2) if n_saccade > 0 else 0}
+
+
+def write_frame_events(frameid_strs, frame_events, fpath):
+    """ Save the per-frame event columns to a csv file (frameid_strs: the frame ids as in the gaze csv file) """
+    columns = [frame_events['n_fixation'].tolist(), frame_events['fixation_duration'].tolist(),
+               frame_events['n_saccade'].tolist(), frame_events['saccade_amplitude'].tolist()]
+    with open(fpath, 'w') as f:
+        f.write(EVENTS_TITLES)
+        f.write(''.join(['%s,%d,%d,%d,%.2f\n' % values for values in zip(frameid_strs, *columns)]))
@@ -0,0 +1,65 @@
+# gaze_samples.py
+#
+# The gaze samples of one trial as a contiguous stream (in the order of the asc file)
+# Per sample: timestamp (ms), x, y (eye tracker screen coordinates), pupil size, index of its frame in frameid_list
+# -----------------------
+from array import array
+import numpy as np
+
+
+# frame index of the samples that don't belong to a frame (see GazeSamples)
+NO_FRAME = -1
+
+
+class GazeSamples:
+    """ The gaze samples of a trial
+
+        timestamp: int64 array, the time of each sample (ms)
+        x, y: float arrays, the gaze position of each sample (not scaled to the game frame)
+        frame_index: int array, the index (in frameid_list) of the frame of each sample. It is NO_FRAME for the
+            samples that are not in frameid2pos: before the first frame and after the start of the last frame
+        pupil: float array, the pupil size of each sample (nan if it is not recorded) """
+
+    def __init__(self, timestamp, x, y, frame_index, pupil=None):
+        self.timestamp = timestamp
+        self.x = x
+        self.y = y
+        self.frame_index = frame_index
+        self.pupil = pupil if pupil is not None else np.full(len(timestamp), np.nan, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.timestamp)
+
+
+class SampleBuffer:
+    """ The gaze samples collected by data_reader while it parses an asc file, appended to one typed buffer per
+        column (about 36 bytes per sample, instead of a tuple of Python objects). The timestamps are kept as
+        doubles (exact up to 2**53 ms) because array has no 64-bit integer type in Python 2 """
+
+    def __init__(self):
+        self.timestamp = array('d')
+        self.x = array('d')
+        self.y = array('d')
+        self.pupil = array('f')
+        self.frame_index = array('l')
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def append(self, timestamp, x, y, pupil, frame_index):
+        self.timestamp.append(timestamp)
+        self.x.append(x)
+        self.y.append(y)
+        self.pupil.append(pupil)
+        self.frame_index.append(frame_index)
+
+
+def make_gaze_samples(sample_buffer, n_frame):
+    """ Convert the samples collected by data_reader.read_gaze_data_asc_file (a SampleBuffer) to a GazeSamples
+        (n_frame: the number of frames in frameid_list) """
+    frame_index = np.array(sample_buffer.frame_index, dtype=np.int64)
+    # the gazes after the start of the last frame are thrown out (the game has ended)
+    frame_index[frame_index == n_frame - 1] = NO_FRAME
+    return GazeSamples(np.array(sample_buffer.timestamp, dtype=np.int64), np.array(sample_buffer.x, dtype=np.float64),
+                       np.array(sample_buffer.y, dtype=np.float64), frame_index,
+                       np.array(sample_buffer.pupil, dtype=np.float32))
@@ -0,0 +1,165 @@
+# gaze_trial.py
+#
+# Columnar (NumPy) representation of the gaze data of one trial
+# Per-frame columns: episode_id,score,duration,unclipped_reward,action (int64 + null mask)
+# Gaze samples: one contiguous (N, 2) array + per-frame offsets (CSR-style)
+# -----------------------
+import gc
+from itertools import chain
+import numpy as np
+
+
+# per-frame columns, in the order of the CSV file format
+COLUMN_NAMES = ('episode', 'score', 'duration', 'unclipped_reward', 'action')
+# the placeholder frame id used by data_reader for the data before the first frame
+BEFORE_FIRST_FRAME = 'BEFORE-FIRST-FRAME'
+
+
+class GazeTrial:
+    """ The data of one trial stored as typed NumPy arrays
+
+        frameid_list: the frame ids (in the order of the file)
+        columns: a dictionary mapping column name (see COLUMN_NAMES) to an int64 array of length n_frame
+        null_masks: a dictionary mapping column name to a bool array, True where the value is null (None)
+        gaze: the gaze positions of all frames, an (N, 2) array
+        gaze_offsets: an int64 array of length n_frame+1, the gazes of frame i are gaze[gaze_offsets[i]:gaze_offsets[i+1]]
+        gaze_null_mask: a bool array, True where the gaze list of the frame is null (None)
+        gaze_decimals: if not None, the number of decimals of the recorded gaze positions (used to recover
+            the exact values when the gazes are stored as float32)
+        file_meta_data: the meta data of the trial (only available when read from an asc file)
+        frame_events: the per-frame fixation and saccade columns (see gaze_events.compute_frame_events), only
+            available when the events are detected while converting the asc file """
+
+    def __init__(self, frameid_list, columns, null_masks, gaze, gaze_offsets, gaze_null_mask,
+                 gaze_decimals=None, file_meta_data=None):
+        self.frameid_list = frameid_list
+        self.columns = columns
+        self.null_masks = null_masks
+        self.gaze = gaze
+        self.gaze_offsets = gaze_offsets
+        self.gaze_null_mask = gaze_null_mask
+        self.gaze_decimals = gaze_decimals
+        self.file_meta_data = file_meta_data
+        self.frame_events = None
+        self.frameid2index = None
+
+    def __len__(self):
+        return len(self.frameid_list)
+
+    def n_gaze(self):
+        return int(self.gaze_offsets[-1])
+
+    def nbytes(self):
+        """ The memory used by the arrays (frame ids excluded) """
+        n_bytes = self.gaze.nbytes + self.gaze_offsets.nbytes + self.gaze_null_mask.nbytes
+        for name in COLUMN_NAMES:
+            n_bytes += self.columns[name].nbytes + self.null_masks[name].nbytes
+        return n_bytes
+
+    def frame_index(self, frameid):
+        if self.frameid2index is None:
+            self.frameid2index = dict((frameid, i) for i, frameid in enumerate(self.frameid_list))
+        return self.frameid2index[frameid]
+
+    def slice_frames(self, start, stop):
+        """ The frames start..stop-1 (python slice bounds) as a GazeTrial of views of the arrays """
+        start, stop, _ = slice(start, stop).indices(len(self))
+        stop = max(start, stop)
+        gaze_start, gaze_stop = int(self.gaze_offsets[start]), int(self.gaze_offsets[stop])
+        columns = dict((name, self.columns[name][start:stop]) for name in COLUMN_NAMES)
+        null_masks = dict((name, self.null_masks[name][start:stop]) for name in COLUMN_NAMES)
+        return GazeTrial(self.frameid_list[start:stop], columns, null_masks, self.gaze[gaze_start:gaze_stop],
+                         self.gaze_offsets[start:stop + 1] - gaze_start, self.gaze_null_mask[start:stop],
+                         gaze_decimals=self.gaze_decimals, file_meta_data=self.file_meta_data)
+
+    def get_value(self, name, i_frame):
+        """ Return the value of the column for the frame (None if it is null) """
+        if self.null_masks[name][i_frame]:
+            return None
+        return int(self.columns[name][i_frame])
+
+    def get_gaze(self, i_frame):
+        """ Return the gazes of the frame as an (n, 2) array view (None if the gaze list is null) """
+        if self.gaze_null_mask[i_frame]:
+            return None
+        return self.gaze[self.gaze_offsets[i_frame]:self.gaze_offsets[i_frame + 1]]
+
+    def gaze_to_list(self, gaze):
+        if self.gaze_decimals is not None:
+            gaze = np.round(gaze.astype(np.float64), self.gaze_decimals)
+        values = gaze.ravel().tolist()
+        return list(zip(values[0::2], values[1::2]))
+
+    def to_gaze_data(self):
+        """ Compatibility accessor that returns the dictionaries of data_reader:
+            frameid2pos, frameid2action, frameid2duration, frameid2unclipped_reward, frameid2episode, frameid2score,
+            frameid_list (and file_meta_data if the trial has meta data)
+
+            Every frame gets an entry in every dictionary (None for null values), and the 'BEFORE-FIRST-FRAME'
+            entries are [] and None, the same as read_gaze_data_csv_file """
+        # building millions of gaze tuples triggers many useless collections, pause the garbage collector
+        is_gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.build_gaze_data()
+        finally:
+            if is_gc_enabled:
+                gc.enable()
+
+    def build_gaze_data(self):
+        frameid2data = {}
+        for name in COLUMN_NAMES:
+            values = self.columns[name].tolist()
+            if self.null_masks[name].any():
+                values = [None if is_null else value for value, is_null in zip(values, self.null_masks[name].tolist())]
+            frameid2value = {BEFORE_FIRST_FRAME: None}
+            frameid2value.update(zip(self.frameid_list, values))
+            frameid2data[name] = frameid2value
+
+        gaze_list = self.gaze_to_list(self.gaze)
+        offsets = self.gaze_offsets.tolist()
+        pos_lists = [gaze_list[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+        if self.gaze_null_mask.any():
+            pos_lists = [None if is_null else pos_list for pos_list, is_null in zip(pos_lists, self.gaze_null_mask.tolist())]
+        frameid2pos = {BEFORE_FIRST_FRAME: []}
+        frameid2pos.update(zip(self.frameid_list, pos_lists))
+
+        gaze_data = (frameid2pos, frameid2data['action'], frameid2data['duration'], frameid2data['unclipped_reward'],
+                     frameid2data['episode'], frameid2data['score'], list(self.frameid_list))
+        if self.file_meta_data is not None:
+            gaze_data += (self.file_meta_data,)
+        return gaze_data
+
+
+def make_gaze_trial(gaze_data, gaze_dtype=np.float32, gaze_decimals=None):
+    """ Convert the dictionaries returned by data_reader (read_gaze_data_asc_file or read_gaze_data_csv_file)
+        to a GazeTrial. The data of 'BEFORE-FIRST-FRAME' is not kept. """
+    frameid2pos = gaze_data[0]
+    frameid2data = {'action': gaze_data[1], 'duration': gaze_data[2], 'unclipped_reward': gaze_data[3],
+                    'episode': gaze_data[4], 'score': gaze_data[5]}
+    frameid_list = list(gaze_data[6])
+    file_meta_data = gaze_data[7] if len(gaze_data) > 7 else None
+    n_frame = len(frameid_list)
+
+    columns = {}
+    null_masks = {}
+    for name in COLUMN_NAMES:
+        frameid2value = frameid2data[name]
+        values = [frameid2value.get(frameid) for frameid in frameid_list]
+        null_mask = np.fromiter((v is None for v in values), dtype=bool, count=n_frame)
+        columns[name] = np.fromiter((0 if v is None else v for v in values), dtype=np.int64, count=n_frame)
+        null_masks[name] = null_mask
+
+    pos_lists = [frameid2pos.get(frameid) for frameid in frameid_list]
+    gaze_null_mask = np.fromiter((pos_list is None for pos_list in pos_lists), dtype=bool, count=n_frame)
+    pos_lists = [[] if pos_list is None else pos_list for pos_list in pos_lists]
+    gaze_offsets = np.zeros(n_frame + 1, dtype=np.int64)
+    gaze_offsets[1:] = np.cumsum(np.fromiter((len(pos_list) for pos_list in pos_lists), dtype=np.int64, count=n_frame))
+
+    # copy all the coordinates in one pass (x0, y0, x1, y1, ...)
+    n_gaze = int(gaze_offsets[-1])
+    gaze = np.fromiter(chain.from_iterable(chain.from_iterable(pos_lists)), dtype=gaze_dtype, count=2 * n_gaze)
+    gaze = gaze.reshape((n_gaze, 2))
+
+    return GazeTrial(frameid_list, columns, null_masks, gaze, gaze_offsets, gaze_null_mask,
+                     gaze_decimals=gaze_decimals, file_meta_data=file_meta_data)
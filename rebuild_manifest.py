@@ -0,0 +1,87 @@
+# rebuild_manifest.py
+#
+# Manifest of the converted asc files (saved in the dest dir), used to skip the files that haven't changed
+# Each entry: source file size, mtime and content hash, conversion options, output file names, trial id, meta data
+# (and the trial statistics if they were computed while converting)
+# -----------------------
+import os
+import json
+import hashlib
+
+
+MANIFEST_FNAME = 'asc_manifest.json'
+MANIFEST_VERSION = 2
+
+
+def compute_file_hash(fpath, block_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(fpath, 'rb') as f:
+        block = f.read(block_size)
+        while block:
+            sha1.update(block)
+            block = f.read(block_size)
+    return sha1.hexdigest()
+
+
+def make_file_record(fpath):
+    """ Record the size, mtime and content hash of the source file """
+    stat = os.stat(fpath)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': compute_file_hash(fpath)}
+
+
+def load_manifest(saved_dir):
+    """ Return a dictionary mapping source file path to its entry (empty if there is no valid manifest) """
+    manifest_fpath = os.path.join(saved_dir, MANIFEST_FNAME)
+    if not os.path.exists(manifest_fpath):
+        return {}
+    try:
+        with open(manifest_fpath, 'r') as f:
+            manifest = json.load(f)
+    except ValueError:
+        print('Warning: the manifest %s is corrupted. All asc files will be reconverted.' % manifest_fpath)
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest['files']
+
+
+def save_manifest(saved_dir, files):
+    manifest_fpath = os.path.join(saved_dir, MANIFEST_FNAME)
+    temp_fpath = manifest_fpath + '.tmp'
+    with open(temp_fpath, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'files': files}, f, indent=1)
+    # replace the old manifest only when the new one is completely written
+    if os.path.exists(manifest_fpath):
+        os.remove(manifest_fpath)
+    os.rename(temp_fpath, manifest_fpath)
+
+
+def make_entry(file_record, options, output_fnames, trial_id, file_meta_data, trial_stat=None):
+    entry = dict(file_record)
+    entry['options'] = options
+    entry['output_fnames'] = output_fnames
+    entry['trial_id'] = trial_id
+    entry['file_meta_data'] = file_meta_data
+    if trial_stat is not None:
+        entry['trial_stat'] = trial_stat
+    return entry
+
+
+def is_up_to_date(entry, fpath, options, saved_dir):
+    """ Check if the source file and the options are the same as when the entry was recorded,
+        and the output files still exist. The content hash is only computed when the mtime has changed. """
+    if entry is None or entry['options'] != options:
+        return False
+    for output_fname in entry['output_fnames']:
+        if not os.path.exists(os.path.join(saved_dir, output_fname)):
+            return False
+    stat = os.stat(fpath)
+    if stat.st_size != entry['size']:
+        return False
+    if stat.st_mtime == entry['mtime']:
+        return True
+    if compute_file_hash(fpath) != entry['sha1']:
+        return False
+    # the file is only touched, remember the new mtime to skip hashing next time
+    entry['mtime'] = stat.st_mtime
+    return True
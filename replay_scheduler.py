@@ -0,0 +1,97 @@
+# replay_scheduler.py
+#
+# Pace the replay on the recorded frame durations against a monotonic clock
+# Frames are dropped when the replay is behind, and the achieved FPS and lag are reported
+# -----------------------
+import time
+from bisect import bisect_right
+
+
+# time.monotonic is not available in Python 2
+clock = getattr(time, 'monotonic', time.time)
+# interval of the FPS and lag reports (in seconds)
+REPORT_INTERVAL = 5.0
+
+
+class ReplayScheduler:
+    """ Map the clock to the replay time: frame i starts at the sum of the durations of the frames before it
+        (divided by the speed). The schedule is anchored again when seeking, pausing or changing the speed.
+
+        durations_ms: the recorded duration of each frame in msec (None uses default_duration_ms) """
+
+    def __init__(self, durations_ms, speed=1.0, default_duration_ms=1000.0 / 60):
+        self.frame_times = []
+        frame_time = 0.0
+        for duration in durations_ms:
+            self.frame_times.append(frame_time)
+            frame_time += (duration if duration is not None else default_duration_ms) * 0.001
+        self.end_time = frame_time
+        self.speed = speed
+        self.anchor_clock = clock()
+        self.anchor_time = 0.0
+
+        # statistics of the displayed frames
+        self.n_shown = 0
+        self.n_dropped = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.start_clock = self.anchor_clock
+        self.report_clock = self.anchor_clock
+        self.report_n_shown = 0
+
+    def get_replay_time(self, now):
+        return self.anchor_time + (now - self.anchor_clock) * self.speed
+
+    def get_due_clock(self, index):
+        return self.anchor_clock + (self.frame_times[index] - self.anchor_time) / self.speed
+
+    def seek(self, index):
+        """ Start the schedule again from the frame (after seeking or resuming) """
+        self.anchor_clock = clock()
+        self.anchor_time = self.frame_times[min(index, len(self.frame_times) - 1)] if self.frame_times else 0.0
+
+    def set_speed(self, speed):
+        """ Change the speed, keeping the current replay time """
+        now = clock()
+        self.anchor_time = self.get_replay_time(now)
+        self.anchor_clock = now
+        self.speed = speed
+
+    def wait_next_frame(self, index):
+        """ Wait until the frame after index is due and return the index of the frame to show: the latest frame that
+            is due, so the frames that are already late are dropped (len(frame_times) at the end of the replay) """
+        next_index = index + 1
+        if next_index >= len(self.frame_times):
+            # show the last frame for its duration
+            end_clock = self.anchor_clock + (self.end_time - self.anchor_time) / self.speed
+            self.sleep_until(end_clock)
+            return len(self.frame_times)
+        self.sleep_until(self.get_due_clock(next_index))
+        show_index = max(next_index, bisect_right(self.frame_times, self.get_replay_time(clock())) - 1)
+        self.n_dropped += show_index - next_index
+        return show_index
+
+    def sleep_until(self, due_clock):
+        delay = due_clock - clock()
+        if delay > 0:
+            time.sleep(delay)
+
+    def frame_shown(self, index):
+        """ Record that the frame is displayed, and print the FPS and lag every REPORT_INTERVAL seconds """
+        now = clock()
+        lag = max(0.0, now - self.get_due_clock(index))
+        self.n_shown += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        if now - self.report_clock >= REPORT_INTERVAL:
+            fps = (self.n_shown - self.report_n_shown) / (now - self.report_clock)
+            print('Replay: %.1f FPS, lag %.1f ms, %d frames dropped (speed x%g)' % (
+                fps, lag * 1000, self.n_dropped, self.speed))
+            self.report_clock = now
+            self.report_n_shown = self.n_shown
+
+    def get_report(self):
+        mean_lag = self.total_lag / self.n_shown if self.n_shown > 0 else 0.0
+        fps = self.n_shown / max(clock() - self.start_clock, 1e-9)
+        return 'Replay timing: %d frames shown (%.1f FPS), %d frames dropped, mean lag %.1f ms, max lag %.1f ms' % (
+            self.n_shown, fps, self.n_dropped, mean_lag * 1000, self.max_lag * 1000)
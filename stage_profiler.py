@@ -0,0 +1,135 @@
+# stage_profiler.py
+#
+# Record the cost of each stage of the processing (parse, write csv, write meta, stat, Excel export)
+# Per stage: wall time, CPU time, bytes read and written, line count, and how much the stage raised the peak memory
+# of the process
+# The records of each file and of the whole run are saved to a JSON report
+# -----------------------
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+
+# time.process_time is not available in Python 2 (time.clock is the CPU time of the process on Unix)
+cpu_clock = getattr(time, 'process_time', None) or time.clock
+
+
+def get_max_rss_mb():
+    """ The peak resident memory of the process since it started (its high-water mark, it never decreases).
+        None if it is not available on the platform """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in bytes on macOS, in KB on Linux
+    if sys.platform == 'darwin':
+        return peak_rss / float(1 << 20)
+    return peak_rss / 1024.0
+
+
+class StageProfiler:
+    """ The records of the stages of one file (or of the whole run)
+
+        stages: a list of dictionaries, one per stage (see measure)
+        line_counts: the number of lines matched by each branch of the asc parser
+            (see data_reader.LINE_BRANCHES) """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.line_counts = {}
+
+    def to_dict(self):
+        return {'name': self.name, 'stages': self.stages, 'line_counts': self.line_counts}
+
+
+@contextmanager
+def measure(profiler, stage_name):
+    """ Record the wall time, the CPU time and the memory of the code in the with block as a stage of the
+        profiler. The block can add bytes_read, bytes_written and n_line to the record it gets.
+        The memory is the high-water mark of the process (see get_max_rss_mb), which the stages before can have set:
+        max_rss_mb is its value at the end of the stage (for the process, not the stage), max_rss_growth_mb is how
+        much the stage raised it (0 if the stage used less memory than the peak of the process before it).
+        Nothing is recorded if profiler is None:
+
+            with stage_profiler.measure(profiler, 'parse') as record:
+                ...
+                record['bytes_read'] = n_bytes """
+    record = {'stage': stage_name}
+    if profiler is None:
+        yield record
+        return
+    start_max_rss = get_max_rss_mb()
+    start_time = time.time()
+    start_cpu_time = cpu_clock()
+    yield record
+    record['wall_time'] = time.time() - start_time
+    record['cpu_time'] = cpu_clock() - start_cpu_time
+    record['max_rss_mb'] = get_max_rss_mb()
+    record['max_rss_growth_mb'] = record['max_rss_mb'] - start_max_rss if start_max_rss is not None else None
+    profiler.stages.append(record)
+
+
+def sum_stages(profiles):
+    """ The totals of each stage over the profiles, in the order of the first appearance of the stages.
+        max_rss_mb is the highest high-water mark at the end of the stage, max_rss_growth_mb is the sum of the growths
+        (the stages of one process add up to its peak memory) """
+    totals = {}
+    stage_names = []
+    for profile in profiles:
+        for record in profile['stages']:
+            name = record['stage']
+            if name not in totals:
+                stage_names.append(name)
+                totals[name] = {'stage': name, 'count': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'bytes_read': 0,
+                                'bytes_written': 0, 'n_line': 0, 'max_rss_mb': None, 'max_rss_growth_mb': None}
+            total = totals[name]
+            total['count'] += 1
+            for key in ('wall_time', 'cpu_time', 'bytes_read', 'bytes_written', 'n_line'):
+                total[key] += record.get(key, 0)
+            if record['max_rss_mb'] is not None:
+                total['max_rss_mb'] = max(total['max_rss_mb'] or 0.0, record['max_rss_mb'])
+                total['max_rss_growth_mb'] = (total['max_rss_growth_mb'] or 0.0) + record['max_rss_growth_mb']
+    return [totals[name] for name in stage_names]
+
+
+def sum_line_counts(profiles):
+    line_counts = {}
+    for profile in profiles:
+        for branch, count in profile['line_counts'].items():
+            line_counts[branch] = line_counts.get(branch, 0) + count
+    return line_counts
+
+
+def save_report(report_fpath, file_profiles, run_profile):
+    """ Save the profiles of the files and of the run (dictionaries, see StageProfiler.to_dict) to a JSON file,
+        with the totals of each stage, and print the totals """
+    all_profiles = list(file_profiles) + [run_profile]
+    report = {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'totals': sum_stages(all_profiles),
+              'line_counts': sum_line_counts(file_profiles), 'files': list(file_profiles), 'run': run_profile}
+    with open(report_fpath, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    print('Profile of %d files (saved to %s):' % (len(file_profiles), report_fpath))
+    for total in report['totals']:
+        if total['max_rss_mb'] is not None:
+            max_rss = '+%.0f MB (process peak %.0f MB)' % (total['max_rss_growth_mb'], total['max_rss_mb'])
+        else:
+            max_rss = 'n/a'
+        print('%-12s x%-5d wall %8.2f sec, cpu %8.2f sec, read %8.1f MB, written %8.1f MB, %10d lines, peak RSS %s' % (
+            total['stage'], total['count'], total['wall_time'], total['cpu_time'], total['bytes_read'] / float(1 << 20),
+            total['bytes_written'] / float(1 << 20), total['n_line'], max_rss))
+    return report
+
+
+def run_cprofile(func, args, prof_fpath):
+    """ Run func(*args) with cProfile and dump the statistics to prof_fpath (open it with pstats or snakeviz) """
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args)
+    finally:
+        profile.dump_stats(prof_fpath)
+        print('Saved the cProfile statistics to %s' % prof_fpath)
@@ -0,0 +1,70 @@
+# common.py
+#
+# Helpers of the tests: the modules of the repository are imported from its root directory
+# -----------------------
+import os
+import contextlib
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import asc_generator
+
+
+def make_asc_file(dir_name, n_frame, seed=0):
+    """ A synthetic asc file with missing samples and ignored lines (see asc_generator) """
+    asc_fpath = os.path.join(dir_name, '%d_SYN_%d_test.asc' % (100 + seed, n_frame))
+    trial = asc_generator.make_synthetic_trial(n_frame, sample_rate=250, missing_ratio=0.05, seed=seed)
+    asc_generator.write_asc_file(trial, asc_fpath, noise_ratio=0.05, seed=seed)
+    return asc_fpath
+
+
+def write_edge_asc_file(fname):
+    """ A short asc file with the unusual lines: repeated frame ids (whose frames have a different number of gazes
+        and both a reward), frames with few gazes, missing samples, samples without the pupil size, validation lines
+        and other lines """
+    lines = ['** CONVERTED FROM test.edf\n',
+             'MSG\t990 !CAL VALIDATION HV9 R RIGHT GOOD ERROR 0.50 avg. 1.20 max  OFFSET 0.26 deg.\n',
+             '990\t10.0\t20.0\t500.0\t...\n']
+    timestamp = 1000
+    frames = [(1, 12, 0), (2, 3, 1), (3, 15, 0), (2, 20, 1), (4, 0, 0), (5, 11, 1), (3, 2, 0), (6, 30, 0)]
+    for i, (frame, n_gaze, reward) in enumerate(frames):
+        lines.append('MSG\t%d SCR_RECORDER FRAMEID %d UTID aBc1\n' % (timestamp, frame))
+        if i % 3 == 0:
+            lines.append('MSG\t%d key_pressed atari_action %d\n' % (timestamp, i))
+        if reward:
+            lines.append('MSG\t%d reward %d\n' % (timestamp, 10 * i))
+        if i == 1:
+            lines.append('MSG\t%d episode 0\n' % timestamp)
+            lines.append('MSG\t%d score 7\n' % timestamp)
+        for j in range(n_gaze):
+            timestamp += 1
+            if j % 5 == 4:
+                lines.append('%d\t   .\t   .\t    0.0\t...\n' % timestamp)
+            elif j % 7 == 6:
+                # without the pupil size
+                lines.append('%d\t%.1f\t%.1f\n' % (timestamp, 100 + j, 200 - j * 0.5))
+            else:
+                lines.append('%d\t%.1f\t%.1f\t%.1f\t...\n' % (timestamp, 100 + j, 200 - j * 0.5, 800 + j))
+        lines.append('SFIX R   %d\n' % timestamp)
+        lines.append('MSG\t%d !V TRIAL_VAR block 1\n' % timestamp)
+        timestamp += 2
+    lines.append('MSG\t%d !CAL VALIDATION HV9 R RIGHT GOOD ERROR 0.40 avg. 0.90 max  OFFSET 0.26 deg.\n' % timestamp)
+    with open(fname, 'w') as f:
+        f.writelines(lines)
+
+
+def read_file(fpath):
+    with open(fpath, 'rb') as f:
+        return f.read()
+
+
+@contextlib.contextmanager
+def silence_stdout():
+    """ Hide the warnings printed by the readers """
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
@@ -0,0 +1,96 @@
+# test_data_cleaning.py
+#
+# The csv writer of data_cleaning against its reference implementations ('%.2f' % value, the previous
+# string-concatenation writer kept in benchmark.py and the conversion in memory)
+# -----------------------
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from common import make_asc_file, read_file
+import benchmark
+import data_cleaning
+import data_reader
+
+
+class FormatFloatsTest(unittest.TestCase):
+    """ data_cleaning.format_floats_2f against '%.2f' % value """
+
+    def check_values(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        text, value_ends, is_formatted = data_cleaning.format_floats_2f(values)
+        self.assertTrue(is_formatted.all())
+        self.assertEqual(text, ''.join(['%.2f,' % value for value in values.tolist()]))
+        self.assertEqual(value_ends.tolist(), np.cumsum([len('%.2f,' % value) for value in values.tolist()]).tolist())
+
+    def test_ties(self):
+        # the halves of the last decimal (not exact in binary, rounded on their exact value) and exact halves
+        ties = [i / 1000.0 for i in range(5, 100000, 10)] + [i / 8.0 for i in range(0, 8000)]
+        self.check_values(ties)
+        self.check_values([-value for value in ties])
+
+    def test_random_values(self):
+        rng = np.random.RandomState(0)
+        for scale in (1.0, 160.0, 1e4, 2e7):
+            self.check_values(rng.uniform(-scale, scale, 20000))
+        # the values of the gaze positions: 2 decimals divided by the gaze scale
+        self.check_values(np.round(rng.uniform(-200, 1500, 20000), 1) / 8.0)
+
+    def test_small_and_signed_zero(self):
+        self.check_values([0.0, -0.0, 0.004, -0.004, 0.005, -0.005, 0.0049999, -0.0050001, 1e-300, -1e-300])
+
+    def test_unformatted_values(self):
+        values = np.array([1.5, 1e10, -1e10, np.nan, np.inf, -np.inf, 2.25])
+        text, value_ends, is_formatted = data_cleaning.format_floats_2f(values)
+        self.assertEqual(is_formatted.tolist(), [True, False, False, False, False, False, True])
+        self.assertEqual(text[:value_ends[0]], '1.50,')
+        self.assertEqual(text[value_ends[-2]:], '2.25,')
+
+    def test_empty(self):
+        text, value_ends, is_formatted = data_cleaning.format_floats_2f(np.zeros(0))
+        self.assertEqual(text, '')
+        self.assertEqual(len(value_ends), 0)
+
+
+class CsvWriterTest(unittest.TestCase):
+    """ The csv files of data_cleaning against the previous string-concatenation writer, and the streaming mode
+        against the conversion in memory """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.asc_fpath = make_asc_file(self.temp_dir, 1500)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write(self):
+        reference_fpath = os.path.join(self.temp_dir, 'reference.txt')
+        gaze_data = data_reader.read_gaze_data_asc_file(self.asc_fpath, is_interactive=False)
+        benchmark.write_gaze_data_to_csv_concat(gaze_data, reference_fpath)
+        csv_dir = os.path.join(self.temp_dir, 'csv')
+        os.makedirs(csv_dir)
+        data_cleaning.save_gaze_data_asc_file_to_csv(self.asc_fpath, csv_dir, is_interactive=False)
+        csv_fpath = os.path.join(csv_dir, data_cleaning.get_csv_fname(self.asc_fpath))
+        self.assertEqual(read_file(csv_fpath), read_file(reference_fpath))
+
+    def test_streamed(self):
+        in_memory_dir = os.path.join(self.temp_dir, 'in_memory')
+        streamed_dir = os.path.join(self.temp_dir, 'streamed')
+        os.makedirs(in_memory_dir)
+        os.makedirs(streamed_dir)
+        data_cleaning.save_gaze_data_asc_file_to_csv(self.asc_fpath, in_memory_dir, is_interactive=False)
+        # small chunks, so that the frames are written over several chunks
+        write_chunk_frames = data_cleaning.WRITE_CHUNK_FRAMES
+        data_cleaning.WRITE_CHUNK_FRAMES = 7
+        try:
+            data_cleaning.stream_gaze_asc_file_to_csv(self.asc_fpath, streamed_dir, is_interactive=False)
+        finally:
+            data_cleaning.WRITE_CHUNK_FRAMES = write_chunk_frames
+        csv_fname = data_cleaning.get_csv_fname(self.asc_fpath)
+        self.assertEqual(read_file(os.path.join(streamed_dir, csv_fname)),
+                         read_file(os.path.join(in_memory_dir, csv_fname)))
+
+
+if __name__ == '__main__':
+    unittest.main()
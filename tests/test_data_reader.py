@@ -0,0 +1,145 @@
+# test_data_reader.py
+#
+# The readers of data_reader against their reference implementations (the previous versions kept in benchmark.py)
+# -----------------------
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from common import make_asc_file, silence_stdout, write_edge_asc_file
+import benchmark
+import data_cleaning
+import data_reader
+import gaze_trial
+
+
+class AscReaderTest(unittest.TestCase):
+    """ read_gaze_data_asc_file against the previous regex-chain parser kept in benchmark.py, and against the frames
+        streamed by iter_gaze_frames_asc_file """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.asc_fpath = make_asc_file(self.temp_dir, 1500)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def check_reference_parser(self, asc_fpath):
+        with silence_stdout():
+            gaze_data = data_reader.read_gaze_data_asc_file(asc_fpath, is_interactive=False)
+        reference_gaze_data = benchmark.read_gaze_data_asc_file_regex_chain(asc_fpath)
+        for data, reference_data in zip(gaze_data, reference_gaze_data):
+            self.assertEqual(data, reference_data)
+
+    def test_reference_parser(self):
+        self.check_reference_parser(self.asc_fpath)
+
+    def test_reference_parser_edge_cases(self):
+        asc_fpath = os.path.join(self.temp_dir, 'edge.asc')
+        write_edge_asc_file(asc_fpath)
+        self.check_reference_parser(asc_fpath)
+        with silence_stdout():
+            file_meta_data = data_reader.read_gaze_data_asc_file(asc_fpath, is_interactive=False)[7]
+        # the repeated frame ids are counted once, with the gazes of their last frame: the frame ids 3, 4 and 5, the
+        # last frame (6) and the 'BEFORE-FIRST-FRAME' have less than 10 gazes, out of 8 frames (the frame id 2 would
+        # be counted too with the gazes of its first frame)
+        self.assertEqual(file_meta_data['low_sample_rate'], '62.5%')
+        self.assertEqual(file_meta_data['total_frame'], 8)
+        self.assertEqual((file_meta_data['avg_error'], file_meta_data['max_error']), (0.4, 0.9))
+
+    def test_streamed_frames(self):
+        with silence_stdout():
+            gaze_data = data_reader.read_gaze_data_asc_file(self.asc_fpath, is_interactive=False)
+            file_meta_data = {}
+            frames = list(data_reader.iter_gaze_frames_asc_file(self.asc_fpath, False, file_meta_data=file_meta_data))
+        self.assertEqual([frame[0] for frame in frames[1:]], gaze_data[6])
+        for frame in frames:
+            frameid = frame[0]
+            self.assertEqual(frame[1], gaze_data[0][frameid])
+            self.assertEqual(frame[2], gaze_data[1][frameid])
+            for value, frameid2value in zip(frame[3:], gaze_data[2:6]):
+                self.assertEqual(value, frameid2value.get(frameid))
+        self.assertEqual(file_meta_data, gaze_data[7])
+
+
+class CsvReaderTest(unittest.TestCase):
+    """ read_gaze_data_csv_file against the previous per-line reader, on a csv file written by data_cleaning """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.asc_fpath = make_asc_file(self.temp_dir, 1500)
+        data_cleaning.save_gaze_data_asc_file_to_csv(self.asc_fpath, self.temp_dir, is_interactive=False)
+        self.csv_fpath = os.path.join(self.temp_dir, data_cleaning.get_csv_fname(self.asc_fpath))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_then_read(self):
+        gaze_data = data_reader.read_gaze_data_csv_file(self.csv_fpath)
+        self.assertEqual(gaze_data, benchmark.read_gaze_data_csv_file_per_line(self.csv_fpath))
+        # the frames and the recorded values of the asc file are read back (the gazes are scaled and rounded)
+        asc_gaze_data = data_reader.read_gaze_data_asc_file(self.asc_fpath, is_interactive=False)
+        self.assertEqual(gaze_data[6], ['%s_%d' % frameid for frameid in asc_gaze_data[6]])
+        for i in range(1, 6):
+            for frameid in asc_gaze_data[6]:
+                self.assertEqual(gaze_data[i]['%s_%d' % frameid], asc_gaze_data[i].get(frameid))
+
+    def test_without_titles(self):
+        no_title_dir = os.path.join(self.temp_dir, 'no_title')
+        os.makedirs(no_title_dir)
+        data_cleaning.save_gaze_data_asc_file_to_csv(self.asc_fpath, no_title_dir, is_include_title=False,
+                                                     is_interactive=False)
+        csv_fpath = os.path.join(no_title_dir, data_cleaning.get_csv_fname(self.asc_fpath))
+        self.assertEqual(data_reader.read_gaze_data_csv_file(csv_fpath),
+                         benchmark.read_gaze_data_csv_file_per_line(csv_fpath))
+
+
+
+class NpzReaderTest(unittest.TestCase):
+    """ The npz file of a trial against its csv file: read_gaze_data_file returns the same dictionaries """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def check_trial(self, trial, name):
+        csv_fpath = os.path.join(self.temp_dir, name + '.txt')
+        npz_fpath = os.path.join(self.temp_dir, name + '.npz')
+        with open(csv_fpath, 'w') as csv_file:
+            csv_file.write(data_cleaning.CSV_TITLES)
+            data_cleaning.write_gaze_trial_to_csv(trial, csv_file)
+        data_cleaning.save_gaze_trial_to_npz(trial, npz_fpath)
+        self.assertEqual(data_reader.read_gaze_data_file(npz_fpath), data_reader.read_gaze_data_file(csv_fpath))
+
+    def test_converted_trial(self):
+        asc_fpath = make_asc_file(self.temp_dir, 1500)
+        with silence_stdout():
+            trial = data_cleaning.save_gaze_trial_asc_file_to_csv(asc_fpath, self.temp_dir, is_interactive=False,
+                                                                  saved_as_binary=True)
+        npz_fpath = os.path.join(self.temp_dir, data_cleaning.get_npz_fname(asc_fpath))
+        csv_fpath = os.path.join(self.temp_dir, data_cleaning.get_csv_fname(asc_fpath))
+        self.assertEqual(data_reader.read_gaze_data_file(npz_fpath), data_reader.read_gaze_data_file(csv_fpath))
+        self.check_trial(trial, 'converted')
+
+    def test_rounded_gazes(self):
+        # the gazes of the csv file are the asc gazes divided by the gaze scale, rounded to 2 decimals: ties, negative
+        # values and values that round to -0.00
+        rng = np.random.RandomState(0)
+        n_frame, n_gaze = 200, 20
+        gaze = np.concatenate([np.round(rng.uniform(-300, 1500, (n_frame * n_gaze - 8, 2)), 2),
+                               [[0.04, -0.04], [0.02, -0.02], [1.0, -1.0], [8.04, -4.02], [21.4, -21.4],
+                                [0.125 * 8, -0.375 * 4], [2.675 * 8, -2.675 * 4], [1.005 * 8, -1.005 * 4]]])
+        frameid_list = [('UT_1', i) for i in range(n_frame)]
+        columns = dict((name, np.arange(n_frame, dtype=np.int64)) for name in gaze_trial.COLUMN_NAMES)
+        null_masks = dict((name, np.zeros(n_frame, dtype=bool)) for name in gaze_trial.COLUMN_NAMES)
+        gaze_offsets = np.arange(0, n_frame * n_gaze + 1, n_gaze, dtype=np.int64)
+        trial = gaze_trial.GazeTrial(frameid_list, columns, null_masks, gaze, gaze_offsets,
+                                     np.zeros(n_frame, dtype=bool))
+        self.check_trial(trial, 'rounded')
+
+
+if __name__ == '__main__':
+    unittest.main()
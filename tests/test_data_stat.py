@@ -0,0 +1,123 @@
+# test_data_stat.py
+#
+# data_stat.compute_trial_stat (array operations) against the frame by frame computation, and the statistics
+# computed while converting the asc files against data_stat.do_per_trial_stat
+# -----------------------
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from common import make_asc_file, silence_stdout
+import data_cleaning
+import data_reader
+import data_stat
+import gaze_trial
+import trial_table
+
+
+def make_random_gaze_data(rng):
+    """ The dictionaries of a random trial (see data_reader.read_gaze_data_asc_file), with null values, episode ids
+        that change back and forth, and repeated frame ids """
+    n_frame = rng.randint(0, 30)
+    frameid_list = [('UT_1', i) for i in range(n_frame)]
+    if n_frame > 2 and rng.random() < 0.5:
+        frameid_list[rng.randrange(n_frame)] = frameid_list[rng.randrange(n_frame)]
+    p_null = rng.choice([0, 0.05, 0.3])
+
+    def random_value(low, high):
+        return None if rng.random() < p_null else rng.randint(low, high)
+    episode = 0
+    data = [{gaze_trial.BEFORE_FIRST_FRAME: None} for _ in range(5)]
+    for frameid in frameid_list:
+        if rng.random() < 0.2:
+            episode += rng.choice([1, 1, -1, 0])
+        data[0][frameid] = random_value(0, 3)
+        data[1][frameid] = random_value(10, 60)
+        data[2][frameid] = random_value(-3, 5)
+        data[3][frameid] = None if rng.random() < p_null + 0.1 else episode
+        data[4][frameid] = random_value(-5, 50)
+    frameid2pos = dict((frameid, []) for frameid in frameid_list)
+    return (frameid2pos,) + tuple(data) + (frameid_list,)
+
+
+def run_trial_stat(func, *args):
+    """ The statistics with the type of each value (TypeError if the computation fails on the null values) """
+    try:
+        return sorted([(name, type(value).__name__, value) for name, value in func(*args).items()])
+    except TypeError:
+        return 'TypeError'
+
+
+class TrialStatTest(unittest.TestCase):
+
+    def check_trial(self, trial, gaze_data):
+        for is_ignore_null in (False, True):
+            self.assertEqual(run_trial_stat(data_stat.compute_trial_stat, trial, is_ignore_null),
+                             run_trial_stat(data_stat.compute_trial_stat_by_frame, gaze_data, is_ignore_null))
+
+    def test_random_trials(self):
+        rng = random.Random(1)
+        for _ in range(3000):
+            gaze_data = make_random_gaze_data(rng)
+            self.check_trial(gaze_trial.make_gaze_trial(gaze_data), gaze_data)
+
+    def test_repeated_frame_ids(self):
+        # the values of each line, as read from a csv file: a repeated frame id has different values on its lines
+        rng = random.Random(2)
+        for _ in range(3000):
+            trial = gaze_trial.make_gaze_trial(make_random_gaze_data(rng))
+            for name in gaze_trial.COLUMN_NAMES:
+                for i in range(len(trial)):
+                    if rng.random() < 0.3:
+                        trial.null_masks[name][i] = rng.random() < 0.3
+                        trial.columns[name][i] = rng.randint(0, 9)
+            self.check_trial(trial, trial.to_gaze_data())
+
+    def test_synthetic_trial(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            trial = data_reader.read_gaze_trial_asc_file(make_asc_file(temp_dir, 3000, seed=3), is_interactive=False)
+        finally:
+            shutil.rmtree(temp_dir)
+        # the frame by frame computation needs a value for each frame, as in the dictionaries of a csv file
+        self.check_trial(trial, trial.to_gaze_data())
+
+
+class ConversionStatTest(unittest.TestCase):
+    """ The statistics of data_cleaning.save_asc_files_in_dir_to_csv with is_stat (do_cleaning_and_stat.py) """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.saved_dir = os.path.join(self.temp_dir, 'csv')
+        self.asc_dirs = [os.path.join(self.temp_dir, name) for name in ('asc1', 'asc2')]
+        for asc_dir, seeds in zip(self.asc_dirs, [(1, 2), (3,)]):
+            os.makedirs(asc_dir)
+            for seed in seeds:
+                make_asc_file(asc_dir, 300, seed)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def read_stat(self, saved_dir):
+        return trial_table.read_table_excel(os.path.join(saved_dir, 'stat_data.xlsx')).to_dict()
+
+    def test_other_trial_files(self):
+        # the trial files of saved_dir that were converted from another asc directory are in the statistics too,
+        # as with data_stat.do_per_trial_stat on saved_dir
+        reference_dir = os.path.join(self.temp_dir, 'reference')
+        os.makedirs(reference_dir)
+        for saved_as_binary in (False, True):
+            with silence_stdout():
+                data_cleaning.save_asc_files_in_dir_to_csv(self.asc_dirs[0], self.saved_dir,
+                                                           saved_as_binary=saved_as_binary)
+                data_cleaning.save_asc_files_in_dir_to_csv(self.asc_dirs[1], self.saved_dir,
+                                                           saved_as_binary=saved_as_binary, is_stat=True)
+                data_stat.do_per_trial_stat(self.saved_dir, reference_dir)
+            stat_dict = self.read_stat(self.saved_dir)
+            self.assertEqual(sorted(stat_dict.keys()), [101, 102, 103])
+            self.assertEqual(stat_dict, self.read_stat(reference_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# test_excel_utils.py
+#
+# excel_utils.fill_excel_cols_from_sources (one pass over the rows for all the columns) against the previous merge,
+# which rewrote the destination file once per column
+# -----------------------
+import os
+import shutil
+import tempfile
+import unittest
+import xlrd
+import xlsxwriter
+from common import read_file
+import excel_utils
+
+
+def fill_excel_col_per_cell(dest_excel_fname, dest_col_name, dest_id_col_name, dest_sheet_name, source_excel_name,
+                            source_col_name, source_id_col_name, source_sheet_name, func_expected_data_type=None):
+    """ The previous version of excel_utils.fill_excel_col: the destination is read and written cell by cell """
+    source_data = excel_utils.read_excel(source_excel_name, source_id_col_name, source_sheet_name)
+    destinated_sheet = xlrd.open_workbook(dest_excel_fname).sheet_by_name(dest_sheet_name)
+    edited_destinated_excel = xlsxwriter.Workbook(dest_excel_fname)
+    edited_destinated_sheet = edited_destinated_excel.add_worksheet(dest_sheet_name)
+    destinated_id_col_index = 0
+    for col_index in range(destinated_sheet.ncols):
+        if str(destinated_sheet.cell(0, col_index).value) == dest_id_col_name:
+            destinated_id_col_index = col_index
+            break
+    destinated_col_index = 0
+    for col_index in range(destinated_sheet.ncols):
+        if str(destinated_sheet.cell(0, col_index).value) == dest_col_name:
+            destinated_col_index = col_index
+            break
+    for row_index in range(0, destinated_sheet.nrows):
+        for col_index in range(destinated_sheet.ncols):
+            edited_destinated_sheet.write(row_index, col_index, destinated_sheet.cell(row_index, col_index).value)
+        if row_index == 0:
+            continue
+        destinated_id = str(destinated_sheet.cell(row_index, destinated_id_col_index).value)
+        if destinated_id.strip() == '':
+            continue
+        if destinated_id in source_data:
+            source_value = source_data[destinated_id][source_col_name]
+            if func_expected_data_type is not None:
+                source_value = func_expected_data_type(source_value)
+            edited_destinated_sheet.write(row_index, destinated_col_index, source_value)
+    edited_destinated_excel.close()
+
+
+def write_sheet(fname, sheet_name, rows):
+    workbook = xlsxwriter.Workbook(fname)
+    sheet = workbook.add_worksheet(sheet_name)
+    for row_index, row_values in enumerate(rows):
+        sheet.write_row(row_index, 0, row_values)
+    workbook.close()
+
+
+def read_sheet(fname, sheet_name):
+    sheet = xlrd.open_workbook(fname).sheet_by_name(sheet_name)
+    return [sheet.row_values(row_index) for row_index in range(sheet.nrows)]
+
+
+# the destination: ids without a match in the sources, an empty row and an id column that is not the first one
+DEST_ROWS = [['Subject', 'TrialNumber', 'NumberOfFrames', 'AverageValError', 'BestScore'],
+             ['AB', 1, '', '', 10],
+             ['AB', 2, 5, 0.5, ''],
+             ['', '', '', '', ''],
+             ['CD', 7, '', '', ''],
+             ['CD', 3, 1, 1.5, 20]]
+# the sources: a repeated id (its last row is used) and columns that are not copied
+META_ROWS = [['trial_id', 'avg_error', 'max_error', 'total_frame'],
+             [1, 0.25, 1.0, 15000], [2, 0.75, 2.0, 18000], [3, 0.5, 1.5, 9000], [2, 0.125, 2.5, 19000],
+             [4, 0.5, 1.0, 100]]
+STAT_ROWS = [['highest_score', 'trial_id'], [300, 3], [700, 1], [450, 9]]
+
+
+class FillExcelColsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.meta_fname = os.path.join(self.temp_dir, 'meta.xlsx')
+        self.stat_fname = os.path.join(self.temp_dir, 'stat.xlsx')
+        write_sheet(self.meta_fname, 'Sheet1', META_ROWS)
+        write_sheet(self.stat_fname, 'Sheet1', STAT_ROWS)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_dest(self, name, rows=DEST_ROWS):
+        fname = os.path.join(self.temp_dir, name + '.xlsx')
+        write_sheet(fname, 'results', rows)
+        return fname
+
+    def meta_source(self, col_names=('total_frame', 'avg_error'), dest_col_names=('NumberOfFrames', 'AverageValError')):
+        return excel_utils.ColumnSource(self.meta_fname, 'trial_id', 'Sheet1', list(col_names), list(dest_col_names),
+                                        excel_utils.func_to_float)
+
+    def stat_source(self):
+        return excel_utils.ColumnSource(self.stat_fname, 'trial_id', 'Sheet1', ['highest_score'], ['BestScore'],
+                                        excel_utils.func_to_int)
+
+    def fill_per_cell(self, dest_fname, source):
+        for col_name, dest_col_name in zip(source.col_names, source.dest_col_names):
+            fill_excel_col_per_cell(dest_fname, dest_col_name, 'TrialNumber', 'results', source.excel_fname, col_name,
+                                    source.id_col_name, source.sheet_name, source.func_expected_data_type)
+
+    def test_fill_excel_cols(self):
+        dest_fname = self.make_dest('dest')
+        reference_fname = self.make_dest('reference')
+        excel_utils.fill_excel_cols(dest_fname, ['NumberOfFrames', 'AverageValError'], 'TrialNumber', 'results',
+                                    self.meta_fname, ['total_frame', 'avg_error'], 'trial_id', 'Sheet1',
+                                    excel_utils.func_to_float)
+        self.fill_per_cell(reference_fname, self.meta_source())
+        self.assertEqual(read_sheet(dest_fname, 'results'), read_sheet(reference_fname, 'results'))
+        self.assertEqual(read_sheet(dest_fname, 'results')[2], ['AB', 2, 19000, 0.125, ''])
+
+    def test_several_sources(self):
+        # one pass for both sources, against one merge per column
+        dest_fname = self.make_dest('dest')
+        reference_fname = self.make_dest('reference')
+        excel_utils.fill_excel_cols_from_sources(dest_fname, 'TrialNumber', 'results',
+                                                 [self.meta_source(), self.stat_source()])
+        self.fill_per_cell(reference_fname, self.meta_source())
+        self.fill_per_cell(reference_fname, self.stat_source())
+        self.assertEqual(read_sheet(dest_fname, 'results'), read_sheet(reference_fname, 'results'))
+
+    def test_missing_dest_column(self):
+        # a destination column that doesn't exist is added after the last column (the previous merge wrote its
+        # values over the first column)
+        dest_fname = self.make_dest('dest')
+        excel_utils.fill_excel_cols_from_sources(dest_fname, 'TrialNumber', 'results',
+                                                 [self.meta_source(['max_error'], ['MaxValError'])])
+        rows = read_sheet(dest_fname, 'results')
+        self.assertEqual(rows[0], DEST_ROWS[0] + ['MaxValError'])
+        self.assertEqual([row[:-1] for row in rows], DEST_ROWS)
+        self.assertEqual([row[-1] for row in rows[1:]], [1.0, 2.5, '', '', 1.5])
+
+    def test_missing_source_column(self):
+        dest_fname = self.make_dest('dest')
+        dest_content = read_file(dest_fname)
+        with self.assertRaises(ValueError):
+            excel_utils.fill_excel_cols_from_sources(dest_fname, 'TrialNumber', 'results',
+                                                     [self.meta_source(['min_error'], ['MinValError'])])
+        self.assertEqual(read_file(dest_fname), dest_content)
+
+    def test_empty_dest_sheet(self):
+        dest_fname = self.make_dest('dest', [])
+        excel_utils.fill_excel_cols_from_sources(dest_fname, 'TrialNumber', 'results', [self.meta_source()])
+        self.assertEqual(read_sheet(dest_fname, 'results'), [['NumberOfFrames', 'AverageValError']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# test_frame_index.py
+#
+# The random access to the frames of a trial file (data_reader.read_frames, read_episode) against the frames of the
+# whole trial, with and without a frame index, and with an index that is out of date
+# -----------------------
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from common import make_asc_file, silence_stdout
+import data_cleaning
+import data_reader
+import gaze_trial
+
+# python slice bounds: empty, negative, past the end and reversed ranges
+FRAME_RANGES = [(0, 10), (5, 5), (100, 1000), (-3, None), (None, None), (1495, 1505), (7, 3)]
+
+
+class FrameIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        asc_fpath = make_asc_file(self.temp_dir, 1500)
+        with silence_stdout():
+            data_cleaning.save_gaze_trial_asc_file_to_csv(asc_fpath, self.temp_dir, is_interactive=False,
+                                                          saved_as_binary=True)
+        self.csv_fpath = os.path.join(self.temp_dir, data_cleaning.get_csv_fname(asc_fpath))
+        self.npz_fpath = os.path.join(self.temp_dir, data_cleaning.get_npz_fname(asc_fpath))
+        self.index_fpath = data_reader.get_index_fpath(self.csv_fpath)
+        # a fixed mtime, so that a rewrite can keep it exactly
+        self.mtime = 1000000000
+        os.utime(self.csv_fpath, (self.mtime, self.mtime))
+        data_cleaning.save_frame_index(self.csv_fpath, self.index_fpath)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def check_trial(self, trial, expected_trial):
+        self.assertEqual(trial.frameid_list, expected_trial.frameid_list)
+        for name in gaze_trial.COLUMN_NAMES:
+            np.testing.assert_array_equal(trial.columns[name], expected_trial.columns[name])
+            np.testing.assert_array_equal(trial.null_masks[name], expected_trial.null_masks[name])
+        np.testing.assert_array_equal(trial.gaze, expected_trial.gaze)
+        np.testing.assert_array_equal(trial.gaze_offsets, expected_trial.gaze_offsets)
+        np.testing.assert_array_equal(trial.gaze_null_mask, expected_trial.gaze_null_mask)
+
+    def check_frames(self, fname):
+        trial = data_reader.read_gaze_trial_file(fname)
+        for start, stop in FRAME_RANGES:
+            frames = data_reader.read_frames(fname, start, stop)
+            self.check_trial(frames, trial.slice_frames(start, stop))
+            self.assertEqual(len(frames), len(range(len(trial))[start:stop]))
+
+    def check_episodes(self, fname):
+        trial = data_reader.read_gaze_trial_file(fname)
+        episode_ids, episode_starts, episode_stops = data_reader.get_episode_ranges(trial.columns['episode'],
+                                                                                    trial.null_masks['episode'])
+        self.assertEqual(episode_ids.tolist(), [0, 1, 2])
+        for episode_id, start, stop in zip(episode_ids, episode_starts, episode_stops):
+            episode = data_reader.read_episode(fname, int(episode_id))
+            self.check_trial(episode, trial.slice_frames(int(start), int(stop)))
+            self.assertEqual(episode.get_value('episode', 0), episode_id)
+        with self.assertRaises(ValueError):
+            data_reader.read_episode(fname, 3)
+
+    def test_indexed_csv_file(self):
+        self.check_frames(self.csv_fpath)
+        self.check_episodes(self.csv_fpath)
+
+    def test_csv_file_without_index(self):
+        os.remove(self.index_fpath)
+        self.check_frames(self.csv_fpath)
+        self.check_episodes(self.csv_fpath)
+
+    def test_npz_file(self):
+        self.check_frames(self.npz_fpath)
+        self.check_episodes(self.npz_fpath)
+
+    def test_same_size_rewrite(self):
+        # two frame lines of different lengths are swapped: the file has the same size and mtime, but the offsets
+        # of the index after the first line are wrong
+        with open(self.csv_fpath, 'rb') as f:
+            lines = f.readlines()
+        i = next(i for i in range(1, len(lines) - 1) if len(lines[i]) != len(lines[i + 1]))
+        lines[i], lines[i + 1] = lines[i + 1], lines[i]
+        with open(self.csv_fpath, 'wb') as f:
+            f.writelines(lines)
+        os.utime(self.csv_fpath, (self.mtime, self.mtime))
+        index = data_reader.load_npz_arrays(self.index_fpath)
+        self.assertEqual(os.path.getsize(self.csv_fpath), index['file_size'])
+        self.assertFalse(data_reader.is_index_up_to_date(index, self.csv_fpath))
+        with silence_stdout():
+            self.check_frames(self.csv_fpath)
+
+    def test_appended_frames(self):
+        with open(self.csv_fpath, 'a') as f:
+            f.write('abcDEF1_9999,null,null,null,null,null,null\n')
+        with silence_stdout():
+            frames = data_reader.read_frames(self.csv_fpath, -2, None)
+            self.check_frames(self.csv_fpath)
+        self.assertEqual(frames.frameid_list[-1], 'abcDEF1_9999')
+
+
+if __name__ == '__main__':
+    unittest.main()
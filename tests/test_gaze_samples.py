@@ -0,0 +1,99 @@
+# test_gaze_samples.py
+#
+# The gaze samples collected while parsing an asc file, and the samples sidecar file (data_cleaning --samples)
+# -----------------------
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from common import make_asc_file, silence_stdout, write_edge_asc_file
+import data_cleaning
+import data_reader
+import gaze_samples
+
+
+def read_asc_samples(fname):
+    """ The gaze samples of an asc file, parsed line by line: (timestamp, x, y, pupil size, frame index) of each
+        sample, with the frame index counted on the frame messages (NO_FRAME before the first frame and after the
+        start of the last frame) """
+    samples = []
+    frame_index = gaze_samples.NO_FRAME
+    with open(fname, 'r') as f:
+        for line in f:
+            tokens = line.split()
+            if 'SCR_RECORDER' in tokens:
+                frame_index += 1
+            elif line[:1].isdigit() and tokens[1] != '.':
+                pupil = float(tokens[3]) if len(tokens) > 3 else float('nan')
+                samples.append((int(tokens[0]), float(tokens[1]), float(tokens[2]), pupil, frame_index))
+    n_frame = frame_index + 1
+    return [sample[:4] + (gaze_samples.NO_FRAME if sample[4] == n_frame - 1 else sample[4],) for sample in samples]
+
+
+def parse_samples(asc_fpath):
+    sample_buffer = gaze_samples.SampleBuffer()
+    with silence_stdout():
+        gaze_data = data_reader.read_gaze_data_asc_file(asc_fpath, False, sample_buffer)
+    return gaze_data, gaze_samples.make_gaze_samples(sample_buffer, len(gaze_data[6]))
+
+
+class GazeSamplesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def check_samples(self, samples, expected_samples):
+        self.assertEqual(len(samples), len(expected_samples))
+        timestamp, x, y, pupil, frame_index = [np.array(values) for values in zip(*expected_samples)]
+        self.assertEqual(samples.timestamp.tolist(), timestamp.tolist())
+        np.testing.assert_array_equal(samples.x, x)
+        np.testing.assert_array_equal(samples.y, y)
+        np.testing.assert_array_equal(samples.pupil, pupil.astype(np.float32))
+        self.assertEqual(samples.frame_index.tolist(), frame_index.tolist())
+
+    def test_frame_index(self):
+        asc_fpath = os.path.join(self.temp_dir, 'edge.asc')
+        write_edge_asc_file(asc_fpath)
+        gaze_data, samples = parse_samples(asc_fpath)
+        self.assertEqual(samples.timestamp.dtype, np.int64)
+        self.check_samples(samples, read_asc_samples(asc_fpath))
+        # the sample before the first frame and the 24 samples of the last frame are outside the frames
+        self.assertEqual(samples.frame_index[0], gaze_samples.NO_FRAME)
+        self.assertEqual(samples.frame_index[1], 0)
+        self.assertTrue((samples.frame_index[-24:] == gaze_samples.NO_FRAME).all())
+        self.assertEqual(samples.frame_index[-25], len(gaze_data[6]) - 2)
+        self.assertTrue(np.isnan(samples.pupil).any())
+        # the samples of each frame (a repeated frame id has the samples of its last frame in frameid2pos)
+        frameid2index = dict((frameid, i) for i, frameid in enumerate(gaze_data[6]))
+        for frameid, i in frameid2index.items():
+            is_in_frame = samples.frame_index == i
+            self.assertEqual(list(zip(samples.x[is_in_frame].tolist(), samples.y[is_in_frame].tolist())),
+                             gaze_data[0][frameid])
+
+    def test_synthetic_trial(self):
+        asc_fpath = make_asc_file(self.temp_dir, 500)
+        self.check_samples(parse_samples(asc_fpath)[1], read_asc_samples(asc_fpath))
+
+    def test_sidecar_round_trip(self):
+        asc_fpath = make_asc_file(self.temp_dir, 500)
+        with silence_stdout():
+            data_cleaning.save_gaze_trial_asc_file_to_csv(asc_fpath, self.temp_dir, is_interactive=False,
+                                                          saved_samples=True)
+        saved_samples = data_reader.read_gaze_samples_file(
+            os.path.join(self.temp_dir, data_cleaning.get_samples_fname(asc_fpath)))
+        samples = parse_samples(asc_fpath)[1]
+        self.assertEqual(saved_samples.timestamp.dtype, np.int64)
+        self.assertEqual(saved_samples.frame_index.dtype, np.int32)
+        self.assertEqual(saved_samples.timestamp.tolist(), samples.timestamp.tolist())
+        np.testing.assert_array_equal(saved_samples.x, samples.x.astype(np.float32))
+        np.testing.assert_array_equal(saved_samples.y, samples.y.astype(np.float32))
+        np.testing.assert_array_equal(saved_samples.pupil, samples.pupil)
+        self.assertEqual(saved_samples.frame_index.tolist(), samples.frame_index.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# test_rebuild_manifest.py
+#
+# The incremental conversion: an unchanged asc file is skipped, a changed file (or options, or a missing output file)
+# is converted again
+# -----------------------
+import os
+import shutil
+import tempfile
+import unittest
+from common import make_asc_file, silence_stdout
+import data_cleaning
+import rebuild_manifest
+
+
+class IsUpToDateTest(unittest.TestCase):
+    """ rebuild_manifest.is_up_to_date on the entry recorded for a file """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.fpath = os.path.join(self.temp_dir, 'trial.asc')
+        with open(self.fpath, 'w') as f:
+            f.write('MSG\t1000 SCR_RECORDER FRAMEID 1 UTID aBc1\n')
+        with open(os.path.join(self.temp_dir, 'trial.txt'), 'w') as f:
+            f.write('frame_id\n')
+        self.options = {'is_include_title': True, 'saved_as_plain_txt': True, 'saved_as_binary': False}
+        self.entry = rebuild_manifest.make_entry(rebuild_manifest.make_file_record(self.fpath), self.options,
+                                                 ['trial.txt'], 1, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def is_up_to_date(self, options=None):
+        return rebuild_manifest.is_up_to_date(self.entry, self.fpath, options or self.options, self.temp_dir)
+
+    def set_mtime(self, mtime):
+        os.utime(self.fpath, (mtime, mtime))
+
+    def test_unchanged(self):
+        self.assertTrue(self.is_up_to_date())
+        self.assertFalse(rebuild_manifest.is_up_to_date(None, self.fpath, self.options, self.temp_dir))
+
+    def test_changed_size(self):
+        mtime = os.stat(self.fpath).st_mtime
+        with open(self.fpath, 'a') as f:
+            f.write('MSG\t1010 reward 1\n')
+        self.set_mtime(mtime)
+        self.assertFalse(self.is_up_to_date())
+
+    def test_touched(self):
+        # same content with a new mtime: the hash is checked, and the new mtime is recorded
+        self.set_mtime(self.entry['mtime'] + 10)
+        self.assertTrue(self.is_up_to_date())
+        self.assertEqual(self.entry['mtime'], os.stat(self.fpath).st_mtime)
+
+    def test_changed_content(self):
+        # same size, new mtime and new content: the hash differs
+        with open(self.fpath, 'w') as f:
+            f.write('MSG\t1000 SCR_RECORDER FRAMEID 2 UTID aBc1\n')
+        self.set_mtime(self.entry['mtime'] + 10)
+        self.assertEqual(os.path.getsize(self.fpath), self.entry['size'])
+        self.assertFalse(self.is_up_to_date())
+
+    def test_changed_options(self):
+        options = dict(self.options)
+        options['saved_as_binary'] = True
+        self.assertFalse(self.is_up_to_date(options))
+        options = dict(self.options)
+        options['event_method'] = 'ivt'
+        self.assertFalse(self.is_up_to_date(options))
+
+    def test_missing_output(self):
+        os.remove(os.path.join(self.temp_dir, 'trial.txt'))
+        self.assertFalse(self.is_up_to_date())
+
+
+class IncrementalConversionTest(unittest.TestCase):
+    """ data_cleaning.save_asc_files_in_dir_to_csv run again on the same asc directory """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.asc_dir = os.path.join(self.temp_dir, 'asc')
+        self.saved_dir = os.path.join(self.temp_dir, 'csv')
+        os.makedirs(self.asc_dir)
+        self.asc_fpaths = [make_asc_file(self.asc_dir, 300, seed) for seed in (1, 2)]
+        self.csv_fpaths = [os.path.join(self.saved_dir, data_cleaning.get_csv_fname(asc_fpath))
+                           for asc_fpath in self.asc_fpaths]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def convert(self, **options):
+        """ Convert the asc files. Returns whether each csv file was written again: their mtime is set to 0 before
+            the conversion """
+        for csv_fpath in self.csv_fpaths:
+            if os.path.exists(csv_fpath):
+                os.utime(csv_fpath, (0, 0))
+        with silence_stdout():
+            data_cleaning.save_asc_files_in_dir_to_csv(self.asc_dir, self.saved_dir, saved_to_excel=False, **options)
+        return [os.stat(csv_fpath).st_mtime != 0 for csv_fpath in self.csv_fpaths]
+
+    def test_unchanged_files_are_skipped(self):
+        self.assertEqual(self.convert(), [True, True])
+        self.assertEqual(self.convert(), [False, False])
+        # only touched: skipped after checking the hash
+        os.utime(self.asc_fpaths[0], None)
+        self.assertEqual(self.convert(), [False, False])
+
+    def test_changed_file_is_converted(self):
+        self.convert()
+        with open(self.asc_fpaths[1], 'a') as f:
+            f.write('MSG\t99999999 !V TRIAL_VAR block 2\n')
+        self.assertEqual(self.convert(), [False, True])
+
+    def test_changed_options_and_missing_output(self):
+        self.convert()
+        self.assertEqual(self.convert(saved_as_binary=True), [True, True])
+        self.assertEqual(self.convert(saved_as_binary=True), [False, False])
+        os.remove(os.path.join(self.saved_dir, data_cleaning.get_npz_fname(self.asc_fpaths[0])))
+        self.assertEqual(self.convert(saved_as_binary=True), [True, False])
+
+    def test_not_incremental(self):
+        self.convert()
+        self.assertEqual(self.convert(is_incremental=False), [True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
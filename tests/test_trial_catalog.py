@@ -0,0 +1,103 @@
+# test_trial_catalog.py
+#
+# The selection of trials in the trial catalog (select_trials, make_fname_condition)
+# -----------------------
+import shutil
+import tempfile
+import unittest
+from common import read_file
+import trial_catalog
+
+
+TRIALS = [('101_AB_123_Jun-1-1-1-1.asc',
+           {'avg_error': 0.3, 'max_error': 1.0, 'low_sample_rate': '1.5%', 'total_frame': 9000},
+           {'highest_score': 500}),
+          ('102_CD_456_Jun-2-1-1-1.asc',
+           {'avg_error': 0.7, 'max_error': 2.0, 'low_sample_rate': '0.5%', 'total_frame': 12000},
+           {'highest_score': 300}),
+          ('103_AB_456_Jun-3-1-1-1.asc',
+           {'avg_error': 0.4, 'max_error': 0.9, 'low_sample_rate': '3.0%', 'total_frame': 4000}, None)]
+
+
+class TrialCatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.catalog_fpath = trial_catalog.get_catalog_fpath(self.temp_dir)
+        records = [trial_catalog.make_trial_record(fname, file_meta_data, trial_stat,
+                                                   [fname.replace('.asc', '.txt'), fname.replace('.asc', '.npz')])
+                   for fname, file_meta_data, trial_stat in TRIALS]
+        trial_catalog.update_catalog(self.catalog_fpath, records)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def select_ids(self, where=None, params=()):
+        return [trial['trial_id'] for trial in trial_catalog.select_trials(self.catalog_fpath, where, params,
+                                                                           ['trial_id'])]
+
+    def test_records(self):
+        trials = trial_catalog.select_trials(self.catalog_fpath)
+        self.assertEqual([trial['trial_name'] for trial in trials],
+                         ['101_AB_123_Jun-1-1-1-1', '102_CD_456_Jun-2-1-1-1', '103_AB_456_Jun-3-1-1-1'])
+        self.assertEqual((trials[0]['subject'], trials[0]['game'], trials[0]['session']), ('AB', '123', 'Jun-1-1-1-1'))
+        self.assertEqual((trials[0]['csv_fname'], trials[0]['npz_fname']),
+                         ('101_AB_123_Jun-1-1-1-1.txt', '101_AB_123_Jun-1-1-1-1.npz'))
+        self.assertEqual([trial['low_sample_rate'] for trial in trials], [1.5, 0.5, 3.0])
+        self.assertEqual([trial['highest_score'] for trial in trials], [500, 300, None])
+
+    def test_conditions(self):
+        self.assertEqual(self.select_ids([('avg_error', '<', 0.5)]), [101, 103])
+        self.assertEqual(self.select_ids([('avg_error', '<', 0.5), ('total_frame', '>', 5000)]), [101])
+        self.assertEqual(self.select_ids([('subject', '=', 'AB'), ('game', 'like', '45%')]), [103])
+        self.assertEqual(self.select_ids([]), [101, 102, 103])
+
+    def test_bound_values(self):
+        # the values are bound: a value with SQL in it is only compared, never executed
+        self.assertEqual(self.select_ids([('subject', '=', "AB' OR '1'='1")]), [])
+        self.assertEqual(self.select_ids([('subject', '=', "AB'; DROP TABLE trials; --")]), [])
+        self.assertEqual(len(self.select_ids()), 3)
+        self.assertEqual(trial_catalog.make_where_clause([('avg_error', '<', 0.5), ('subject', '=', "A'B")]),
+                         ('"avg_error" < ? AND "subject" = ?', (0.5, "A'B")))
+
+    def test_invalid_conditions(self):
+        with self.assertRaises(ValueError):
+            trial_catalog.make_where_clause([('avg_error', '< 1 OR 1 =', 0.5)])
+        # the column names are quoted and must be columns of the catalog
+        with self.assertRaises(ValueError):
+            self.select_ids([('avg_error < 1 OR total_frame', '>', 0)])
+        with self.assertRaises(ValueError):
+            self.select_ids([('min_error', '<', 0.5)])
+
+    def test_sql_condition(self):
+        self.assertEqual(self.select_ids('avg_error < 0.5 AND total_frame > 5000'), [101])
+        self.assertEqual(self.select_ids('avg_error < ? AND total_frame > ?', (0.5, 5000)), [101])
+        self.assertEqual(self.select_ids('highest_score IS NULL'), [103])
+
+    def test_fname_condition(self):
+        fnames = ['101_AB_123_Jun-1-1-1-1.txt', '101_AB_123_Jun-1-1-1-1.npz', '102_CD_456_Jun-2-1-1-1.txt',
+                  '103_AB_456_Jun-3-1-1-1.txt', '104_EF_123_Jun-4-1-1-1.txt']
+        fname_condition = trial_catalog.make_fname_condition(self.catalog_fpath, [('avg_error', '<', 0.5)])
+        self.assertEqual([fname for fname in fnames if fname_condition(fname)],
+                         ['101_AB_123_Jun-1-1-1-1.txt', '101_AB_123_Jun-1-1-1-1.npz', '103_AB_456_Jun-3-1-1-1.txt'])
+        # with the file name condition of the caller
+        fname_condition = trial_catalog.make_fname_condition(self.catalog_fpath, 'total_frame > ?', (5000,),
+                                                             lambda fname: fname.endswith('.txt'))
+        self.assertEqual([fname for fname in fnames if fname_condition(fname)],
+                         ['101_AB_123_Jun-1-1-1-1.txt', '102_CD_456_Jun-2-1-1-1.txt'])
+
+    def test_update(self):
+        # the columns of a record are updated, the others are kept (or cleared if the trial is replaced)
+        catalog_content = read_file(self.catalog_fpath)
+        trial_catalog.update_catalog(self.catalog_fpath, [{'trial_id': 101, 'avg_error': 0.6}])
+        self.assertNotEqual(read_file(self.catalog_fpath), catalog_content)
+        self.assertEqual(self.select_ids([('avg_error', '<', 0.5)]), [103])
+        self.assertEqual(self.select_ids([('highest_score', '=', 500)]), [101])
+        trial_catalog.update_catalog(self.catalog_fpath, [{'trial_id': 101, 'avg_error': 0.2}], is_replaced=True)
+        trials = trial_catalog.select_trials(self.catalog_fpath, [('trial_id', '=', 101)])
+        self.assertEqual((trials[0]['avg_error'], trials[0]['highest_score'], trials[0]['trial_name']),
+                         (0.2, None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
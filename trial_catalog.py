@@ -0,0 +1,197 @@
+# trial_catalog.py
+#
+# Catalog of the trials of a cleaned dataset (a SQLite file in the dest dir, updated by data_cleaning and data_stat)
+# One row per trial: the fields of the file name, the file names of each format, the meta data and the statistics
+# The trials can be selected with SQL conditions (e.g. avg_error < 0.5 AND total_frame > 5000) without reading files
+# (--where is trusted input: it is pasted into the SQL query as is; use a list of conditions to bind untrusted values)
+# -----------------------
+import os
+import sys
+import sqlite3
+import utils
+
+
+CATALOG_FNAME = 'trial_catalog.sqlite'
+# the columns that every catalog has (the statistics columns are added when they are first recorded)
+BASE_COLUMNS = (('trial_id', 'INTEGER PRIMARY KEY'), ('trial_name', 'TEXT'), ('subject', 'TEXT'), ('game', 'TEXT'),
+                ('session', 'TEXT'), ('asc_path', 'TEXT'), ('csv_fname', 'TEXT'), ('npz_fname', 'TEXT'),
+                ('events_fname', 'TEXT'), ('samples_fname', 'TEXT'), ('index_fname', 'TEXT'), ('avg_error', 'REAL'),
+                ('max_error', 'REAL'), ('low_sample_rate', 'REAL'), ('total_frame', 'INTEGER'))
+# the catalog column of each output file extension
+FNAME_COLUMNS = {'.txt': 'csv_fname', '.csv': 'csv_fname', '.npz': 'npz_fname', '.events': 'events_fname',
+                 '.samples': 'samples_fname', '.index': 'index_fname'}
+# the comparison operators of the conditions (see make_where_clause)
+CONDITION_OPERATORS = ('=', '!=', '<', '<=', '>', '>=', 'LIKE')
+
+
+def get_catalog_fpath(saved_dir):
+    return os.path.join(saved_dir, CATALOG_FNAME)
+
+
+def parse_trial_fname(fname):
+    """ Split a trial file name (trial_id_subject_game_session.ext, e.g. 101_AB_123_Jun-1-1-1-1.asc) into its
+        fields. Returns a dictionary of the catalog columns, None if the name doesn't start with a trial id """
+    trial_name = os.path.basename(fname).split('.')[0]
+    fields = trial_name.split('_', 3)
+    try:
+        trial_id = int(fields[0])
+    except ValueError:
+        return None
+    fields += [None] * (4 - len(fields))
+    return {'trial_id': trial_id, 'trial_name': trial_name, 'subject': fields[1], 'game': fields[2],
+            'session': fields[3]}
+
+
+def make_trial_record(fname, file_meta_data=None, trial_stat=None, output_fnames=(), asc_path=None):
+    """ The catalog columns of a trial (see update_catalog): the fields of its file name, the names of its output
+        files, its meta data (low_sample_rate is saved as a number, in %) and its statistics """
+    record = parse_trial_fname(fname)
+    if record is None:
+        return None
+    if asc_path is not None:
+        record['asc_path'] = asc_path
+    for output_fname in output_fnames:
+        column = FNAME_COLUMNS.get(os.path.splitext(output_fname)[1])
+        if column is not None:
+            record[column] = output_fname
+    if file_meta_data is not None:
+        for name in ('avg_error', 'max_error', 'total_frame'):
+            record[name] = file_meta_data.get(name)
+        low_sample_rate = file_meta_data.get('low_sample_rate')
+        record['low_sample_rate'] = float(low_sample_rate.rstrip('%')) if low_sample_rate is not None else None
+    if trial_stat is not None:
+        record.update(trial_stat)
+    return record
+
+
+def open_catalog(catalog_fpath):
+    """ Open the catalog (created if it doesn't exist) """
+    connection = sqlite3.connect(catalog_fpath)
+    connection.execute('CREATE TABLE IF NOT EXISTS trials (%s)' % ', '.join(
+        ['%s %s' % (name, column_type) for name, column_type in BASE_COLUMNS]))
+    return connection
+
+
+def get_column_names(connection):
+    return [row[1] for row in connection.execute('PRAGMA table_info(trials)')]
+
+
+def quote_name(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def update_catalog(catalog_fpath, records, is_replaced=False):
+    """ Add or update the trials of the records (dictionaries mapping column name to value, with the trial_id).
+        Only the columns in a record are updated, the other columns of the trial keep their values (or are cleared
+        if is_replaced is set, e.g. the statistics of a trial that is converted again).
+        The columns that are not in the catalog yet (statistics) are added. """
+    connection = open_catalog(catalog_fpath)
+    try:
+        with connection:
+            column_names = set(get_column_names(connection))
+            for record in records:
+                for name, value in record.items():
+                    if name not in column_names:
+                        # no declared type: the values are kept as they are (int, float or text)
+                        connection.execute('ALTER TABLE trials ADD COLUMN %s' % quote_name(name))
+                        column_names.add(name)
+                names = [name for name in record if name != 'trial_id']
+                if is_replaced:
+                    connection.execute('DELETE FROM trials WHERE trial_id = ?', (record['trial_id'],))
+                connection.execute('INSERT OR IGNORE INTO trials (trial_id) VALUES (?)', (record['trial_id'],))
+                if len(names) > 0:
+                    connection.execute('UPDATE trials SET %s WHERE trial_id = ?' % ', '.join(
+                        ['%s = ?' % quote_name(name) for name in names]),
+                        [record[name] for name in names] + [record['trial_id']])
+    finally:
+        connection.close()
+
+
+def make_where_clause(conditions):
+    """ Convert a list of (column name, operator, value) conditions, e.g. [('avg_error', '<', 0.5)], to an SQL
+        condition (the conditions joined by AND) and its parameters. The column names are quoted and the values are
+        bound parameters, so the values are never pasted into the SQL. Returns (None, ()) if there is no condition """
+    terms = []
+    params = []
+    for name, operator, value in conditions:
+        if operator.upper() not in CONDITION_OPERATORS:
+            raise ValueError('Unsupported operator %s in the condition on %s' % (operator, name))
+        terms.append('%s %s ?' % (quote_name(name), operator.upper()))
+        params.append(value)
+    if len(terms) == 0:
+        return None, ()
+    return ' AND '.join(terms), tuple(params)
+
+
+def select_trials(catalog_fpath, where=None, params=(), columns=None):
+    """ Return the trials (dictionaries mapping column name to value, in the order of trial id) that meet the
+        condition. All the trials if where is None. columns: the columns to return (all of them if None)
+        where is either a list of conditions, whose values are bound (see make_where_clause), e.g.
+        select_trials(fpath, [('avg_error', '<', 0.5), ('total_frame', '>', 5000)]), or an SQL condition with
+        placeholders for the values in params, e.g. select_trials(fpath, 'avg_error < ? AND total_frame > ?',
+        (0.5, 5000)). An SQL condition is trusted input: it is pasted into the query as is """
+    connection = open_catalog(catalog_fpath)
+    try:
+        if isinstance(where, (list, tuple)):
+            # SQLite reads a quoted name that isn't a column as a string, so the names are checked
+            column_names = get_column_names(connection)
+            for name, _, _ in where:
+                if name not in column_names:
+                    raise ValueError('There is no column %s in the trial catalog' % name)
+            where, params = make_where_clause(where)
+        selected = ', '.join([quote_name(name) for name in columns]) if columns is not None else '*'
+        sql = 'SELECT %s FROM trials' % selected
+        if where is not None:
+            sql += ' WHERE ' + where
+        cursor = connection.execute(sql + ' ORDER BY trial_id', params)
+        names = [description[0] for description in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+    finally:
+        connection.close()
+
+
+def make_fname_condition(catalog_fpath, where, params=(), func_fname_condition=None):
+    """ Return a file name condition (see data_stat.list_stat_files) that keeps the files of the trials that meet the
+        condition (a list of conditions or a trusted SQL condition, see select_trials) and func_fname_condition if
+        it is given """
+    trial_names = set([trial['trial_name'] for trial in select_trials(catalog_fpath, where, params, ['trial_name'])])
+
+    def fname_condition(fname):
+        if os.path.basename(fname).split('.')[0] not in trial_names:
+            return False
+        return func_fname_condition is None or func_fname_condition(fname)
+    return fname_condition
+
+
+def print_trials(trials, columns):
+    print(','.join(columns))
+    for trial in trials:
+        print(','.join(['' if trial[name] is None else str(trial[name]) for name in columns]))
+    print('%d trials' % len(trials))
+
+
+if __name__ == '__main__':
+    # trusted input: the condition is pasted into the SQL query
+    where = utils.pop_option(sys.argv, '--where', None, str, 'an SQL condition')
+    columns = utils.pop_option(sys.argv, '--columns', None, str, 'a list of column names, e.g. trial_id,avg_error')
+    if len(sys.argv) < 2:
+        print('Usage: python trial_catalog.py dest_dir [--where "avg_error < 0.5 AND total_frame > 5000"] '
+              '[--columns trial_id,trial_name,avg_error]')
+        exit(1)
+
+    catalog_fpath = get_catalog_fpath(sys.argv[1])
+    if not os.path.exists(catalog_fpath):
+        print('There is no trial catalog in %s (it is created by data_cleaning.py)' % sys.argv[1])
+        exit(1)
+    if columns is not None:
+        columns = columns.split(',')
+    else:
+        connection = open_catalog(catalog_fpath)
+        columns = get_column_names(connection)
+        connection.close()
+    try:
+        trials = select_trials(catalog_fpath, where, columns=columns)
+    except sqlite3.Error as e:
+        print('Error: %s' % e)
+        exit(1)
+    print_trials(trials, columns)
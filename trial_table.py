@@ -0,0 +1,124 @@
+# trial_table.py
+#
+# The per-trial statistics or meta data (trial_id -> {name: value}) as a column table
+# Saved to Excel (rows written in bulk, in the constant memory mode of xlsxwriter) or to a flat CSV file,
+# and read back column by column
+# -----------------------
+import csv
+
+
+ID_COL_NAME = 'trial_id'
+
+
+class TrialTable:
+    """ The values of the trials, one column per name
+
+        trial_ids: the trial ids (sorted)
+        col_names: the names of the columns (without trial_id), in the order of their first appearance in the trials
+        columns: a dictionary mapping column name to the list of the values of the trials (None if a trial has no
+            value for the column) """
+
+    def __init__(self, trial_ids, col_names, columns):
+        self.trial_ids = trial_ids
+        self.col_names = col_names
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.trial_ids)
+
+    def iter_rows(self):
+        """ Yield the row of each trial: [trial_id, values in the order of col_names] """
+        col_values = [self.columns[name] for name in self.col_names]
+        for i, trial_id in enumerate(self.trial_ids):
+            yield [trial_id] + [values[i] for values in col_values]
+
+    def to_dict(self):
+        """ The trial_id -> {name: value} dictionary (the None values are not kept) """
+        data_dict = dict((trial_id, {}) for trial_id in self.trial_ids)
+        for name in self.col_names:
+            for trial_id, value in zip(self.trial_ids, self.columns[name]):
+                if value is not None:
+                    data_dict[trial_id][name] = value
+        return data_dict
+
+
+def make_trial_table(data_dict):
+    """ Convert a trial_id -> {name: value} dictionary to a TrialTable. The trials don't need to have the same names:
+        the table has the columns of all of them """
+    trial_ids = sorted(data_dict.keys())
+    col_names = []
+    known_names = set()
+    for trial_id in trial_ids:
+        for name in data_dict[trial_id]:
+            if name not in known_names:
+                known_names.add(name)
+                col_names.append(name)
+    columns = dict((name, [data_dict[trial_id].get(name) for trial_id in trial_ids]) for name in col_names)
+    return TrialTable(trial_ids, col_names, columns)
+
+
+def save_table_to_excel(table, fpath, sheet_name=None):
+    """ Save the table to an Excel file: a title row (trial_id and the column names) and one row per trial.
+        The rows are written in order, so the workbook is written in the constant memory mode (each row is flushed
+        to the disk when the next one starts). None values are left empty. """
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(fpath, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, [ID_COL_NAME] + table.col_names)
+    for row, values in enumerate(table.iter_rows()):
+        worksheet.write_row(row + 1, 0, values)
+    workbook.close()
+
+
+def save_table_to_csv(table, fpath):
+    """ Save the table to a CSV file (same rows as save_table_to_excel, None values are left empty) """
+    with open(fpath, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow([ID_COL_NAME] + table.col_names)
+        writer.writerows([['' if value is None else value for value in values] for values in table.iter_rows()])
+
+
+def convert_column(values):
+    """ Convert a column read from a file ('' or None for the empty cells) to the type of all its values:
+        int if they are all integers (the numbers of an Excel file are floats), else float if they are all numbers,
+        else the values as they are read (strings). The empty cells are None """
+    is_empty = [value is None or value == '' for value in values]
+    filled_values = [value for value, empty in zip(values, is_empty) if not empty]
+    try:
+        converted = [float(value) for value in filled_values]
+        if all([value.is_integer() for value in converted]):
+            converted = [int(value) for value in converted]
+    except ValueError:
+        converted = filled_values
+    converted = iter(converted)
+    return [None if empty else next(converted) for empty in is_empty]
+
+
+def make_table_of_columns(titles, raw_columns):
+    """ Build a TrialTable from the titles and the raw columns (the first one is the trial ids) """
+    columns = [convert_column(values) for values in raw_columns]
+    col_names = [str(title) for title in titles[1:]]
+    return TrialTable(columns[0], col_names, dict(zip(col_names, columns[1:])))
+
+
+def read_table_excel(fpath, sheet_name=None):
+    """ Read a table saved by save_table_to_excel (the first sheet if sheet_name is None), column by column """
+    import xlrd
+    book = xlrd.open_workbook(fpath, on_demand=True)
+    sheet = book.sheet_by_name(sheet_name) if sheet_name is not None else book.sheet_by_index(0)
+    if sheet.nrows == 0:
+        return TrialTable([], [], {})
+    titles = sheet.row_values(0)
+    raw_columns = [sheet.col_values(col_index, start_rowx=1) for col_index in range(len(titles))]
+    return make_table_of_columns(titles, raw_columns)
+
+
+def read_table_csv(fpath):
+    """ Read a table saved by save_table_to_csv, column by column """
+    with open(fpath, 'r') as f:
+        rows = list(csv.reader(f))
+    if len(rows) == 0:
+        return TrialTable([], [], {})
+    titles = rows[0]
+    raw_columns = list(zip(*rows[1:])) if len(rows) > 1 else [() for _ in titles]
+    return make_table_of_columns(titles, raw_columns)
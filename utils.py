@@ -1,7 +1,8 @@
 # utils.py
 # -----------------------
 import os
-import xlsxwriter
+import multiprocessing
+import trial_table
 
 
 def increment_by_int(old_value, increment_value):
@@ -18,31 +19,60 @@ def set_value_by_int(old_value, new_value):
         return new_value
 
 
-def save_trials_data_to_excel(saved_dir, fname, data_dict):
+def save_trials_data_to_excel(saved_dir, fname, data_dict, saved_as_csv=False):
+    """ Save the trial_id -> {name: value} dictionary to an Excel file, one row per trial (in the order of trial id)
+        and one column per name (see trial_table.save_table_to_excel).
+        If saved_as_csv is set, the same table is also saved to a CSV file (fname with the .csv extension) """
     if not os.path.exists(saved_dir):
         os.makedirs(saved_dir)
-    fpath = os.path.join(saved_dir, fname)
-    workbook = xlsxwriter.Workbook(fpath)
-    worksheet = workbook.add_worksheet()
-
-    row = 0
-    col = 0
-    for trial_id in data_dict.keys():
-        # write column names (titles) first
-        if row == 0:
-            worksheet.write(0, 0, 'trial_id')
-            col += 1
-            for col_name in data_dict[trial_id].keys():
-                worksheet.write(row, col, col_name)
-                col += 1
-        # write the data
-        row += 1
-        col = 0
-        worksheet.write(row, col, trial_id)
-
-        trial_stat = data_dict[trial_id]
-        for col_name, value in trial_stat.items():
-            worksheet.write(row, col+1, value)
-            col += 1
-    # close the file and save the data
-    workbook.close()
+    table = trial_table.make_trial_table(data_dict)
+    trial_table.save_table_to_excel(table, os.path.join(saved_dir, fname))
+    if saved_as_csv:
+        trial_table.save_table_to_csv(table, os.path.join(saved_dir, os.path.splitext(fname)[0] + '.csv'))
+
+
+def pop_int_option(argv, option_name, default_value):
+    """ Remove the option (e.g. --workers 4) from the argument list and return its value """
+    return pop_option(argv, option_name, default_value, int, 'an integer')
+
+
+def pop_float_option(argv, option_name, default_value):
+    """ Remove the option (e.g. --speed 0.5) from the argument list and return its value """
+    return pop_option(argv, option_name, default_value, float, 'a number')
+
+
+def pop_option(argv, option_name, default_value, value_type, type_desc):
+    if option_name not in argv:
+        return default_value
+    index = argv.index(option_name)
+    if index + 1 >= len(argv):
+        print('Please provide a value for the option %s' % option_name)
+        exit(1)
+    try:
+        value = value_type(argv[index + 1])
+    except ValueError:
+        print('For the option %s, please use %s' % (option_name, type_desc))
+        exit(1)
+    del argv[index:index + 2]
+    return value
+
+
+def pop_flag(argv, flag_name):
+    """ Remove the flag (e.g. --rebuild) from the argument list and return whether it was set """
+    if flag_name not in argv:
+        return False
+    argv.remove(flag_name)
+    return True
+
+
+def map_in_processes(func, tasks, n_workers=1):
+    """ Return [func(task) for task in tasks], computed in a process pool if n_workers > 1
+        (the results are in the order of the tasks) """
+    if n_workers <= 1 or len(tasks) <= 1:
+        return [func(task) for task in tasks]
+    pool = multiprocessing.Pool(min(n_workers, len(tasks)))
+    try:
+        return pool.map(func, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()